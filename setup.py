@@ -16,8 +16,10 @@ setup(
     long_description=open('README.md').read(),
     install_requires=[
         'beautifulsoup4',
+        'cssselect',
         'lxml',
         'mypy',
+        'numpy',
         'parameterized',
         'progressbar2',
     ],
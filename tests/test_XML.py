@@ -4,7 +4,10 @@
 # pylint: disable=missing-docstring,invalid-name
 """Test xml cleaning code."""
 
+import io
 import unittest
+from unittest import mock
+from parameterized import parameterized
 
 from text_cleanup import XML
 
@@ -55,6 +58,157 @@ class TestXMLHandling(unittest.TestCase):
         result = XML.clean_element(xml, selector='.bal1s')
         self.assertEqual(result, expected)
 
+    def test_repeated_text(self):
+        xml      = '<div><p>bal1s</p><p>bal1s</p><div><p>bal1s</p></div></div>'  # pylint: disable=bad-whitespace
+        expected = '<div><p>balls</p><p>balls</p><div><p>balls</p></div></div>'
+        self.assertEqual(XML.clean_element(xml, 'div'), expected)
+
+    def test_multiprocessing(self):
+        xml = self.small_xml.replace('produced', 'pridoced')
+        expected = self.small_xml
+        result = XML.clean_element(xml, num_processes=2)
+        self.assertEqual(result, expected)
+
+
+class TestBatches(unittest.TestCase):
+
+    def test_make_batches(self):
+        texts = ['a' * n for n in (9, 1, 5, 4, 3, 2, 2)]
+        batches = XML.make_batches(texts, 3)
+        self.assertEqual(sorted(map(len, map(''.join, batches))), [8, 9, 9])
+        self.assertEqual(sorted(sum(batches, [])), sorted(texts))
+
+    def test_more_batches_than_texts(self):
+        self.assertEqual(XML.make_batches(['a', 'b'], 4), [['a'], ['b']])
+
+
+class TestStream(unittest.TestCase):
+    """Clean XML incrementally while it streams past."""
+
+    def clean(self, xml, selector=':root', chunk_size=2**16):
+        output = io.StringIO()
+        XML.clean_stream(io.StringIO(xml), output, selector,
+                         chunk_size=chunk_size)
+        return output.getvalue()
+
+    def test_simple_cleanup(self):
+        xml      = "<div>brlls<br/>tixt</div>"  # pylint: disable=bad-whitespace
+        expected = "<div>balls<br/>text</div>\n"
+        self.assertEqual(self.clean(xml), expected)
+
+    def test_dont_touch_attribute_values(self):
+        xml      = '<div class="bal1s">bal1s.</div>'  # pylint: disable=bad-whitespace
+        expected = '<div class="bal1s">balls.</div>\n'
+        self.assertEqual(self.clean(xml), expected)
+
+    @parameterized.expand([
+        ('.bal1s', '<a><b class="bal1s">balls</b><b>bal1s</b></a>'),
+        ('a > b', '<a><b class="bal1s">balls</b><b>balls</b></a>'),
+        ('a b:first-child', '<a><b class="bal1s">balls</b><b>bal1s</b></a>'),
+        ('b + b', '<a><b class="bal1s">bal1s</b><b>balls</b></a>'),
+        ('.bal1s ~ b', '<a><b class="bal1s">bal1s</b><b>balls</b></a>'),
+    ])
+    def test_only_fix_selected(self, selector, expected):
+        xml = '<a><b class="bal1s">bal1s</b><b>bal1s</b></a>'
+        self.assertEqual(self.clean(xml, selector), expected + '\n')
+
+    def test_preserve_markup(self):
+        xml = ('<?xml version="1.0"?>\n<!DOCTYPE html>\n'
+               '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en">'
+               '<!-- bal1s --><p  id="bal1s"\n>1 &lt; 2 &amp; bal1s</p>'
+               '<?pi bal1s?></html>')
+        expected = xml.replace('  id="bal1s"\n', ' id="bal1s"').replace(
+            '&amp; bal1s', '&amp; balls') + '\n'
+        self.assertEqual(self.clean(xml, chunk_size=7), expected)
+
+    def test_frees_written_elements(self):
+        retained = []
+        end = XML._StreamWriter.end  # pylint: disable=protected-access
+
+        def check(writer, element):
+            end(writer, element)
+            if element.getparent() is not None:
+                retained.append(len(element.getparent()))
+                self.assertIsNone(element.getprevious())
+
+        xml = '<body>{}</body>'.format('<p>tixt</p><!-- c -->tixt' * 1000)
+        with mock.patch.object(XML._StreamWriter, 'end', check):
+            result = self.clean(xml, chunk_size=100)
+        self.assertEqual(result, xml.replace('tixt', 'text') + '\n')
+        # Only the element, and what the parser has read past it
+        self.assertLess(max(retained), 20)
+
+    def test_cdata(self):
+        xml = '<p><![CDATA[brlls & tixt]]> tixt &amp; brlls</p>'
+        expected = '<p><![CDATA[balls & text]]> text &amp; balls</p>'
+        self.assertEqual(XML.clean_element(xml, patch=True), expected)
+
+    def test_node_without_span(self):
+        xml = '<p>tixt</p>'
+        soup, spans = XML.parse_element(xml, patch=True)
+        nodes = XML.select_strings(soup)
+        self.assertEqual(XML.write_element(xml, soup, nodes, {'tixt': 'text'},
+                                           {}), '<p>text</p>')
+
+    def test_same_as_clean_element(self):
+        xml = open('tests/sample.xml').read().replace('produced', 'pridoced')
+        expected = XML.clean_element(xml, 'p')
+        result = XML.reformat(self.clean(xml, 'p', chunk_size=100))
+        self.assertEqual(result, expected)
+
+
+class TestPatch(unittest.TestCase):
+    """Patch corrections into the original markup."""
+
+    def test_simple_cleanup(self):
+        xml      = "<DIV class='bal1s'>brlls<br>tixt</DIV>"  # pylint: disable=bad-whitespace
+        expected = "<DIV class='bal1s'>balls<br>text</DIV>"
+        self.assertEqual(XML.clean_element(xml, patch=True), expected)
+
+    def test_preserve_markup(self):
+        xml = ('<?xml version="1.0"?>\n<!DOCTYPE html>\n'
+               '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en">'
+               '<!-- bal1s --><p  id="bal1s"\n>1 &lt; 2 &amp; bal1s</p>'
+               '<?pi bal1s?>\n  <p>caf&eacute; tixt</p></html>')
+        expected = xml.replace('&amp; bal1s', '&amp; balls').replace(
+            'tixt', 'text')
+        self.assertEqual(XML.clean_element(xml, patch=True), expected)
+
+    def test_only_fix_selected(self):
+        xml      = '<div class="bal1s">Bal1s.</div><div>Bal1s</div>'  # pylint: disable=bad-whitespace
+        expected = '<div class="bal1s">Balls.</div><div>Bal1s</div>'
+        result = XML.clean_element(xml, selector='.bal1s', patch=True)
+        self.assertEqual(result, expected)
+
+    def test_cdata(self):
+        xml = '<p><![CDATA[brlls & tixt]]> tixt &amp; brlls</p>'
+        expected = '<p><![CDATA[balls & text]]> text &amp; balls</p>'
+        self.assertEqual(XML.clean_element(xml, patch=True), expected)
+
+    def test_node_without_span(self):
+        xml = '<p>tixt</p>'
+        soup, spans = XML.parse_element(xml, patch=True)
+        nodes = XML.select_strings(soup)
+        self.assertEqual(XML.write_element(xml, soup, nodes, {'tixt': 'text'},
+                                           {}), '<p>text</p>')
+
+    def test_same_as_clean_element(self):
+        xml = open('tests/sample.xml').read().replace('produced', 'pridoced')
+        expected = XML.clean_element(xml, 'p')
+        result = XML.reformat(XML.clean_element(xml, 'p', patch=True))
+        self.assertEqual(result, expected)
+
+    @parameterized.expand([
+        ('tixt', 'tixt', 'text', [(1, 2, 'e')]),
+        ('a&amp;&amp;b', 'a&&b', 'a&b', [(6, 11, '')]),
+        ('x&eacute;y', 'x\xe9y', 'xey', [(1, 9, 'e')]),
+        ('a b', 'a b', 'a<b', [(1, 2, '&lt;')]),
+        # Not what html.parser would make of it, so replace the lot
+        ('&bogus;', '&bogus', 'x', [(0, 7, 'x')]),
+    ])
+    def test_patch_text(self, source, old, new, expected):
+        self.assertEqual(XML.patch_text(source, old, new), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for cleaning directory trees."""
+
+import os
+import tempfile
+import unittest
+
+from parameterized import parameterized
+
+from text_cleanup import batch, main
+
+
+class TestCleanTree(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmpdir.name, 'source')
+        self.destination = os.path.join(self.tmpdir.name, 'destination')
+        self.write('a.txt', "Some tixt.")
+        self.write('nested/b.html', "<p>More tixt.</p>")
+        self.write('nested/cover.png', "not text")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.destination, name),
+                  encoding='utf-8') as fin:
+            return fin.read()
+
+    @parameterized.expand([(1,), (2,)])
+    def test_mirror(self, num_processes):
+        result = batch.clean_tree(self.source, self.destination,
+                                  num_processes=num_processes)
+        self.assertEqual(result, dict(cleaned=2, skipped=0))
+        self.assertEqual(self.read('a.txt'), "Some text.")
+        self.assertEqual(self.read('nested/b.html'), "<p>More text.</p>")
+        self.assertFalse(os.path.exists(
+            os.path.join(self.destination, 'nested/cover.png')))
+
+    def test_skip_unchanged(self):
+        batch.clean_tree(self.source, self.destination)
+        self.write('a.txt', "Other tixt.")
+        result = batch.clean_tree(self.source, self.destination)
+        self.assertEqual(result, dict(cleaned=1, skipped=1))
+        self.assertEqual(self.read('a.txt'), "Other text.")
+
+    def test_options_change(self):
+        batch.clean_tree(self.source, self.destination)
+        result = batch.clean_tree(self.source, self.destination,
+                                  substitution=False)
+        self.assertEqual(result, dict(cleaned=2, skipped=0))
+        result = batch.clean_tree(self.source, self.destination,
+                                  substitution=False)
+        self.assertEqual(result, dict(cleaned=0, skipped=2))
+        result = batch.clean_tree(self.source, self.destination,
+                                  substitution=False, stream=True)
+        self.assertEqual(result, dict(cleaned=2, skipped=0))
+
+    def test_missing_output(self):
+        batch.clean_tree(self.source, self.destination)
+        os.remove(os.path.join(self.destination, 'a.txt'))
+        result = batch.clean_tree(self.source, self.destination)
+        self.assertEqual(result, dict(cleaned=1, skipped=1))
+
+    def test_force(self):
+        batch.clean_tree(self.source, self.destination)
+        result = batch.clean_tree(self.source, self.destination, force=True)
+        self.assertEqual(result, dict(cleaned=2, skipped=0))
+
+    def test_destination_inside_source(self):
+        self.destination = os.path.join(self.source, 'cleaned')
+        batch.clean_tree(self.source, self.destination)
+        result = batch.clean_tree(self.source, self.destination)
+        self.assertEqual(result, dict(cleaned=0, skipped=2))
+
+    def test_main(self):
+        main.main(['batch', self.source, self.destination])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.destination, 'nested/b.html')))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.destination, batch.MANIFEST)))
+
+
+class TestFileKind(unittest.TestCase):
+
+    @parameterized.expand([
+        ('book.epub', 'epub'),
+        ('chapter.XHTML', 'xml'),
+        ('notes.txt', 'raw'),
+        ('cover.png', None),
+    ])
+    def test_file_kind(self, path, expected):
+        self.assertEqual(batch.file_kind(path), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for the benchmark harness."""
+
+import json
+import random
+import unittest
+
+from text_cleanup import benchmark
+
+WORDS = ['balls', 'text', 'missing', 'spaces', 'corrections', 'hello']
+
+
+class TestNoise(unittest.TestCase):
+
+    def test_reproducible(self):
+        first = benchmark.make_corpus(50, WORDS, 0.5, random.Random(1))
+        second = benchmark.make_corpus(50, WORDS, 0.5, random.Random(1))
+        self.assertEqual(first, second)
+
+    def test_no_noise(self):
+        words = WORDS * 3
+        self.assertEqual(benchmark.add_noise(words, 0, random.Random()),
+                         words)
+
+    def test_confusion(self):
+        result = benchmark.corrupt('balls', 'confusion', random.Random(0))
+        self.assertEqual(len(result), 5)
+        self.assertNotEqual(result, 'balls')
+
+    def test_weights(self):
+        corpus = benchmark.make_corpus(50, ['balls'], 1, random.Random(1),
+                                       {'deletion': 1})
+        self.assertEqual({len(word) for word in corpus.split()}, {4})
+
+    def test_missing_space(self):
+        result = benchmark.add_noise(['a', 'b', 'c'], 1, random.Random(0),
+                                     {'space': 1})
+        self.assertEqual(result, ['ab', 'c'])
+
+
+class TestRun(unittest.TestCase):
+
+    def test_report(self):
+        report = benchmark.run([20], [1, 2], source=WORDS,
+                               weights={'space': 1})
+        json.dumps(report)
+        self.assertEqual(report['noise_weights'], {'space': 1})
+        result = report['results'][0]
+        self.assertEqual(result['size'], 20)
+        self.assertEqual([r['num_processes'] for r in result['raw']], [1, 2])
+        self.assertGreater(result['raw'][0]['tokens'], 0)
+        self.assertIn('p99', result['raw'][0]['latency_seconds'])
+        self.assertIsNone(result['raw'][1]['latency_seconds'])
+        self.assertEqual(result['raw'][1]['tokens'],
+                         result['raw'][0]['tokens'])
+        self.assertIsNotNone(result['xml'][1]['candidates_per_token'])
+
+    def test_isolated(self):
+        # Each benchmark runs in a process of its own
+        first = benchmark.isolated(benchmark.bench_raw, 'Some tixt', '')
+        second = benchmark.isolated(benchmark.bench_raw, 'Some tixt', '')
+        self.assertEqual(first['tokens'], 2)
+        self.assertGreater(first['peak_memory_mb']['self'], 0)
+        self.assertEqual(first['candidates_per_token'],
+                         second['candidates_per_token'])
+        with self.assertRaises(TypeError):
+            benchmark.isolated(benchmark.bench_raw, 'Some tixt', '',
+                               bogus=True)
+
+    def test_parse_weights(self):
+        self.assertEqual(benchmark.parse_weights('confusion=4, space=1'),
+                         {'confusion': 4, 'space': 1})
+        for text in ('typo=1', 'space=x', 'space=0'):
+            with self.assertRaises(ValueError):
+                benchmark.parse_weights(text)
+
+    def test_percentiles(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(benchmark.percentiles(values),
+                         {'p50': 51.0, 'p90': 91.0, 'p99': 100.0,
+                          'p100': 100.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
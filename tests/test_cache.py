@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for caching corrections."""
+
+import contextlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import unittest
+
+from text_cleanup import cache, main, raw, XML
+
+
+class TestCorrectionCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        lru = cache.CorrectionCache(maxsize=2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('a')
+        lru.put('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.info(),
+                         dict(hits=2, misses=1, size=2, maxsize=2))
+
+    def test_reuse_corrections(self):
+        lru = cache.CorrectionCache()
+        samples = ["This tixt has one xzqjv.", "One tixt and one xzqjv."]
+        expected = raw.cleanup_batch(samples)
+        result = raw.cleanup_batch(samples, cache=lru)
+        self.assertEqual(result, expected)
+        info = lru.info()
+        self.assertEqual((info['hits'], info['misses']), (2, 2))
+
+    def test_options_are_part_of_key(self):
+        lru = cache.CorrectionCache()
+        self.assertEqual(raw.correct_misspelling('tixt', cache=lru),
+                         (True, 'text'))
+        self.assertEqual(
+            raw.correct_misspelling('tixt', cache=lru, substitution=False),
+            (True, 'tit'))
+        self.assertEqual(lru.info()['misses'], 2)
+
+    def test_out_of_time(self):
+        lru = cache.CorrectionCache()
+        garbage = 'xzqjvwkxzqjvwk'
+        self.assertEqual(
+            raw.correct_misspelling(garbage, cache=lru, max_seconds=0),
+            (False, garbage))
+        self.assertEqual(lru.info()['size'], 0)
+        raw.correct_misspelling(garbage, cache=lru, max_candidates=10)
+        self.assertEqual(lru.info()['size'], 1)
+
+    def test_shared_between_workers(self):
+        xml = '<div><p>bal1s one</p><p>bal1s two</p></div>'
+        expected = '<div><p>balls one</p><p>balls two</p></div>'
+        with cache.CacheManager() as manager:
+            shared = manager.CorrectionCache(100)
+            result = XML.clean_element(xml, num_processes=2, cache=shared)
+            info = shared.info()
+        self.assertEqual(result, expected)
+        self.assertEqual(info['hits'] + info['misses'], 2)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'cache', 'fixes.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_persistent(self):
+        disk = cache.DiskCache(self.filename)
+        self.assertEqual(raw.correct_misspelling('tixt', cache=disk),
+                         (True, 'text'))
+        disk.close()
+        disk = cache.DiskCache(self.filename)
+        self.assertEqual(disk.get(('tixt', 2, True, 'search', True, ())),
+                         (True, 'text'))
+        self.assertEqual(raw.correct_misspelling('tixt', cache=disk),
+                         (True, 'text'))
+        self.assertEqual(disk.info(),
+                         dict(hits=2, misses=0, size=1, maxsize=2**20))
+        disk.close()
+
+    def test_namespace(self):
+        disk = cache.DiskCache(self.filename, namespace='a:')
+        disk.put('key', 1)
+        disk.close()
+        disk = cache.DiskCache(self.filename, namespace='b:')
+        self.assertIsNone(disk.get('key'))
+        disk.close()
+
+    def test_eviction(self):
+        disk = cache.DiskCache(self.filename, maxsize=2)
+        disk.EVICT_EVERY = 1
+        disk.put('a', 1)
+        disk.put('b', 2)
+        disk.get('a')
+        disk.put('c', 3)
+        self.assertIsNone(disk.get('b'))
+        self.assertEqual(disk.get('a'), 1)
+        self.assertEqual(disk.info()['size'], 2)
+        disk.close()
+
+    def test_used_written_later(self):
+        disk = cache.DiskCache(self.filename)
+        disk.put('a', (True, 'a'))
+        changes = disk._db.total_changes
+        self.assertEqual(disk.get('a'), (True, 'a'))
+        self.assertEqual(disk._db.total_changes, changes)
+        disk.put('b', (True, 'b'))
+        # The new row, and when 'a' was used
+        self.assertEqual(disk._db.total_changes, changes + 2)
+        disk.close()
+
+    def test_json(self):
+        disk = cache.DiskCache(self.filename)
+        disk.put('a', (True, 'text'))
+        disk.close()
+        with contextlib.closing(sqlite3.connect(self.filename)) as db:
+            (value,), = db.execute('SELECT value FROM corrections')
+            self.assertEqual(json.loads(value), [True, 'text'])
+            # Left by an earlier version
+            db.execute('UPDATE corrections SET value = ?',
+                       (pickle.dumps((True, 'text')),))
+            db.commit()
+        disk = cache.DiskCache(self.filename)
+        self.assertIsNone(disk.get('a'))
+        disk.put('a', (True, 'text'))
+        self.assertEqual(disk.get('a'), (True, 'text'))
+        disk.close()
+
+    def test_clear(self):
+        disk = cache.DiskCache(self.filename)
+        disk.put('a', 1)
+        disk.clear()
+        self.assertIsNone(disk.get('a'))
+        disk.close()
+
+    def test_shared_between_workers(self):
+        xml = '<div><p>bal1s one</p><p>bal1s two</p></div>'
+        with cache.CacheManager() as manager:
+            shared = manager.DiskCache(self.filename)
+            result = XML.clean_element(xml, num_processes=2, cache=shared)
+            shared.close()
+        self.assertEqual(result, '<div><p>balls one</p><p>balls two</p></div>')
+        disk = cache.DiskCache(self.filename)
+        self.assertEqual(disk.info()['size'], 1)
+        disk.close()
+
+    def test_main(self):
+        source = os.path.join(self.tmpdir.name, 'source.txt')
+        output = os.path.join(self.tmpdir.name, 'output.txt')
+        with open(source, 'w') as fout:
+            fout.write('Some tixt.')
+        for _ in range(2):
+            main.main([source, '--output', output, '--cache', self.filename])
+        disk = cache.DiskCache(self.filename)
+        self.assertEqual(disk.info()['size'], 1)
+        disk.close()
+        main.main([source, '--output', output, '--cache', self.filename,
+                   '--clear-cache', '-n', '2'])
+        disk = cache.DiskCache(self.filename)
+        self.assertEqual(disk.info()['size'], 1)
+        disk.close()
+
+    def test_main_opt_in(self):
+        source = os.path.join(self.tmpdir.name, 'source.txt')
+        output = os.path.join(self.tmpdir.name, 'output.txt')
+        report = os.path.join(self.tmpdir.name, 'stats.json')
+        with open(source, 'w') as fout:
+            fout.write('Some tixt and more tixt.')
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            main.main([source, '--output', output, '--stats', report])
+        with open(report) as fin:
+            self.assertNotIn('cache', json.load(fin))
+        main.main([source, '--output', output, '--stats', report,
+                   '--cache_size', '100'])
+        with open(report) as fin:
+            self.assertEqual(json.load(fin)['cache']['size'], 1)
+        # The counts only go in the report
+        with contextlib.redirect_stderr(stderr):
+            main.main([source, '--output', output, '--cache_size', '100'])
+        self.assertEqual(stderr.getvalue(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
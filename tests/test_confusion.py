@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for the learned confusion model."""
+
+import os
+import pickle
+import tempfile
+import unittest
+
+from parameterized import parameterized
+
+from text_cleanup import confusion, main, raw
+
+PAIRS = [
+    ('tbe cat', 'the cat'),
+    ('tbe hat', 'the hat'),
+    ('thecat', 'the cat'),
+    ('the  cat', 'the cat'),
+    ('te cat', 'the cat'),
+    ('tbe dog', 'the dog'),
+]
+
+
+class TestAlign(unittest.TestCase):
+
+    @parameterized.expand([
+        ('cat', 'cat', []),
+        ('cot', 'cat', [('substitution', 'o', 'a')]),
+        ('ct', 'cat', [('insertion', '', 'a')]),
+        ('caat', 'cat', [('deletion', 'a', '')]),
+        ('', 'a', [('insertion', '', 'a')]),
+    ])
+    def test_align(self, ocr, truth, expected):
+        edits = confusion.align(ocr, truth)
+        self.assertEqual(
+            [edit for edit in edits if edit[0] != confusion.MATCH], expected)
+        self.assertEqual(''.join(edit[2] for edit in edits), truth)
+
+
+class TestModel(unittest.TestCase):
+
+    def setUp(self):
+        self.model = confusion.ConfusionModel(min_count=1)
+        self.model.train(PAIRS)
+
+    def test_counts(self):
+        counts = self.model.as_dict()
+        self.assertEqual(counts['substitution'], {'b': {'h': 3}})
+        self.assertEqual(counts['insertion'], {' ': 1, 'h': 1})
+        self.assertEqual(counts['deletion'], {' ': 1})
+
+    def test_likely(self):
+        likely = self.model.likely('tbe')
+        self.assertEqual(likely[0], 'the')
+        self.assertNotIn('the', self.model.likely('tbe', substitution=False))
+        self.assertIn('t be', likely)
+        self.assertNotIn('t be', self.model.likely('tbe', space=False))
+
+    def test_min_count(self):
+        model = confusion.ConfusionModel(self.model.as_dict(), min_count=2)
+        self.assertEqual(model.likely('tbe'), ['the'])
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'model.json')
+            self.model.save(filename)
+            loaded = confusion.ConfusionModel.load(filename, min_count=1)
+        self.assertEqual(loaded, self.model)
+        self.assertEqual(hash(loaded), hash(self.model))
+        self.assertEqual(repr(loaded), repr(self.model))
+        self.assertEqual(pickle.loads(pickle.dumps(loaded)), loaded)
+
+    def test_correction_order(self):
+        # Without a model 'tbe' is corrected by the first valid candidate
+        model = confusion.ConfusionModel(min_count=1)
+        model.train([('tbe', 'toe')] * 3)
+        self.assertEqual(
+            raw.correct_misspelling('tbe', confusion=model, segment=False),
+            (True, 'toe'))
+        self.assertEqual(
+            raw.correct_misspelling('tbe', confusion=model, engine='index'),
+            raw.correct_misspelling('tbe', engine='index'))
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pairs = os.path.join(tmpdir, 'pairs.tsv')
+            output = os.path.join(tmpdir, 'model.json')
+            with open(pairs, 'w') as fout:
+                fout.write(''.join(f'{ocr}\t{truth}\n'
+                                   for ocr, truth in PAIRS))
+            main.main(['train-confusion', pairs, '--output', output])
+            main.main(['train-confusion', pairs, '--output', output,
+                       '--update'])
+            model = confusion.ConfusionModel.load(output)
+        self.assertEqual(model.as_dict()['substitution'], {'b': {'h': 6}})
+
+
+if __name__ == '__main__':
+    unittest.main()
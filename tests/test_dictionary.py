@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for loading compiled dictionaries."""
+
+import os
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+from text_cleanup import dictionary
+
+
+class TestCompiledWords(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmpdir.name, 'words')
+        with open(self.source, 'w') as fout:
+            fout.write('\n'.join(['a', 'b', 'I', 'apple', 'Apple', 'iPod',
+                                  "apple's", 'Zurich', 'zebra']))
+        self.compiled = dictionary.compile_words(
+            self.source, os.path.join(self.tmpdir.name, 'words.dict'))
+        self.words = dictionary.CompiledWords.open(self.compiled)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_same_as_text(self):
+        expected = dictionary.get_valid_words(self.source)
+        self.assertEqual(set(self.words), expected)
+        self.assertEqual(len(self.words), len(expected))
+
+    def test_contains(self):
+        for word in ['a', 'A', 'B', 'I', 'Apple', 'Ipod', "Apple's", 'Zebra']:
+            self.assertIn(word, self.words)
+        for word in ['b', 'i', 'zurich', 'ZEBRA', 'IPod', 'pear', '']:
+            self.assertNotIn(word, self.words)
+
+    def test_known_batch(self):
+        candidates = ['Apple', 'apple', 'APPLE', 'Zebra', 'zurich', 'Ipod',
+                      'iPod', 'b', 'B', '', None, 'pear'] * 3
+        self.assertEqual(self.words.known(candidates),
+                         {word for word in candidates if word in self.words})
+        self.assertEqual(self.words.known(candidates),
+                         dictionary.Words(self.source).known(candidates))
+
+    def test_max_length(self):
+        self.assertEqual(self.words.max_length(), len("apple's"))
+        self.assertEqual(dictionary.Words(self.source).max_length(),
+                         len("apple's"))
+
+    def test_load_detects_compiled(self):
+        words = dictionary.load(self.compiled)
+        self.assertIsInstance(words, dictionary.CompiledWords)
+        self.assertIsInstance(dictionary.load(self.source), set)
+
+    def test_default_compiled(self):
+        with mock.patch.dict(os.environ), \
+                mock.patch.object(dictionary, 'DEFAULT_WORDS', self.source), \
+                mock.patch.object(dictionary, 'DEFAULT_COMPILED',
+                                  self.compiled):
+            os.environ.pop('TEXT_CLEANUP_DICT', None)
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                self.assertIn('zebra', dictionary.load())
+            with open(self.source, 'a') as fout:
+                fout.write('\npear')
+            # Still used, in case it came from another list on purpose
+            with self.assertWarns(UserWarning):
+                words = dictionary.load()
+            self.assertNotIn('pear', words)
+            dictionary.compile_words()
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                self.assertIn('pear', dictionary.load())
+
+    def test_default_stat(self):
+        with mock.patch.dict(os.environ), \
+                mock.patch.object(dictionary, 'DEFAULT_WORDS', self.source), \
+                mock.patch.object(dictionary, 'DEFAULT_COMPILED',
+                                  self.compiled):
+            os.environ.pop('TEXT_CLEANUP_DICT', None)
+            # Only the size and mtime are compared, not the content
+            os.utime(self.source, ns=(0, 0))
+            with self.assertWarns(UserWarning):
+                dictionary.load()
+
+    def test_old_format(self):
+        with open(self.compiled, 'rb') as fin:
+            data = fin.read()
+        fields = dictionary.HEADER.unpack_from(data)
+        old = os.path.join(self.tmpdir.name, 'old.dict')
+        with open(old, 'wb') as fout:
+            fout.write(dictionary.HEADER_V1.pack(dictionary.MAGIC_V1,
+                                                 *fields[1:5]))
+            fout.write(data[dictionary.HEADER.size:])
+        words = dictionary.load(old)
+        self.assertIsNone(words.source_stat)
+        self.assertEqual(set(words), set(self.words))
+        self.assertEqual(words.fingerprint, fields[4])
+
+    def test_lazy_words(self):
+        words = dictionary.Words(self.compiled)
+        self.assertIsNone(words._words)  # pylint: disable=protected-access
+        self.assertIn('Zebra', words)
+        self.assertIsNotNone(words._words)  # pylint: disable=protected-access
+
+    def test_known(self):
+        candidates = ['Apple', 'pear', 'zebra', 'zurich', '']
+        expected = {'Apple', 'zebra'}
+        self.assertEqual(self.words.known(candidates), expected)
+        self.assertEqual(dictionary.Words(self.compiled).known(candidates),
+                         expected)
+        self.assertEqual(dictionary.Words(self.source).known(candidates),
+                         expected)
+
+    def test_compiled(self):
+        words = dictionary.Words(self.compiled)
+        self.assertEqual(words.compiled(), self.compiled)
+        words = dictionary.Words(self.source)
+        compiled = words.compiled()
+        self.assertNotEqual(compiled, self.source)
+        self.assertEqual(words.compiled(), compiled)
+        shared = dictionary.Words()
+        shared.use(compiled)
+        self.assertIsInstance(shared.load(), dictionary.CompiledWords)
+        self.assertEqual(set(shared), set(words))
+        self.assertEqual(shared.fingerprint(), words.fingerprint())
+
+
+if __name__ == '__main__':
+    unittest.main()
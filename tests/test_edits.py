@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for listing and applying edits instead of whole documents."""
+
+import io
+import os
+import tempfile
+import unittest
+
+from parameterized import parameterized
+
+from text_cleanup import edits, main, raw, XML
+
+SAMPLE = """
+    In order to mini- mize possible losses, Robert was asked to cutthe
+    monuscript down-  to 150,000 words-a loss of about 70,000 words.- Other
+    changes were alsorequested-- a well- known tixt- book a- .
+    """
+
+
+class TestApply(unittest.TestCase):
+
+    def test_apply(self):
+        found = [(0, 4, 'tixt', 'text', 'substitution'),
+                 (5, 5, '', 'new ', 'insertion')]
+        self.assertEqual(edits.apply_edits('tixt here', found),
+                         'text new here')
+
+    @parameterized.expand([
+        ([(0, 4, 'text', 'tixt', 'substitution')],),
+        ([(5, 9, 'here', 'hare', 'substitution'),
+          (0, 4, 'tixt', 'text', 'substitution')],),
+    ])
+    def test_mismatch(self, found):
+        with self.assertRaises(ValueError):
+            edits.apply_edits('tixt here', found)
+
+    def test_read_write(self):
+        found = [(0, 4, 'tixt', 'tëxt', 'substitution'),
+                 (5, 7, '- ', '-', 'unhyphenation')]
+        output = io.StringIO()
+        edits.write_edits(found, output)
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+        output.seek(0)
+        self.assertEqual(list(edits.read_edits(output)), found)
+
+
+class TestFindEdits(unittest.TestCase):
+
+    @parameterized.expand([
+        ('tixt', [(0, 4, 'tixt', 'text', 'substitution')]),
+        ('mini- mize', [(0, 10, 'mini- mize', 'minimize', 'unhyphenation')]),
+        ('well- known', [(4, 6, '- ', '-', 'unhyphenation')]),
+        ('tixt- book', [(0, 10, 'tixt- book', 'text-book',
+                         'substitution+unhyphenation')]),
+        ('cutthe', [(0, 6, 'cutthe', 'cut the', 'space')]),
+        ('the text', []),
+    ])
+    def test_raw(self, given, expected):
+        self.assertEqual(raw.find_edits(given), expected)
+
+    def test_same_as_cleanup(self):
+        found = raw.find_edits(SAMPLE)
+        self.assertEqual(edits.apply_edits(SAMPLE, found), raw.cleanup(SAMPLE))
+
+    @parameterized.expand([(1, 1), (13, 1), (64, 2)])
+    def test_stream(self, chunk_size, num_processes):
+        found = list(raw.find_edits_stream(io.StringIO(SAMPLE), chunk_size,
+                                           num_processes))
+        self.assertEqual(found, raw.find_edits(SAMPLE))
+
+    def test_xml(self):
+        xml = ('<html><!-- tixt --><P class="tixt">caf&eacute; tixt</P>\n'
+               '<p>a &amp; brlls &#8217; mini- mize</p></html>')
+        found = XML.find_edits(xml, 'p')
+        self.assertEqual([edit[2:] for edit in found], [
+            ('tixt', 'text', 'substitution'),
+            ('brlls', 'balls', 'substitution'),
+            ('mini- mize', 'minimize', 'unhyphenation'),
+        ])
+        self.assertEqual(edits.apply_edits(xml, found),
+                         XML.clean_element(xml, 'p', patch=True))
+
+    def test_xml_cdata(self):
+        xml = '<p><![CDATA[brlls & tixt]]> tixt</p>'
+        found = XML.find_edits(xml)
+        self.assertEqual([edit[:4] for edit in found], [
+            (12, 17, 'brlls', 'balls'),
+            (20, 24, 'tixt', 'text'),
+            (28, 32, 'tixt', 'text'),
+        ])
+        self.assertEqual(edits.apply_edits(xml, found),
+                         XML.clean_element(xml, patch=True))
+
+    def test_xml_reference_in_edit(self):
+        found = XML.find_edits('<p>t&#105;xt</p>')
+        self.assertEqual(found, [(3, 12, 't&#105;xt', 'text', 'substitution')])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, 'book.txt')
+            listed = os.path.join(tmpdir, 'book.jsonl')
+            cleaned = os.path.join(tmpdir, 'cleaned.txt')
+            applied = os.path.join(tmpdir, 'applied.txt')
+            with open(source, 'w') as fout:
+                fout.write(SAMPLE)
+            main.main([source, '--edits', '--output', listed])
+            main.main([source, '--output', cleaned])
+            main.main(['apply-edits', source, listed, '--output', applied])
+            with open(cleaned) as fin, open(applied) as fin2:
+                self.assertEqual(fin2.read(), fin.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
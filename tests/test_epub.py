@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for cleaning EPUB books."""
+
+import os
+import tempfile
+import unittest
+import zipfile
+
+from text_cleanup import epub
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0"
+    xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf"
+        media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>"""
+
+PACKAGE = """<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <manifest>
+    <item id="c1" href="text/chapter%201.xhtml"
+        media-type="application/xhtml+xml"/>
+    <item id="c2" href="text/chapter2.xhtml"
+        media-type="application/xhtml+xml"/>
+    <item id="img" href="images/cover.png" media-type="image/png"/>
+  </manifest>
+  <spine><itemref idref="c2"/><itemref idref="c1"/></spine>
+</package>"""
+
+CHAPTER = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml"><body>
+<p class="bal1s">{}</p><p>Some tixt.</p>
+</body></html>"""
+
+
+class TestEpub(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmpdir.name, 'book.epub')
+        self.destination = os.path.join(self.tmpdir.name, 'fixed.epub')
+        self.image = os.urandom(2048)
+        with zipfile.ZipFile(self.source, 'w') as zout:
+            zout.writestr('mimetype', 'application/epub+zip')
+            zout.writestr('META-INF/container.xml', CONTAINER)
+            zout.writestr('OEBPS/content.opf', PACKAGE)
+            zout.writestr('OEBPS/text/chapter 1.xhtml', CHAPTER.format('One'),
+                          compress_type=zipfile.ZIP_DEFLATED)
+            zout.writestr('OEBPS/text/chapter2.xhtml', CHAPTER.format('Two'))
+            zout.writestr('OEBPS/images/cover.png', self.image,
+                          compress_type=zipfile.ZIP_DEFLATED)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_content_documents(self):
+        with zipfile.ZipFile(self.source) as zin:
+            result = list(epub.content_documents(zin))
+        expected = ['OEBPS/text/chapter2.xhtml', 'OEBPS/text/chapter 1.xhtml']
+        self.assertEqual(result, expected)
+
+    def check_output(self):
+        with zipfile.ZipFile(self.destination) as zin:
+            self.assertIsNone(zin.testzip())
+            first = zin.infolist()[0]
+            self.assertEqual(first.filename, 'mimetype')
+            self.assertEqual(first.compress_type, zipfile.ZIP_STORED)
+            for name in ('OEBPS/text/chapter 1.xhtml',
+                         'OEBPS/text/chapter2.xhtml'):
+                chapter = zin.read(name).decode('utf-8')
+                self.assertIn('<p>Some text.</p>', chapter)
+                self.assertIn('class="bal1s"', chapter)
+            image = zin.getinfo('OEBPS/images/cover.png')
+            self.assertEqual(image.compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(zin.read(image), self.image)
+            self.assertEqual(zin.read('OEBPS/content.opf').decode(), PACKAGE)
+
+    def test_clean_epub(self):
+        epub.clean_epub(self.source, self.destination, 'p')
+        self.check_output()
+
+    def test_clean_epub_in_parallel(self):
+        epub.clean_epub(self.source, self.destination, 'p', num_processes=2,
+                        stream=True)
+        self.check_output()
+
+
+if __name__ == '__main__':
+    unittest.main()
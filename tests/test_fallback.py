@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for the vectorized edit distance fallback."""
+
+import itertools
+import unittest
+
+from parameterized import parameterized
+
+from text_cleanup import fallback, raw, stats
+
+WORDS = ['cat', 'cart', 'coat', 'dog', 'act', 'scatter', 'ct', 'catt']
+PREFERRED = {'o': 'a'}
+
+
+def reference(given, word, insertion=True, deletion=True):
+    """Weighted Levenshtein distance in half edits, one cell at a time."""
+    table = [[fallback.FORBIDDEN] * (len(word) + 1)
+             for _ in range(len(given) + 1)]
+    table[0][0] = 0
+    for i, j in itertools.product(range(len(given) + 1),
+                                  range(len(word) + 1)):
+        if i and deletion:
+            table[i][j] = min(table[i][j], table[i - 1][j] + fallback.EDIT)
+        if j and insertion:
+            table[i][j] = min(table[i][j], table[i][j - 1] + fallback.EDIT)
+        if i and j:
+            if given[i - 1] == word[j - 1]:
+                cost = 0
+            elif word[j - 1] in PREFERRED.get(given[i - 1], ''):
+                cost = fallback.HALF
+            else:
+                cost = fallback.EDIT
+            table[i][j] = min(table[i][j], table[i - 1][j - 1] + cost)
+    return table[-1][-1]
+
+
+class TestDistanceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = fallback.DistanceIndex(WORDS, PREFERRED)
+
+    @parameterized.expand([
+        ('cat', True, True), ('cot', True, True), ('scater', True, True),
+        ('xyz', True, True), ('caat', False, True), ('ca', True, False),
+    ])
+    def test_distances(self, given, insertion, deletion):
+        bound = 3 * fallback.EDIT
+        for length, words in self.index.words.items():
+            indices, distances = self.index.distances(
+                given, length, bound, insertion=insertion, deletion=deletion)
+            found = {words[index]: int(distance)
+                     for index, distance in zip(indices, distances)}
+            expected = {word: reference(given, word, insertion, deletion)
+                        for word in words}
+            self.assertEqual(found, {word: distance
+                                     for word, distance in expected.items()
+                                     if distance <= bound})
+
+    @parameterized.expand([
+        ('cat', 1, 'cat'),
+        ('cot', 0.5, 'cat'),
+        ('cot', 0.4, None),
+        ('scater', 1, 'scatter'),
+        ('dgo', 2, 'dog'),
+        ('zzz', 2, None),
+    ])
+    def test_nearest(self, given, max_distance, expected):
+        self.assertEqual(self.index.nearest(given, max_distance), expected)
+
+    def test_disallowed(self):
+        self.assertIsNone(self.index.nearest('scater', 1, insertion=False))
+        # 'ct' and 'coat' are as close, one deletion or insertion away
+        self.assertEqual(self.index.nearest('cot', 1, substitution=False),
+                         'coat')
+
+
+class TestFallbackCorrection(unittest.TestCase):
+
+    def test_beyond_search(self):
+        self.assertEqual(raw.correct_misspelling('monuscrpit', segment=False),
+                         (False, 'monuscrpit'))
+        with stats.collect() as record:
+            self.assertEqual(
+                raw.correct_misspelling('monuscrpit', segment=False,
+                                        fallback_distance=3),
+                (True, 'manuscript'))
+        self.assertEqual(record.counts['fallback.found'], 1)
+
+    def test_short_words(self):
+        # At most a third of the letters may be edited
+        self.assertEqual(raw.fallback_correction('xqzv', 3), (False, 'xqzv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for re-cleaning edited XML."""
+
+import os
+import tempfile
+import unittest
+
+from text_cleanup import incremental, stats, XML
+
+BOOK = ('<body><h1>Chapter tixt</h1><p>The first tixt.</p>'
+        '<p>The second tixt.</p></body>')
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sidecar = os.path.join(self.tmpdir.name, 'book.cleanup.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def clean(self, xml, **kwargs):
+        with stats.collect() as collected:
+            output = incremental.clean_element(xml, self.sidecar, **kwargs)
+        return output, collected.counts
+
+    def test_first_run(self):
+        output, counts = self.clean(BOOK)
+        self.assertEqual(output, XML.clean_element(BOOK))
+        self.assertEqual(counts['nodes.unchanged'], 0)
+
+    def test_only_edits_cleaned(self):
+        output, _ = self.clean(BOOK)
+        edited = output.replace('The second text.', 'The sekond tixt.')
+        edited = edited.replace('<body>', '<body><p>A new tixt.</p>')
+        output, counts = self.clean(edited)
+        self.assertEqual(output, XML.clean_element(edited))
+        self.assertEqual(counts['nodes.unchanged'], 2)
+        self.assertEqual(counts['tokens'], 6)
+
+    def test_unchanged(self):
+        output, _ = self.clean(BOOK)
+        again, counts = self.clean(output)
+        self.assertEqual(again, output)
+        self.assertEqual(counts['nodes.unchanged'], 3)
+        self.assertEqual(counts['tokens'], 0)
+
+    def test_options_change(self):
+        output, _ = self.clean(BOOK)
+        _, counts = self.clean(output, substitution=False)
+        self.assertEqual(counts['nodes.unchanged'], 0)
+
+    def test_patch(self):
+        xml = BOOK.replace('<p>', '<P >')
+        output, _ = self.clean(xml, patch=True)
+        self.assertEqual(output, xml.replace('tixt', 'text'))
+        edited = output.replace('The first text.', 'The first tixt.')
+        output, counts = self.clean(edited, patch=True)
+        self.assertEqual(output, xml.replace('tixt', 'text'))
+        self.assertEqual(counts['nodes.unchanged'], 2)
+
+    def test_reverted_text(self):
+        """Text edited back to an uncleaned version is cleaned again."""
+        output, _ = self.clean(BOOK)
+        output, _ = self.clean(output.replace('first text', 'first tixt'))
+        self.assertIn('first text', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
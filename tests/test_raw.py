@@ -4,10 +4,13 @@
 # pylint: disable=missing-docstring
 """Tests for basic cleanup of raw text."""
 
+import io
+import itertools
 import unittest
+from unittest import mock
 from parameterized import parameterized
 
-from text_cleanup import raw
+from text_cleanup import confusion, parse, raw, stats
 
 
 class TestMispell(unittest.TestCase):
@@ -59,6 +62,26 @@ class TestMissingSpace(unittest.TestCase):
         _ok, result = raw.correct_misspelling(given)
         self.assertEqual(result, expected)
 
+    @parameterized.expand([
+        ('this is the beginning', 'thisisthebeginning'),
+        ('It was the best of times', 'Itwasthebestoftimes'),
+        ('feared-it was', 'feared-itwas')])
+    def test_segment(self, expected, given):
+        _ok, result = raw.correct_misspelling(given)
+        self.assertEqual(result, expected)
+
+    @parameterized.expand([
+        ('disappoint', 'disapoint'),
+        ('procrastinate', 'procastinate'),
+        ('reductions', 'reducttons'),
+        ('watermark', 'watermeark'),
+        ('foreshadowing', 'forehadowing'),
+    ])
+    def test_one_error_before_segment(self, expected, given):
+        self.assertEqual(raw.correct_misspelling(given), (True, expected))
+        self.assertEqual(raw.correct_misspelling(given, engine='index'),
+                         (True, expected))
+
 
 class TestEnd2End(unittest.TestCase):
     """Test a full pass over some text, correcting mistakes."""
@@ -125,5 +148,150 @@ class TestEnd2End(unittest.TestCase):
         #  result = list(map(raw.cleanup, expected))
         #  self.assertEqual(result, expected)
 
+def loaded_words(_chunk):
+    return type(raw.WORDS.load()).__name__
+
+
+class TestStream(unittest.TestCase):
+    """Cleaning a stream in chunks should match cleaning it all at once."""
+
+    sample = """
+    In order to mini- mize possible losses, Robert was asked to cutthe
+    monuscript down-  to 150,000 words-a loss of about 70,000 words.- Other
+    changes were alsorequested--
+    """
+
+    @parameterized.expand([(1,), (5,), (8,), (13,), (64,), (4096,)])
+    def test_same_as_cleanup(self, chunk_size):
+        expected = raw.cleanup(self.sample)
+        output = io.StringIO()
+        raw.cleanup_stream(io.StringIO(self.sample), output,
+                           chunk_size=chunk_size)
+        self.assertEqual(output.getvalue(), expected)
+
+    def test_split_chunks(self):
+        chunks = list(raw.split_chunks(io.StringIO(self.sample), 10))
+        self.assertEqual(''.join(chunks), self.sample)
+        self.assertTrue(all(len(chunk) >= 10 for chunk in chunks[:-1]))
+        self.assertFalse(any(chunk.endswith('- ') for chunk in chunks))
+
+    @parameterized.expand([(1,), (13,), (4096,)])
+    def test_parallel(self, chunk_size):
+        sample = self.sample * 5
+        with stats.collect() as serial:
+            expected = raw.cleanup(sample)
+        output = io.StringIO()
+        with stats.collect() as parallel:
+            raw.cleanup_parallel(io.StringIO(sample), output, 2,
+                                 chunk_size=chunk_size, chunks_per_process=2)
+        self.assertEqual(output.getvalue(), expected)
+        self.assertEqual(parallel.counts['tokens'], serial.counts['tokens'])
+
+    def test_workers_share_compiled_words(self):
+        # Even forked workers, rather than each keeping a copy of a set
+        loaded = {result for _chunk, result in raw.map_chunks(
+            loaded_words, ['one', 'two', 'three'], num_processes=2)}
+        self.assertEqual(loaded, {'CompiledWords'})
+
+
+class TestUniqueTokens(unittest.TestCase):
+    """Correcting each distinct token once should match correcting them all
+    in turn."""
+
+    @parameterized.expand([
+        ("Some tixt and more tixt, 1,000 times.",),
+        ("Iamhere and Alot of Apples in Idaho.",),
+        ("In order to mini- mize losses, cutthe monuscript.",),
+        ("",),
+        ("   ",),
+    ])
+    def test_same_as_each_token(self, text):
+        expected = parse.TOKEN_RE.sub(
+            lambda m: raw.correct_misspelling(m.group())[1],
+            text.replace('- ', '-'))
+        self.assertEqual(raw.cleanup(text), expected)
+
+    def test_stats_count_every_token(self):
+        with stats.collect() as collected:
+            raw.cleanup("the tixt, the tixt, the end")
+        counts = collected.as_dict()['counts']
+        self.assertEqual(counts['tokens'], 6)
+        self.assertEqual(counts['tokens.valid'], 4)
+        self.assertEqual(counts['fixed.substitution'], 2)
+
+
+class TestBatches(unittest.TestCase):
+    """Checking candidates in batches should find what checking them one at
+    a time does."""
+
+    @parameterized.expand([
+        ('tixt',), ('thetixt',), ('mini-mize',), ('fl1y',), ('1o0',),
+        ('xzqjv',), ('Iove',), ('a-',), ('pillow',),
+    ])
+    def test_same_as_one_at_a_time(self, given):
+        candidates = itertools.chain.from_iterable(
+            raw.candidate_batches(given))
+        expected = next(filter(raw.spellcheck, candidates), None)
+        self.assertEqual(raw.search_correction(given, segment=False),
+                         (expected is not None, expected or given))
+
+    def test_order(self):
+        self.assertEqual(
+            list(itertools.chain.from_iterable(raw.error_batches('ab'))),
+            ['a b'] + list(raw.one_substitution('ab')) +
+            list(raw.one_deletion('ab')) + list(raw.one_insertion('ab')))
+
+    def test_model_not_repeated(self):
+        model = confusion.ConfusionModel(min_count=1)
+        model.train([('tbe', 'toe'), ('tbe', 'the')])
+        likely, *rest = raw.error_batches('tbe', confusion=model)
+        self.assertEqual(likely[:2], ['toe', 'the'])
+        rest = list(itertools.chain.from_iterable(rest))
+        self.assertFalse(set(likely) & set(rest))
+        self.assertEqual(set(likely + rest), set(raw.one_error('tbe')))
+
+    def test_varied_once(self):
+        with mock.patch.object(raw, 'error_batches',
+                               wraps=raw.error_batches) as varied:
+            list(raw.candidate_batches('ab'))
+        words = [call.args[0] for call in varied.call_args_list]
+        self.assertEqual(len(words), len(set(words)))
+
+    def test_first_valid(self):
+        self.assertEqual(raw.first_valid(['xzq', 'the text', 'text']),
+                         'the text')
+        self.assertEqual(raw.first_valid(['xzq', 'text', '12']), 'text')
+        self.assertIsNone(raw.first_valid(['xzq', 'qzx']))
+        self.assertIsNone(raw.first_valid([]))
+
+
+class TestBudget(unittest.TestCase):
+    """Searches can be cut short, leaving the word alone."""
+
+    garbage = 'xzqjvwkxzqjvwk'
+
+    @parameterized.expand([
+        ('candidates', dict(max_candidates=10)),
+        ('seconds', dict(max_seconds=0)),
+        ('length', dict(max_search_length=10)),
+    ])
+    def test_budget_exceeded(self, budget, kwargs):
+        with stats.collect() as collected:
+            result = raw.correct_misspelling(self.garbage, **kwargs)
+        self.assertEqual(result, (False, self.garbage))
+        counts = collected.as_dict()['counts']
+        self.assertEqual(counts['budget_exceeded'], 1)
+        self.assertEqual(counts['budget_exceeded.' + budget], 1)
+        if budget == 'candidates':
+            self.assertEqual(counts['candidates'], 10)
+
+    def test_within_budget(self):
+        kwargs = dict(max_candidates=1000, max_seconds=10,
+                      max_search_length=10)
+        with stats.collect() as collected:
+            self.assertEqual(raw.cleanup('Some tixt', **kwargs), 'Some text')
+        self.assertNotIn('budget_exceeded', collected.as_dict()['counts'])
+
+
 if __name__ == '__main__':
     unittest.main()
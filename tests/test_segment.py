@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for splitting words run together."""
+
+import unittest
+
+from text_cleanup import segment
+
+
+class TestSegmenter(unittest.TestCase):
+
+    def setUp(self):
+        words = ['a', 'I', 'b', 'the', 'then', 'end', 'hen', 'fox', 'red',
+                 'redfox', 'Fox']
+        self.segmenter = segment.Segmenter(words, min_mean_length=0)
+
+    def test_fewest_words(self):
+        self.assertEqual(self.segmenter.split('theredfox'),
+                         ['the', 'redfox'])
+
+    def test_longest_words(self):
+        self.assertEqual(self.segmenter.split('thenend'), ['then', 'end'])
+
+    def test_no_split(self):
+        self.assertIsNone(self.segmenter.split('thex'))
+        self.assertIsNone(self.segmenter.split('thebend'))
+
+    def test_single_letters(self):
+        self.assertEqual(self.segmenter.split('Iafox'), ['I', 'a', 'fox'])
+
+    def test_hyphens(self):
+        self.assertEqual(self.segmenter.segment('thehen-redfox'),
+                         'the hen-redfox')
+        self.assertIsNone(self.segmenter.segment('thehen-redfex'))
+
+    def test_min_mean_length(self):
+        segmenter = segment.Segmenter(['a', 'an', 'ant', 'act'],
+                                      min_mean_length=3)
+        self.assertIsNone(segmenter.segment('anaant'))
+        self.assertEqual(segmenter.segment('antact'), 'ant act')
+
+
+if __name__ == '__main__':
+    unittest.main()
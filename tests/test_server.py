@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for the cleanup server."""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from text_cleanup import confusion, raw, server, XML
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cleanup.sock')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_with_server(self, client, **kwargs):
+        async def run():
+            instance = server.Server(self.path, **kwargs)
+            await instance.start()
+            try:
+                return await client()
+            finally:
+                await instance.close()
+        return asyncio.run(run())
+
+    async def send(self, requests):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        for request in requests:
+            writer.write(json.dumps(request).encode('utf-8') + b'\n')
+        writer.write_eof()
+        responses = [json.loads(line) async for line in reader]
+        writer.close()
+        return {response['id']: response for response in responses}
+
+    def test_requests(self):
+        texts = [f"Paragraph {i} has tixt." for i in range(20)]
+        requests = [dict(id=i, text=text) for i, text in enumerate(texts)]
+        requests.append(dict(id='xml', text='<p>Some tixt</p>', xml=True))
+        requests.append(dict(id='options', text='tixt',
+                             options=dict(substitution=False)))
+        responses = self.run_with_server(lambda: self.send(requests),
+                                         num_processes=2)
+        for i, text in enumerate(texts):
+            self.assertEqual(responses[i]['result'], raw.cleanup(text))
+        self.assertEqual(responses['xml']['result'],
+                         XML.clean_element('<p>Some tixt</p>'))
+        self.assertEqual(responses['options']['result'], 'tit')
+
+    def test_errors(self):
+        requests = [dict(id=1, text='tixt', options=dict(bogus=True)),
+                    dict(id=2, text=None)]
+        responses = self.run_with_server(lambda: self.send(requests))
+        self.assertIn('bogus', responses[1]['error'])
+        self.assertIn('error', responses[2])
+
+    def test_error_in_batch(self):
+        async def clients():
+            return await asyncio.gather(
+                self.send([dict(id=1, text='Some tixt')]),
+                self.send([dict(id=2, text='<p>tixt</p>', xml=True,
+                                selector='p[[')]))
+        good, bad = self.run_with_server(clients, batch_delay=0.5)
+        self.assertEqual(good[1]['result'], 'Some text')
+        self.assertIn('SelectorSyntaxError', bad[2]['error'])
+
+    def test_concurrent_clients(self):
+        async def clients():
+            return await asyncio.gather(*(
+                self.send([dict(id=i, text='Some tixt')]) for i in range(10)))
+        results = self.run_with_server(clients, batch_size=20)
+        self.assertEqual([r[i]['result'] for i, r in enumerate(results)],
+                         ['Some text'] * 10)
+
+    def test_in_flight(self):
+        running = []
+        peak = []
+        respond = server.Server.respond
+
+        async def counted(instance, *args):
+            running.append(None)
+            peak.append(len(running))
+            try:
+                await respond(instance, *args)
+            finally:
+                running.pop()
+
+        requests = [dict(id=i, text='Some tixt') for i in range(10)]
+        with mock.patch.object(server.Server, 'respond', counted):
+            responses = self.run_with_server(lambda: self.send(requests),
+                                             max_in_flight=3)
+        self.assertEqual([responses[i]['result'] for i in range(10)],
+                         ['Some text'] * 10)
+        self.assertEqual(max(peak), 3)
+
+    def test_more_options(self):
+        text = "Hermione said the Dursleys were out. " * 3
+        filename = os.path.join(self.tmpdir.name, 'model.json')
+        model = confusion.ConfusionModel()
+        model.train([('tbe', 'toe')] * 3)
+        model.save(filename)
+        requests = [
+            dict(id=1, text=text, options=dict(vocabulary_min_count=3)),
+            dict(id=2, text='tbe', options=dict(fallback_distance=2,
+                                                segment=False)),
+        ]
+        responses = self.run_with_server(lambda: self.send(requests),
+                                         confusion_model=filename)
+        self.assertEqual(responses[1]['result'],
+                         raw.cleanup(text, vocabulary_min_count=3))
+        # Without the model it would be 'tee'
+        self.assertEqual(responses[2]['result'], 'toe')
+
+    def test_request(self):
+        ready = threading.Event()
+        stop = []
+
+        def run():
+            async def serve():
+                instance = server.Server(self.path)
+                await instance.start()
+                stop.append((asyncio.get_running_loop(),
+                             asyncio.current_task()))
+                ready.set()
+                await instance.serve_forever()
+            try:
+                asyncio.run(serve())
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        ready.wait()
+        try:
+            self.assertEqual(server.request(self.path, 'Some tixt'),
+                             'Some text')
+            with self.assertRaises(server.ServerError):
+                server.request(self.path, 'tixt', bogus=True)
+        finally:
+            loop, task = stop[0]
+            loop.call_soon_threadsafe(task.cancel)
+            thread.join()
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
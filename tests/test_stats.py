@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for correction statistics."""
+
+import json
+import tempfile
+import unittest
+
+from parameterized import parameterized
+
+from text_cleanup import main, raw, stats, XML
+
+
+class TestClassify(unittest.TestCase):
+
+    @parameterized.expand([
+        ('tixt', 'text', 'substitution'),
+        ('tet', 'text', 'insertion'),
+        ('texxt', 'text', 'deletion'),
+        ('thetext', 'the text', 'space'),
+        ('mini-mize', 'minimize', 'unhyphenation'),
+        ('thetixt', 'the text', 'space+substitution'),
+        ('text', 'text', 'none'),
+    ])
+    def test_classify(self, given, guess, expected):
+        self.assertEqual(stats.classify(given, guess, raw.PREFERRED_ERRORS),
+                         expected)
+
+
+class TestCollect(unittest.TestCase):
+
+    def test_inactive_by_default(self):
+        self.assertIsNone(stats.ACTIVE)
+        raw.cleanup("Some tixt.")
+        self.assertIsNone(stats.ACTIVE)
+
+    def test_cleanup_counts(self):
+        with stats.collect() as collected:
+            raw.cleanup("This tixt is xzqjv.")
+        counts = collected.as_dict()['counts']
+        self.assertEqual(counts['tokens'], 4)
+        self.assertEqual(counts['tokens.valid'], 2)
+        self.assertEqual(counts['tokens.fixed'], 1)
+        self.assertEqual(counts['tokens.uncorrectable'], 1)
+        self.assertEqual(counts['fixed.substitution'], 1)
+        self.assertGreater(counts['candidates'], 0)
+        self.assertGreater(counts['generated.substitution'], 0)
+        self.assertIsNone(stats.ACTIVE)
+
+    def test_timing(self):
+        with stats.collect(timing=True) as collected:
+            XML.clean_element('<p>Some tixt</p>')
+        seconds = collected.as_dict()['seconds']
+        self.assertEqual(set(seconds),
+                         {'parse', 'select', 'correct', 'serialize'})
+
+    def test_no_timing(self):
+        with stats.collect() as collected:
+            XML.clean_element('<p>Some tixt</p>')
+        self.assertNotIn('seconds', collected.as_dict())
+
+    def test_multiprocessing(self):
+        xml = '<body>{}</body>'.format(
+            ''.join(f'<p>Paragraph {i} has tixt.</p>' for i in range(20)))
+        with stats.collect() as serial:
+            expected = XML.clean_element(xml)
+        with stats.collect() as parallel:
+            result = XML.clean_element(xml, num_processes=2)
+        self.assertEqual(result, expected)
+        self.assertEqual(parallel.as_dict(), serial.as_dict())
+
+
+class TestMain(unittest.TestCase):
+
+    def test_stats_file(self):
+        with tempfile.NamedTemporaryFile('w+', suffix='.txt') as fin, \
+                tempfile.NamedTemporaryFile('w+', suffix='.txt') as fout, \
+                tempfile.NamedTemporaryFile('w+', suffix='.json') as report:
+            fin.write("Some tixt.")
+            fin.flush()
+            main.main([fin.name, '--output', fout.name,
+                       '--stats', report.name, '--profile',
+                       '--cache_size', '100'])
+            report.seek(0)
+            result = json.load(report)
+        self.assertEqual(result['counts']['tokens'], 2)
+        self.assertIn('correct', result['seconds'])
+        self.assertIn('total', result['seconds'])
+        self.assertIn('hits', result['cache'])
+
+
+if __name__ == '__main__':
+    unittest.main()
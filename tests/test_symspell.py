@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for the deletion index correction engine."""
+
+import unittest
+from parameterized import parameterized
+
+from text_cleanup import raw, symspell
+
+
+class TestDeletionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = symspell.DeletionIndex(['balls', 'bells', 'Yahoo'])
+
+    def test_deletions(self):
+        expected = {'ab', 'a', 'b', ''}
+        self.assertEqual(symspell.deletions('ab', 2), expected)
+
+    def test_candidates(self):
+        result = set(self.index.candidates('brlls', 1))
+        self.assertEqual(result, {'balls', 'bells'})
+
+    def test_candidates_ignore_case(self):
+        result = set(self.index.candidates('yahoo', 1))
+        self.assertEqual(result, {'Yahoo'})
+
+    def test_prefer_error_groups(self):
+        key = symspell.edit_key('brlls', 'balls', 1, raw.PREFERRED_ERRORS)
+        other = symspell.edit_key('brlls', 'bells', 1, raw.PREFERRED_ERRORS)
+        self.assertLess(key, other)
+
+    def test_respect_disallowed_edits(self):
+        key = symspell.edit_key('triathlo', 'triathlon', 2,
+                                raw.PREFERRED_ERRORS, insertion=False)
+        self.assertIsNone(key)
+
+
+class TestIndexEngine(unittest.TestCase):
+    """The index engine should agree with the brute force search."""
+
+    @parameterized.expand([
+        'fiy', 'iiar', 'piiiow', 'Iiiad', 'abraham', 'elephart', 'lphabet',
+        'triathlo', 'asyou', 'Iam', 'tixt', 'texthqs', "con't", 'agaon',
+        'mini-mize', 'monuscript', 'pridoced', 'Bal1s', 'xzqjv',
+        'agaon-twice', 'qwrtp-plk'])
+    def test_same_as_search(self, given):
+        expected = raw.correct_misspelling(given)
+        result = raw.correct_misspelling(given, engine='index')
+        self.assertEqual(result, expected)
+
+    def test_end2end(self):
+        sample = "This texthqs missingspaces, but also someerrors."
+        expected = "This text has missing spaces, but also some errors."
+        result = raw.cleanup(sample, engine='index')
+        self.assertEqual(result, expected)
+
+    def test_hyphenated(self):
+        sample = """"Wait! I con't!" he said agaon-twice thot day now."""
+        expected = """"Wait! I can't!" he said again-twice that day now."""
+        self.assertEqual(raw.cleanup(sample, engine='index'), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
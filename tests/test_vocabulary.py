@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for promoting a document's own words to its vocabulary."""
+
+import collections
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from parameterized import parameterized
+
+from text_cleanup import batch, main, raw, stats, vocabulary, XML
+
+TEXT = ("Hermione said the Dursleys were out. " * 5 +
+        "Hermoine ran to the cat. ")
+
+
+class TestPromote(unittest.TestCase):
+
+    def promote(self, text, **kwargs):
+        counts = collections.Counter(text.split())
+        return vocabulary.promote(counts, lambda token: token.islower(),
+                                  **kwargs)
+
+    @parameterized.expand([
+        ('Zorn Zorn Zorn', {'Zorn': 3}),
+        ('Zorn Zorn', {}),
+        ('Zorn Zorn Zorn ZORN', {'Zorn': 3}),
+        ('Zorn Zorn Zorn Zarn Zarn', {}),
+        ('Zorn Zorn Zorn Zorn Zarn', {'Zorn': 4}),
+        ('Ab Ab Ab', {}),
+        ('zorn zorn zorn', {}),
+        ('123 123 123', {}),
+    ])
+    def test_promote(self, text, expected):
+        self.assertEqual(self.promote(text), expected)
+
+    def test_options(self):
+        self.assertEqual(self.promote('Zorn Zorn', min_count=2),
+                         {'Zorn': 2})
+        self.assertEqual(self.promote('Ab Ab Ab', min_length=2), {'Ab': 3})
+        self.assertEqual(self.promote('Zorn Zorn Zorn Zarn', min_share=0.9),
+                         {})
+
+
+class TestCleanup(unittest.TestCase):
+
+    def test_raw(self):
+        self.assertNotIn('Hermione said', raw.cleanup(TEXT))
+        with stats.collect() as record:
+            output = raw.cleanup(TEXT, vocabulary_min_count=3)
+        self.assertEqual(output.count('Hermione said the Dursleys'), 5)
+        # Too rare to be promoted, so still corrected
+        self.assertNotIn('Hermoine', output)
+        self.assertEqual(record.counts['vocabulary.Hermione'], 5)
+        self.assertEqual(record.counts['vocabulary.Dursleys'], 5)
+
+    def test_misread(self):
+        # 'thc' is a preferred substitution away from 'the'
+        self.assertEqual(raw.document_vocabulary(['thc thc thc'], 3), [])
+
+    def test_given_vocabulary(self):
+        self.assertEqual(raw.cleanup('Hermione said', vocabulary=['Hermione']),
+                         'Hermione said')
+
+    def test_xml(self):
+        # Each node has the name once, but the document has it often
+        xml = '<body>{}</body>'.format(''.join(
+            f'<p>Hermione said so {i}.</p>' for i in range(3)))
+        self.assertEqual(XML.clean_element(xml, 'p', vocabulary_min_count=3),
+                         xml)
+        self.assertNotEqual(XML.clean_element(xml, 'p'), xml)
+        self.assertEqual(XML.find_edits(xml, 'p', vocabulary_min_count=3), [])
+
+    @parameterized.expand([(1,), (2,)])
+    def test_chunks(self, num_processes):
+        # Each chunk has the name too few times to promote it on its own
+        text = TEXT * 4
+        expected = raw.cleanup(text, vocabulary_min_count=10)
+        self.assertIn('Hermione', expected)
+        output = io.StringIO()
+        raw.cleanup_parallel(io.StringIO(text), output, num_processes,
+                             chunk_size=100, vocabulary_min_count=10)
+        self.assertEqual(output.getvalue(), expected)
+        output = io.StringIO()
+        raw.cleanup_stream(io.StringIO(text), output, chunk_size=100,
+                           vocabulary_min_count=10)
+        self.assertEqual(output.getvalue(), expected)
+        found = list(raw.find_edits_stream(
+            io.StringIO(text), chunk_size=100, num_processes=num_processes,
+            vocabulary_min_count=10))
+        self.assertEqual(found, raw.find_edits(text, vocabulary_min_count=10))
+
+    def test_xml_stream(self):
+        with self.assertRaises(ValueError):
+            XML.clean_stream(io.StringIO('<p>Hermione</p>'), io.StringIO(),
+                             vocabulary_min_count=3)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(ValueError):
+                batch.clean_tree(tmpdir, os.path.join(tmpdir, 'out'),
+                                 stream=True, vocabulary_min_count=3)
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(tmpdir, 'book.txt')
+            output = os.path.join(tmpdir, 'cleaned.txt')
+            report = os.path.join(tmpdir, 'stats.json')
+            with open(source, 'w') as fout:
+                fout.write(TEXT)
+            main.main([source, '--output', output, '--stats', report,
+                       '--vocabulary_min_count', '3'])
+            with open(report) as fin:
+                counts = json.load(fin)['counts']
+        self.assertEqual(counts['vocabulary.Hermione'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# type: ignore
+# pylint: disable=missing-docstring
+"""Tests for sharing cleanup between workers through a queue."""
+
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+import zipfile
+
+from text_cleanup import batch, confusion, main, raw, workqueue
+
+TEXT = "Some tixt, a mini- mize and monuscript.\n" * 20
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0"
+    xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="content.opf"
+        media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>"""
+
+PACKAGE = """<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <manifest>
+    <item id="c1" href="one.xhtml" media-type="application/xhtml+xml"/>
+    <item id="c2" href="two.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+  <spine><itemref idref="c1"/><itemref idref="c2"/></spine>
+</package>"""
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.queue = self.path('queue.sqlite')
+        self.source = self.path('source')
+        self.destination = self.path('destination')
+        self.write('a.txt', TEXT)
+        self.write('nested/b.html', "<p>More tixt.</p>")
+        with zipfile.ZipFile(self.path('source', 'c.epub'), 'w') as zout:
+            zout.writestr('mimetype', 'application/epub+zip')
+            zout.writestr('META-INF/container.xml', CONTAINER)
+            zout.writestr('content.opf', PACKAGE)
+            zout.writestr('one.xhtml', '<html><p>One tixt</p></html>')
+            zout.writestr('two.xhtml', '<html><p>Two tixt</p></html>')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir.name, *names)
+
+    def write(self, name, content):
+        path = self.path('source', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fout:
+            fout.write(content)
+
+    def enqueue(self, **kwargs):
+        queue = workqueue.WorkQueue(self.queue, **kwargs)
+        for name in batch.find_files(self.source, self.destination):
+            queue.enqueue(os.path.join(self.source, name),
+                          os.path.join(self.destination, name),
+                          shard_size=100)
+        return queue
+
+    def assert_cleaned(self, expected=None):
+        if expected is None:
+            expected = self.path('expected')
+            batch.clean_tree(self.source, expected)
+        for name in batch.find_files(self.source, self.destination):
+            if name.endswith('.epub'):
+                with zipfile.ZipFile(os.path.join(expected, name)) as zin, \
+                        zipfile.ZipFile(os.path.join(self.destination,
+                                                     name)) as zout:
+                    self.assertEqual(zout.namelist(), zin.namelist())
+                    for member in zin.namelist():
+                        self.assertEqual(zout.read(member), zin.read(member))
+                continue
+            with open(os.path.join(expected, name)) as fin, \
+                    open(os.path.join(self.destination, name)) as fout:
+                self.assertEqual(fout.read(), fin.read())
+
+    def test_split(self):
+        shards = [text for _name, text in
+                  workqueue.split_file(self.path('source', 'a.txt'), 'raw',
+                                       100)]
+        self.assertGreater(len(shards), 1)
+        self.assertEqual(''.join(shards), TEXT)
+        chapters = workqueue.split_file(self.path('source', 'c.epub'), 'epub')
+        self.assertEqual([name for name, _text in chapters],
+                         ['one.xhtml', 'two.xhtml'])
+
+    def test_work(self):
+        queue = self.enqueue()
+        result = workqueue.work(self.queue)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(queue.counts(), {workqueue.DONE: result['done']})
+        self.assertEqual(queue.unfinished(), 0)
+        queue.close()
+        self.assert_cleaned()
+
+    def test_assemble_waits(self):
+        queue = self.enqueue()
+        claimed = []
+        while True:
+            task = queue.claim('test')
+            if task is None:
+                break
+            claimed.append(task)
+        # Each job's assembly waits for the rest of its tasks
+        self.assertNotIn(workqueue.ASSEMBLE,
+                         [task.action for task in claimed])
+        queue.close()
+
+    def test_crashed_worker(self):
+        queue = self.enqueue(lease_seconds=0.2)
+        crashed = queue.claim('crashed')
+        self.assertEqual(workqueue.work(self.queue, wait=True,
+                                        poll_seconds=0.05,
+                                        lease_seconds=0.2)['failed'], 0)
+        self.assertEqual(queue.unfinished(), 0)
+        self.assertFalse(queue.renew(crashed, 'crashed'))
+        queue.close()
+        self.assert_cleaned()
+
+    def test_lost_lease(self):
+        queue = self.enqueue(lease_seconds=0.1)
+        stale = queue.claim('stale')
+        time.sleep(0.2)
+        task = queue.claim('other')
+        self.assertEqual(task.id, stale.id)
+        # The stale worker finishing late can't touch the new claim
+        self.assertFalse(queue.fail(stale, 'stale', 'Too late'))
+        self.assertFalse(queue.complete(stale, 'stale', 'Too late'))
+        self.assertEqual(queue.counts()[workqueue.RUNNING], 1)
+        self.assertTrue(queue.renew(task, 'other'))
+        self.assertTrue(queue.complete(task, 'other', 'cleaned'))
+        self.assertNotIn(workqueue.RUNNING, queue.counts())
+        queue.close()
+
+    def test_lease_renewed(self):
+        queue = self.enqueue(lease_seconds=0.2)
+        task = queue.claim('slow')
+        heartbeat = workqueue._Heartbeat(queue, task, 'slow')
+        heartbeat.start()
+        time.sleep(0.5)
+        self.assertNotEqual(queue.claim('other').id, task.id)
+        heartbeat.stopped.set()
+        heartbeat.join()
+        queue.close()
+
+    def test_failures(self):
+        queue = workqueue.WorkQueue(self.queue)
+        queue.enqueue(self.path('source', 'a.txt'), self.path('a.txt'),
+                      bogus=True)
+        result = workqueue.work(self.queue, max_attempts=2)
+        self.assertEqual(result, dict(done=0, failed=2))
+        self.assertEqual(queue.counts(), {workqueue.FAILED: 2})
+        self.assertEqual(queue.unfinished(), 0)
+        self.assertFalse(os.path.exists(self.path('a.txt')))
+        queue.close()
+
+    def test_processes(self):
+        self.enqueue().close()
+        workers = [multiprocessing.Process(
+            target=workqueue.work, args=(self.queue,),
+            kwargs=dict(wait=True, poll_seconds=0.05)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.assert_cleaned()
+
+    def test_vocabulary_shards(self):
+        text = "Hermione said the Dursleys were out. " * 5
+        self.write('v.txt', text)
+        queue = workqueue.WorkQueue(self.queue)
+        queue.enqueue(self.path('source', 'v.txt'), self.path('v.txt'),
+                      shard_size=40, vocabulary_min_count=3)
+        # Each shard has one Hermione, but the file has five
+        self.assertEqual(workqueue.work(self.queue)['failed'], 0)
+        queue.close()
+        with open(self.path('v.txt')) as fin:
+            self.assertEqual(fin.read(),
+                             raw.cleanup(text, vocabulary_min_count=3))
+
+    def test_options_json(self):
+        model = confusion.ConfusionModel()
+        model.train([('tixt', 'text')] * 3)
+        model.save(self.path('model.json'))
+        queue = workqueue.WorkQueue(self.queue)
+        queue.enqueue(self.path('source', 'a.txt'), self.path('a.txt'),
+                      confusion_model=self.path('model.json'), max_seconds=1)
+        with sqlite3.connect(self.queue) as db:
+            (options,), = db.execute('SELECT options FROM jobs')
+        self.assertEqual(json.loads(options), {
+            'confusion_model': self.path('model.json'), 'max_seconds': 1})
+        task = queue.claim('test')
+        self.assertEqual(
+            workqueue.clean_task(task),
+            raw.cleanup(TEXT, confusion=model, max_seconds=1))
+        with self.assertRaises(TypeError):
+            queue.enqueue(self.path('source', 'a.txt'), self.path('a.txt'),
+                          confusion=model)
+        queue.close()
+
+    def test_main(self):
+        main.main(['enqueue', self.queue, self.source, self.destination])
+        main.main(['enqueue', self.queue, self.path('source', 'a.txt'),
+                   self.path('a.txt'), '--shard_size', '100'])
+        main.main(['worker', self.queue, '--cache_size', '0'])
+        # The same options as cleaning them all at once
+        main.main(['batch', self.source, self.path('expected')])
+        self.assert_cleaned(self.path('expected'))
+        with open(self.path('a.txt')) as fin, \
+                open(os.path.join(self.destination, 'a.txt')) as fin2:
+            self.assertEqual(fin.read(), fin2.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
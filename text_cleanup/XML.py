@@ -3,11 +3,33 @@
 # pylint: disable=invalid-name
 """Cleanup xml text."""
 
+import difflib
+import heapq
+import html
+import itertools
 import multiprocessing
-from bs4 import BeautifulSoup  # type: ignore
+import re
+from xml.sax.saxutils import escape, quoteattr
 
+from typing import (
+    Any, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple)
+
+from bs4 import BeautifulSoup, NavigableString  # type: ignore
+from bs4.builder import HTMLParserTreeBuilder  # type: ignore
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser  # type: ignore
+from bs4.element import CData, PreformattedString  # type: ignore
+from cssselect import GenericTranslator  # type: ignore
+from lxml import etree  # type: ignore
+
+from text_cleanup import edits, parse, raw, stats
 from text_cleanup.raw import cleanup
 
+# Character references, as html.parser finds them
+ENTITY_RE = re.compile(
+    r'&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][-.a-zA-Z0-9]*);?')
+
+Span = Tuple[int, int]
+
 
 def reformat(given: str, pretty: bool = False) -> str:
     """Return pretty-formatted version of given."""
@@ -16,36 +38,585 @@ def reformat(given: str, pretty: bool = False) -> str:
     return str(BeautifulSoup(given, 'html.parser'))
 
 
-def clean_element(xml: str, selector=':root',
-                  progress_iterator=None, num_processes=1, **kwargs) -> str:
-    """Return xml with the selected elements cleaned up. kwargs are passed to
-    text_cleanup.raw.cleanup()"""
-    # Use html.parser so that it doesn't try to fix the structure
-    soup = BeautifulSoup(xml, 'html.parser')
-    # Build entire list first to avoid modifying a live iterator
-    nodes = set(
-        node
+def make_batches(texts: List[str], num_batches: int) -> List[List[str]]:
+    """Return texts split into num_batches batches of similar total length."""
+    batches: List[List[str]] = [[] for _ in range(num_batches)]
+    heap = [(0, i) for i in range(num_batches)]
+    # Longest first, each into the lightest batch so far
+    for text in sorted(texts, key=len, reverse=True):
+        size, i = heapq.heappop(heap)
+        batches[i].append(text)
+        heapq.heappush(heap, (size + len(text), i))
+    return [batch for batch in batches if batch]
+
+
+def select_strings(soup: BeautifulSoup, selector=':root',
+                   **kwargs) -> List[NavigableString]:
+    """Return the text nodes of the elements in soup matching selector, each
+    once, apart from those which are only whitespace."""
+    # Build entire list first to avoid modifying a live iterator. Nested
+    # selections can find the same node twice.
+    return list({
+        id(node): node
         for element in soup.select(selector, **kwargs)
         for node in element.strings
-        if not node.isspace())
+        if not node.isspace()}.values())
+
+
+def clean_texts(texts: List[str], progress_iterator=None, num_processes=1,
+                batches_per_process=4, function=raw.cleanup_batch,
+                **kwargs) -> Dict[str, Any]:
+    """Return a dict from each of texts to its cleaned up version, or to
+    whatever else function returns for a batch of texts. kwargs are passed
+    to text_cleanup.raw.cleanup()"""
     if progress_iterator is None:
         progress_iterator = lambda x: x  # noqa: E731
+    with stats.timer('correct'):
+        if num_processes > 1:
+            return _clean_parallel(texts, progress_iterator, num_processes,
+                                   batches_per_process, function, **kwargs)
+        return dict(zip(texts, progress_iterator(function(texts, **kwargs))))
 
-    text_iterator = map(str, nodes)
 
-    if num_processes > 1:
-        with multiprocessing.Pool(num_processes) as pool:
-            fixed = []
-            futures = [
-                pool.apply_async(cleanup, (text,), kwargs)
-                for text in text_iterator]
-            fixed = [future.get() for future in progress_iterator(futures)]
+class _SpanParser(BeautifulSoupHTMLParser):
+    """Also record where each run of text starts and ends in the source."""
+
+    def source_offset(self) -> int:
+        line, column = self.getpos()
+        return self.soup.builder.line_starts[line - 1] + column
+
+    def text_started(self) -> None:
+        builder = self.soup.builder
+        if builder.start is None:
+            builder.start = self.source_offset()
+
+    def text_ended(self) -> None:
+        builder = self.soup.builder
+        if builder.start is not None:
+            builder.spans.append((builder.start, self.source_offset()))
+            builder.start = None
+
+    def handle_data(self, *args, **kwargs):
+        self.text_started()
+        super().handle_data(*args, **kwargs)
+
+    def handle_charref(self, *args, **kwargs):
+        self.text_started()
+        super().handle_charref(*args, **kwargs)
+
+    def handle_entityref(self, *args, **kwargs):
+        self.text_started()
+        super().handle_entityref(*args, **kwargs)
+
+    def handle_starttag(self, *args, **kwargs):
+        self.text_ended()
+        return super().handle_starttag(*args, **kwargs)
+
+    def handle_endtag(self, *args, **kwargs):
+        self.text_ended()
+        super().handle_endtag(*args, **kwargs)
+
+    def handle_comment(self, *args, **kwargs):
+        self.text_ended()
+        super().handle_comment(*args, **kwargs)
+
+    def handle_decl(self, *args, **kwargs):
+        self.text_ended()
+        super().handle_decl(*args, **kwargs)
+
+    def unknown_decl(self, data):
+        self.text_ended()
+        if data.upper().startswith('CDATA['):
+            # The CData node holds what's between <![CDATA[ and ]]>
+            start = self.source_offset() + len('<![CDATA[')
+            self.soup.builder.spans.append(
+                (start, start + len(data) - len('CDATA[')))
+        super().unknown_decl(data)
+
+    def handle_pi(self, *args, **kwargs):
+        self.text_ended()
+        super().handle_pi(*args, **kwargs)
+
+
+class _SpanTreeBuilder(HTMLParserTreeBuilder):
+    """The html.parser tree builder, recording the source span of each run
+    of text in the order the text nodes are made."""
+
+    def feed(self, markup, *args, **kwargs):
+        self.line_starts = [0] + [match.end()
+                                  for match in re.finditer('\n', markup)]
+        self.spans: List[Span] = []
+        self.start: Optional[int] = None
+        super().feed(markup, _SpanParser)
+        if self.start is not None:
+            self.spans.append((self.start, len(markup)))
+
+
+def parse_element(xml: str, patch=False) -> Tuple[BeautifulSoup,
+                                                    Optional[Dict[int, Span]]]:
+    """Return xml parsed with html.parser, so that it doesn't try to fix the
+    structure. If patch is set, also return the span of xml each text node
+    came from, by id(), or None if they couldn't be matched up."""
+    if not patch:
+        return BeautifulSoup(xml, 'html.parser'), None
+    builder = _SpanTreeBuilder()
+    soup = BeautifulSoup(xml, builder=builder)
+    nodes = [node for node in soup.descendants
+             if isinstance(node, NavigableString) and
+             (isinstance(node, CData) or
+              not isinstance(node, PreformattedString))]
+    if len(nodes) != len(builder.spans):
+        return soup, None
+    return soup, {id(node): span for node, span in zip(nodes, builder.spans)}
+
+
+def unescape_offsets(source: str) -> Tuple[str, Sequence[int]]:
+    """Return source with character references replaced, and the offset in
+    source each character of that came from, followed by len(source)."""
+    pieces: List[str] = []
+    offsets: List[int] = []
+    position = 0
+    for match in ENTITY_RE.finditer(source):
+        pieces.append(source[position:match.start()])
+        offsets.extend(range(position, match.start()))
+        character = html.unescape(match.group())
+        pieces.append(character)
+        offsets.extend([match.start()] * len(character))
+        position = match.end()
+    pieces.append(source[position:])
+    offsets.extend(range(position, len(source) + 1))
+    return ''.join(pieces), offsets
+
+
+def _changes(old: str, new: str) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield the start and end in old and in new of each part which differs,
+    in order. Tokens are compared first, as comparing every character of
+    long texts is slow."""
+    old_pieces = parse.TOKEN_SPLIT_RE.split(old)
+    new_pieces = parse.TOKEN_SPLIT_RE.split(new)
+    old_starts = [0, *itertools.accumulate(map(len, old_pieces))]
+    new_starts = [0, *itertools.accumulate(map(len, new_pieces))]
+    if len(old_pieces) == len(new_pieces):
+        # Most corrections replace one token with another
+        opcodes = [('replace', k, k + 1, k, k + 1)
+                   for k, (a, b) in enumerate(zip(old_pieces, new_pieces))
+                   if a != b]
     else:
-        fixed = progress_iterator([cleanup(t, **kwargs)
-                                   for t in text_iterator])
+        opcodes = difflib.SequenceMatcher(
+            None, old_pieces, new_pieces).get_opcodes()
+    for tag, a1, a2, b1, b2 in opcodes:
+        if tag == 'equal':
+            continue
+        i1, i2, j1, j2 = old_starts[a1], old_starts[a2], \
+            new_starts[b1], new_starts[b2]
+        while i1 < i2 and j1 < j2 and old[i1] == new[j1]:
+            i1, j1 = i1 + 1, j1 + 1
+        while i1 < i2 and j1 < j2 and old[i2 - 1] == new[j2 - 1]:
+            i2, j2 = i2 - 1, j2 - 1
+        yield i1, i2, j1, j2
+
+
+def source_edits(source: str, text: str,
+                 changes: Iterable[Tuple[int, int, str, str]],
+                 cdata=False) -> Optional[List[Tuple[int, int, str, str]]]:
+    """Return changes to text, (start, end, replacement, kind), as changes
+    to source, the markup for text, with replacement markup. They are
+    widened so as not to split a character reference, and combined if that
+    makes them touch. Return None if source doesn't decode to text.
+
+    With cdata, source is the inside of a CDATA section, which is text as
+    it is."""
+    if cdata:
+        if source != text:
+            return None
+        return [(start, end, replacement, kind)
+                for start, end, replacement, kind in changes]
+    if '&' in source:
+        decoded, offsets = unescape_offsets(source)
+    else:
+        decoded, offsets = source, range(len(source) + 1)
+    if decoded != text:
+        return None
+
+    # [start, end, [(start, end, replacement, kind), ...]] in text
+    groups: List[List[Any]] = []
+    for change in changes:
+        start, end = change[0], change[1]
+        while start and offsets[start] == offsets[start - 1]:
+            start -= 1
+        while end < len(text) and offsets[end] == offsets[end - 1]:
+            end += 1
+        if groups and start <= groups[-1][1]:
+            groups[-1][1] = max(end, groups[-1][1])
+            groups[-1][2].append(change)
+        else:
+            groups.append([start, end, [change]])
+
+    result = []
+    for start, end, members in groups:
+        pieces = []
+        position = start
+        for change_start, change_end, replacement, _kind in members:
+            pieces.append(text[position:change_start])
+            pieces.append(replacement)
+            position = change_end
+        pieces.append(text[position:end])
+        kinds = sorted({kind for member in members
+                        for kind in member[3].split('+') if kind})
+        result.append((offsets[start], offsets[end], escape(''.join(pieces)),
+                       '+'.join(kinds)))
+    return result
+
+
+def patch_text(source: str, old: str, new: str,
+               cdata=False) -> List[Tuple[int, int, str]]:
+    """Return the start and end in source, the markup for the text old, of
+    each part which needs replacing to make it new, and its replacement.
+    cdata is as for source_edits().
+
+    Parts are widened so as not to split a character reference. If source
+    doesn't decode to old it is replaced entirely."""
+    changes = source_edits(source, old, (
+        (i1, i2, new[j1:j2], '') for i1, i2, j1, j2 in _changes(old, new)),
+        cdata)
+    if changes is None:
+        return [(0, len(source), new if cdata else escape(new))]
+    return [(start, end, replacement)
+            for start, end, replacement, _kind in changes]
+
+
+def write_element(xml: str, soup: BeautifulSoup,
+                  nodes: List[NavigableString], fixed: Dict[str, str],
+                  spans: Optional[Dict[int, Span]] = None) -> str:
+    """Return the document xml was parsed into as soup, with the text of each
+    of nodes which is in fixed replaced. If the spans of the nodes are
+    known, only the changed characters are patched into a copy of xml.
+    Otherwise soup is modified and serialized again."""
+    if spans is not None and not all(id(node) in spans for node in nodes):
+        spans = None
+    if spans is None:
+        for node in nodes:
+            text = str(node)
+            if text in fixed:
+                node.replace_with(fixed[text])
+        return str(soup)
+
+    patches = []
+    # Repeated text is patched the same way each time
+    patched: Dict[Tuple[str, str, bool], List[Tuple[int, int, str]]] = {}
+    for node in nodes:
+        old = str(node)
+        new = fixed.get(old, old)
+        if new != old:
+            start, end = spans[id(node)]
+            source = xml[start:end]
+            cdata = isinstance(node, CData)
+            if (source, old, cdata) not in patched:
+                patched[source, old, cdata] = patch_text(source, old, new,
+                                                         cdata)
+            patches.extend((start + offset, start + stop, replacement)
+                           for offset, stop, replacement
+                           in patched[source, old, cdata])
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('patches', len(patches))
+
+    pieces = []
+    position = 0
+    for start, end, replacement in sorted(patches):
+        pieces.append(xml[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(xml[position:])
+    return ''.join(pieces)
+
+
+def clean_element(xml: str, selector=':root',
+                  progress_iterator=None, num_processes=1,
+                  batches_per_process=4, patch=False,
+                  vocabulary_min_count=None, **kwargs) -> str:
+    """Return xml with the selected elements cleaned up. kwargs are passed to
+    text_cleanup.raw.cleanup()
+
+    If patch is set, the corrections are patched into a copy of xml instead
+    of writing out the whole parsed document again, so everything else is
+    left exactly as it was. With vocabulary_min_count, the vocabulary is
+    text_cleanup.raw.document_vocabulary() of all of the selected text."""
+    with stats.timer('parse'):
+        soup, spans = parse_element(xml, patch)
+    with stats.timer('select'):
+        nodes = select_strings(soup, selector, **kwargs)
+    if vocabulary_min_count is not None:
+        kwargs['vocabulary'] = raw.document_vocabulary(
+            map(str, nodes), vocabulary_min_count)
+
+    # Repeated text like headers and page numbers only needs cleaning once
+    texts = list(dict.fromkeys(map(str, nodes)))
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('nodes', len(nodes))
+        stats.ACTIVE.count('nodes.unique', len(texts))
+
+    fixed = clean_texts(texts, progress_iterator, num_processes,
+                        batches_per_process, **kwargs)
+
+    with stats.timer('serialize'):
+        return write_element(xml, soup, nodes, fixed, spans)
+
+
+def find_edits(xml: str, selector=':root', progress_iterator=None,
+               num_processes=1, batches_per_process=4,
+               vocabulary_min_count=None, **kwargs) -> List[edits.Edit]:
+    """Return the edits clean_element(xml, selector, patch=True) makes, in
+    order, with offsets into xml and replacements as markup. kwargs are
+    passed to text_cleanup.raw.cleanup()"""
+    with stats.timer('parse'):
+        soup, spans = parse_element(xml, patch=True)
+    if spans is None:
+        raise ValueError("Couldn't find where the text nodes are in xml")
+    with stats.timer('select'):
+        nodes = select_strings(soup, selector, **kwargs)
+    if vocabulary_min_count is not None:
+        kwargs['vocabulary'] = raw.document_vocabulary(
+            map(str, nodes), vocabulary_min_count)
+
+    texts = list(dict.fromkeys(map(str, nodes)))
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('nodes', len(nodes))
+        stats.ACTIVE.count('nodes.unique', len(texts))
+
+    found = clean_texts(texts, progress_iterator, num_processes,
+                        batches_per_process, function=raw.find_edits_batch,
+                        **kwargs)
+
+    result: List[edits.Edit] = []
+    for node in nodes:
+        text = str(node)
+        if not found[text]:
+            continue
+        if id(node) not in spans:
+            raise ValueError("Couldn't find where the text nodes are in xml")
+        start, end = spans[id(node)]
+        source = xml[start:end]
+        cdata = isinstance(node, CData)
+        changes = source_edits(source, text, (
+            (edit_start, edit_end, replacement, kind)
+            for edit_start, edit_end, _original, replacement, kind
+            in found[text]), cdata)
+        if changes is None:
+            # Not what html.parser would make of it, so replace the lot
+            kinds = {kind for edit in found[text] for kind in
+                     edit[4].split('+')}
+            replacement = edits.apply_edits(text, found[text])
+            changes = [(0, len(source),
+                        replacement if cdata else escape(replacement),
+                        '+'.join(sorted(kinds)))]
+        result.extend((start + change_start, start + change_end,
+                       xml[start + change_start:start + change_end],
+                       replacement, kind)
+                      for change_start, change_end, replacement, kind
+                      in changes)
+    result.sort()
+    return result
+
+
+def _clean_parallel(texts: List[str], progress_iterator, num_processes: int,
+                    batches_per_process: int, function,
+                    **kwargs) -> Dict[str, Any]:
+    """Return a dict from each of texts to what function returns for it,
+    calling it on batches in a pool of worker processes."""
+    batches = make_batches(texts, num_processes * batches_per_process)
+    record = stats.ACTIVE
+    # Workers share one mmap'd copy of the dictionary
+    words = raw.WORDS.compiled()
+    with multiprocessing.Pool(num_processes, initializer=raw.load_words,
+                              initargs=(words,)) as pool:
+        if record is None:
+            futures = [
+                pool.apply_async(function, (batch,), kwargs)
+                for batch in batches]
+        else:
+            # Workers collect their own statistics to send back
+            futures = [
+                pool.apply_async(stats.collecting,
+                                 (function, (batch,), kwargs,
+                                  record.timing))
+                for batch in batches]
+        fixed: Dict[str, Any] = {}
+        for batch, future in zip(batches, progress_iterator(futures)):
+            result = future.get()
+            if record is not None:
+                result, collected = result
+                record.merge(collected)
+            fixed.update(zip(batch, result))
+    return fixed
+
+
+class _MatchTranslator(GenericTranslator):
+    """Translate CSS selectors to XPath matching the context element itself.
+
+    Combinators look backwards, at ancestors and preceding siblings, so an
+    element can be matched as soon as it starts in a streamed document.
+    Element names ignore namespaces, as they do in clean_element()."""
+
+    def xpath_element(self, selector):
+        if not selector.element or selector.namespace:
+            return super().xpath_element(selector)
+        xpath = self.xpathexpr_cls(element='*')
+        name = self.xpath_literal(selector.element.lower())
+        return xpath.add_condition(f'local-name() = {name}')
+
+    def xpath_descendant_combinator(self, left, right):
+        return right.add_condition(f'ancestor::{left}')
+
+    def xpath_child_combinator(self, left, right):
+        return right.add_condition(f'parent::{left}')
+
+    def xpath_direct_adjacent_combinator(self, left, right):
+        return right.add_condition(f'preceding-sibling::*[1][self::{left}]')
+
+    def xpath_indirect_adjacent_combinator(self, left, right):
+        return right.add_condition(f'preceding-sibling::{left}')
+
+
+def selector_matcher(selector: str) -> etree.XPath:
+    """Return an XPath which is true when applied to a selected element."""
+    return etree.XPath(_MatchTranslator().css_to_xpath(selector, 'self::'))
+
+
+class _StreamWriter:
+    """Write parser events back out as XML, cleaning the selected text."""
+
+    def __init__(self, fout: TextIO, matcher: etree.XPath,
+                 kwargs: Dict[str, Any]) -> None:
+        self.fout = fout
+        self.matcher = matcher
+        self.kwargs = kwargs
+        # For each open element:
+        #   [element, selected, start tag still open, last child, name]
+        self.stack: List[List[Any]] = []
+
+    def text(self, text: Optional[str], selected: bool) -> None:
+        if text:
+            if selected and not text.isspace():
+                text = cleanup(text, **self.kwargs)
+            self.fout.write(escape(text))
+
+    def content(self) -> None:
+        """Write everything in the current element up to the next node."""
+        if not self.stack:
+            return
+        frame = self.stack[-1]
+        element, selected, open_tag, last_child, _name = frame
+        if open_tag:
+            self.fout.write('>')
+            self.text(element.text, selected)
+            frame[2] = False
+        elif last_child is not None:
+            self.text(last_child.tail, selected)
+
+    def start(self, element) -> None:
+        self.content()
+        if self.stack:
+            self.stack[-1][3] = element
+            parent_nsmap = self.stack[-1][0].nsmap
+            selected = self.stack[-1][1]
+        else:
+            parent_nsmap = {}
+            selected = False
+        selected = selected or self.matcher(element)
+        nsmap = element.nsmap
+        prefixes = {uri: prefix for prefix, uri in nsmap.items()}
+        prefixes['http://www.w3.org/XML/1998/namespace'] = 'xml'
+
+        def qname(name):
+            qualified = etree.QName(name)
+            prefix = prefixes.get(qualified.namespace)
+            if prefix is None:
+                return qualified.localname
+            return f'{prefix}:{qualified.localname}'
+
+        parts = [qname(element.tag)]
+        for prefix, uri in nsmap.items():
+            if parent_nsmap.get(prefix) != uri:
+                name = f'xmlns:{prefix}' if prefix else 'xmlns'
+                parts.append(f'{name}={quoteattr(uri)}')
+        for name, value in element.attrib.items():
+            parts.append(f'{qname(name)}={quoteattr(value)}')
+        self.fout.write('<' + ' '.join(parts))
+        self.stack.append([element, selected, True, None, parts[0]])
+
+    def end(self, element) -> None:
+        if self.stack[-1][2] and not element.text:
+            self.fout.write('/>')
+        else:
+            self.content()
+            self.fout.write(f'</{self.stack[-1][4]}>')
+        self.stack.pop()
+        if not self.stack:
+            self.fout.write('\n')
+        # Everything inside has been written, so free it. The element's own
+        # tail is still to come, but the siblings before it are done too.
+        for child in list(element):
+            element.remove(child)
+        element.text = None
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+    def other(self, node) -> None:
+        """Write a comment or processing instruction."""
+        self.content()
+        if self.stack:
+            self.stack[-1][3] = node
+        self.fout.write(etree.tostring(node, with_tail=False,
+                                       encoding='unicode'))
+        if not self.stack:
+            self.fout.write('\n')
+
+
+def clean_stream(fin: TextIO, fout: TextIO, selector=':root',
+                 chunk_size=2**16, **kwargs) -> None:
+    """Write xml from fin to fout with the selected elements cleaned up.
+
+    Unlike clean_element(), the document is parsed incrementally and written
+    out as it is read, so memory doesn't grow with its size. The input must
+    be well-formed XML, and selectors can only depend on ancestors and
+    preceding siblings. kwargs are passed to text_cleanup.raw.cleanup(),
+    but not vocabulary_min_count, which needs the whole document first."""
+    if kwargs.get('vocabulary_min_count') is not None:
+        raise ValueError("vocabulary_min_count can't be used when streaming "
+                         "xml")
+    parser = etree.XMLPullParser(
+        events=('start', 'end', 'comment', 'pi'), remove_blank_text=False)
+    writer = _StreamWriter(fout, selector_matcher(selector), kwargs)
+    started = False
 
-    for node, new in zip(nodes, fixed):
-        node.replace_with(new)
-        # Maybe show small diff here?
+    def handle_events():
+        nonlocal started
+        for event, node in parser.read_events():
+            if not started:
+                started = True
+                docinfo = node.getroottree().docinfo
+                if docinfo.doctype:
+                    fout.write(docinfo.doctype + '\n')
+            getattr(writer, event if event in ('start', 'end') else 'other')(
+                node)
 
-    return str(soup)
+    data = fin.read(chunk_size)
+    while data.startswith('<?xml') and '?>' not in data:
+        more = fin.read(chunk_size)
+        if not more:
+            break
+        data += more
+    if data.startswith('<?xml'):
+        declaration, _, data = data.partition('?>')
+        fout.write(declaration + '?>\n')
+        # lxml rejects encoding declarations in text that's already decoded
+        data = data.lstrip()
+    parser.feed(data)
+    handle_events()
+    for data in iter(lambda: fin.read(chunk_size), ''):
+        parser.feed(data)
+        handle_events()
+    parser.close()
+    handle_events()
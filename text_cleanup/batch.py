@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Cleanup whole directory trees, skipping files which haven't changed.
+
+A manifest in the destination records a key for each file cleaned, made
+from its content, the cleanup options and the dictionary version. Files
+with the same key next time are left alone.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+from typing import Any, Dict, Iterator, Optional
+
+from text_cleanup import epub, raw, stats, XML
+
+MANIFEST = '.text-cleanup-manifest.json'
+XML_SUFFIXES = ('.htm', '.html', '.xhtml', '.xml')
+# Save the manifest this often, so an interrupted run loses little.
+SAVE_EVERY = 100
+
+
+def file_kind(path: str) -> Optional[str]:
+    """Return 'epub', 'xml' or 'raw' depending on the suffix of path, or None
+    if it isn't something to clean."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.epub':
+        return 'epub'
+    if suffix in XML_SUFFIXES:
+        return 'xml'
+    if suffix == '.txt':
+        return 'raw'
+    return None
+
+
+def find_files(source: str, destination: str) -> Iterator[str]:
+    """Yield the paths relative to source of the files to clean, in order.
+    The destination is skipped if it is inside source."""
+    destination = os.path.abspath(destination)
+    for root, dirs, files in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if
+                         os.path.abspath(os.path.join(root, d)) != destination)
+        for name in sorted(files):
+            if file_kind(name) is not None:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source)
+
+
+def content_key(data: bytes, options: Dict[str, Any],
+                fingerprint: int) -> str:
+    """Return a key which changes along with data, options or the
+    dictionary fingerprint."""
+    digest = hashlib.sha256(data)
+    # Models and such are identified by their repr()
+    digest.update(json.dumps(options, sort_keys=True,
+                             default=repr).encode('utf-8'))
+    digest.update(str(fingerprint).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_manifest(filename: str) -> Dict[str, str]:
+    """Return the manifest in filename, or an empty one."""
+    try:
+        with open(filename, encoding='utf-8') as fin:
+            return json.load(fin)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(filename: str, manifest: Dict[str, str]) -> None:
+    """Write manifest to filename atomically."""
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w', encoding='utf-8') as fout:
+        json.dump(manifest, fout, indent=0, sort_keys=True)
+    os.replace(tmpname, filename)
+
+
+def clean_file(source: str, destination: str, selector=':root',
+               stream=False, **kwargs) -> None:
+    """Write a cleaned up copy of source to destination, according to its
+    kind. kwargs are passed to text_cleanup.raw.cleanup()"""
+    kind = file_kind(source)
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    tmpname = destination + '.tmp'
+    if kind == 'epub':
+        epub.clean_epub(source, tmpname, selector, stream=stream, **kwargs)
+    else:
+        with open(source, encoding='utf-8') as fin, \
+                open(tmpname, 'w', encoding='utf-8') as fout:
+            if kind == 'xml' and stream:
+                XML.clean_stream(fin, fout, selector, **kwargs)
+            elif kind == 'xml':
+                fout.write(XML.clean_element(fin.read(), selector, **kwargs))
+            elif stream:
+                raw.cleanup_stream(fin, fout, **kwargs)
+            else:
+                fout.write(raw.cleanup(fin.read(), **kwargs))
+    os.replace(tmpname, destination)
+
+
+def clean_tree(source: str, destination: str, selector=':root',
+               progress_iterator=None, num_processes=1, stream=False,
+               force=False, **kwargs) -> Dict[str, int]:
+    """Write cleaned up copies of the text, XML and EPUB files under source
+    to the same places under destination.
+
+    Files unchanged since the last run, with the same options and
+    dictionary, are skipped unless force is set. Return the number of files
+    cleaned and skipped. kwargs are passed to text_cleanup.raw.cleanup()"""
+    if stream and kwargs.get('vocabulary_min_count') is not None:
+        # XML.clean_stream() can't count a document before cleaning it
+        raise ValueError("vocabulary_min_count can't be used with stream")
+    if progress_iterator is None:
+        progress_iterator = lambda x: x  # noqa: E731
+
+    manifest_name = os.path.join(destination, MANIFEST)
+    previous = {} if force else load_manifest(manifest_name)
+    options = {k: v for k, v in kwargs.items() if k != 'cache'}
+    options['selector'] = selector
+    # Streaming cleans a chunk or element at a time, which can differ
+    options['stream'] = stream
+    fingerprint = raw.WORDS.fingerprint()
+
+    manifest: Dict[str, str] = {}
+    jobs = []
+    for name in find_files(source, destination):
+        with open(os.path.join(source, name), 'rb') as fin:
+            key = content_key(fin.read(), options, fingerprint)
+        if previous.get(name) == key and \
+                os.path.exists(os.path.join(destination, name)):
+            manifest[name] = key
+        else:
+            jobs.append((name, key))
+    skipped = len(manifest)
+
+    def done(count, name, key):
+        manifest[name] = key
+        if not count % SAVE_EVERY:
+            save_manifest(manifest_name, manifest)
+
+    try:
+        if num_processes > 1:
+            record = stats.ACTIVE
+            # Workers share one mmap'd copy of the dictionary
+            words = raw.WORDS.compiled()
+            with multiprocessing.Pool(num_processes,
+                                      initializer=raw.load_words,
+                                      initargs=(words,)) as pool:
+                futures = []
+                for name, _key in jobs:
+                    args = (os.path.join(source, name),
+                            os.path.join(destination, name), selector, stream)
+                    if record is None:
+                        future = pool.apply_async(clean_file, args, kwargs)
+                    else:
+                        # Workers collect their own statistics to send back
+                        future = pool.apply_async(
+                            stats.collecting,
+                            (clean_file, args, kwargs, record.timing))
+                    futures.append(future)
+                for count, ((name, key), future) in enumerate(
+                        zip(jobs, progress_iterator(futures)), 1):
+                    result = future.get()
+                    if record is not None:
+                        record.merge(result[1])
+                    done(count, name, key)
+        else:
+            for count, (name, key) in enumerate(progress_iterator(jobs), 1):
+                clean_file(os.path.join(source, name),
+                           os.path.join(destination, name), selector, stream,
+                           **kwargs)
+                done(count, name, key)
+    finally:
+        save_manifest(manifest_name, manifest)
+    return dict(cleaned=len(jobs), skipped=skipped)
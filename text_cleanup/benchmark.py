@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark cleanup on synthetic OCR noise."""
+
+import io
+import multiprocessing
+import random
+import resource
+import string
+import time
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from text_cleanup import parse, raw, stats, XML
+
+# Relative frequency of each kind of noise, mirroring the errors that
+# raw.one_error() knows how to fix.
+NOISE_WEIGHTS = {
+    'confusion': 4,   # A letter swapped within one of raw.ERROR_GROUPS
+    'deletion': 2,    # A dropped letter
+    'insertion': 1,   # An extra letter
+    'space': 2,       # A missing space
+}
+
+
+def corrupt(word: str, kind: str, rng: random.Random) -> str:
+    """Return word with one error of the given kind, except 'space'."""
+    if kind == 'confusion':
+        positions = [i for i, letter in enumerate(word)
+                     if len(raw.PREFERRED_ERRORS.get(letter, '')) > 1]
+        if positions:
+            i = rng.choice(positions)
+            choices = raw.PREFERRED_ERRORS[word[i]].replace(word[i], '')
+            return word[:i] + rng.choice(choices) + word[i+1:]
+        kind = 'deletion'
+    if kind == 'deletion' and len(word) > 1:
+        i = rng.randrange(len(word))
+        return word[:i] + word[i+1:]
+    i = rng.randrange(len(word) + 1)
+    return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+
+
+def add_noise(words: Sequence[str], rate: float, rng: random.Random,
+              weights: Optional[Dict[str, float]] = None) -> List[str]:
+    """Return words with roughly rate of them corrupted."""
+    weights = weights or NOISE_WEIGHTS
+    kinds = list(weights)
+    noisy: List[str] = []
+    joined = False
+    for word in words:
+        if joined:
+            noisy[-1] += word
+            joined = False
+            continue
+        if rng.random() < rate:
+            kind = rng.choices(kinds, [weights[k] for k in kinds])[0]
+            if kind == 'space':
+                joined = True
+            else:
+                word = corrupt(word, kind, rng)
+        noisy.append(word)
+    return noisy
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """Return the noise weights in text, e.g. 'confusion=4,space=1'. Kinds
+    which aren't given get no noise."""
+    weights = {}
+    for item in text.split(','):
+        kind, _equals, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in NOISE_WEIGHTS:
+            raise ValueError(f"Unknown kind of noise {kind!r}, not one of "
+                             f"{', '.join(NOISE_WEIGHTS)}")
+        try:
+            weights[kind] = float(weight)
+        except ValueError:
+            raise ValueError(f"Bad weight for {kind}: {weight!r}") from None
+    if not any(weights.values()):
+        raise ValueError("At least one weight must be positive")
+    return weights
+
+
+def make_corpus(size: int, source: Sequence[str], rate: float,
+                rng: random.Random,
+                weights: Optional[Dict[str, float]] = None) -> str:
+    """Return size words drawn from source with noise added."""
+    return ' '.join(add_noise(rng.choices(source, k=size), rate, rng,
+                              weights))
+
+
+def percentiles(values: List[float],
+                points=(50, 90, 99, 100)) -> Dict[str, float]:
+    """Return the given percentiles of values."""
+    ordered = sorted(values) or [0.0]
+    return {f'p{p}': ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+            for p in points}
+
+
+def peak_memory_mb() -> Dict[str, float]:
+    """Return the peak RSS so far of this process and its children. It only
+    measures one benchmark if that is run in a process of its own, by
+    isolated()."""
+    scale = 1024  # Both are in KiB on Linux
+    # ru_maxrss carries over from the parent through fork and exec, but
+    # the high water mark in /proc starts again with the new program.
+    try:
+        with open('/proc/self/status') as fin:
+            own = next(int(line.split()[1]) for line in fin
+                       if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'self': own / scale,
+        'children':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def isolated(function, text: str, warmup: str, **kwargs) -> Dict[str, Any]:
+    """Return function(text, **kwargs) run in a new process, so that its
+    peak_memory_mb() is its own. warmup is cleaned first there, to build
+    anything loaded lazily, with the kwargs besides num_processes."""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_isolated, args=(sender, raw.WORDS.compiled(), function,
+                                text, warmup, kwargs))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = RuntimeError(
+            f"Benchmark process exited with {process.exitcode}")
+    process.join()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def _isolated(sender, words: str, function, text: str, warmup: str,
+              kwargs: Dict[str, Any]) -> None:
+    raw.load_words(words)
+    try:
+        options = {k: v for k, v in kwargs.items() if k != 'num_processes'}
+        raw.cleanup(warmup, **options)
+        result = function(text, **kwargs)
+    except Exception as error:  # pylint: disable=broad-except
+        result = error
+    sender.send(result)
+
+
+def bench_raw(text: str, num_processes=1, **kwargs) -> Dict[str, Any]:
+    """Return throughput and latency measurements of raw.cleanup(text), or
+    of raw.cleanup_parallel() if num_processes > 1. Latency is only
+    measured in a single process."""
+    tokens = parse.TOKEN_RE.findall(text.replace('- ', '-'))
+    with stats.collect() as collected:
+        start = time.perf_counter()
+        if num_processes > 1:
+            raw.cleanup_parallel(io.StringIO(text), io.StringIO(),
+                                 num_processes, **kwargs)
+        else:
+            raw.cleanup(text, **kwargs)
+        elapsed = time.perf_counter() - start
+
+    latencies = []
+    if num_processes <= 1:
+        for token in tokens:
+            start = time.perf_counter()
+            raw.correct_misspelling(token, **kwargs)
+            latencies.append(time.perf_counter() - start)
+
+    return {
+        'tokens': len(tokens),
+        'num_processes': num_processes,
+        'seconds': elapsed,
+        'tokens_per_second': len(tokens) / elapsed if elapsed else None,
+        'latency_seconds': percentiles(latencies) if latencies else None,
+        'candidates_per_token':
+            collected.counts['candidates'] / max(1, len(tokens)),
+        'peak_memory_mb': peak_memory_mb(),
+    }
+
+
+def bench_xml(text: str, num_processes=1, paragraph=50,
+              **kwargs) -> Dict[str, Any]:
+    """Return throughput measurements of XML.clean_element on text split
+    into paragraphs of paragraph words."""
+    words = text.split()
+    paragraphs = (' '.join(words[i:i + paragraph])
+                  for i in range(0, len(words), paragraph))
+    xml = '<body>{}</body>'.format(
+        ''.join(f'<p>{p}</p>' for p in paragraphs))
+    tokens = len(parse.TOKEN_RE.findall(text.replace('- ', '-')))
+    with stats.collect() as collected:
+        start = time.perf_counter()
+        XML.clean_element(xml, num_processes=num_processes, **kwargs)
+        elapsed = time.perf_counter() - start
+    return {
+        'tokens': tokens,
+        'num_processes': num_processes,
+        'seconds': elapsed,
+        'tokens_per_second': tokens / elapsed if elapsed else None,
+        'candidates_per_token':
+            collected.counts['candidates'] / max(1, tokens),
+        'peak_memory_mb': peak_memory_mb(),
+    }
+
+
+def run(sizes: Sequence[int] = (1000,), num_processes: Sequence[int] = (1,),
+        rate: float = 0.1, seed: int = 0,
+        source: Optional[Sequence[str]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        **kwargs) -> Dict[str, Any]:
+    """Return a report of benchmarks over corpora of each size.
+
+    source defaults to the lowercase words of the dictionary, and weights to
+    NOISE_WEIGHTS. Raw text and XML are each cleaned with every number of
+    processes, each in a process of its own. kwargs are passed to
+    text_cleanup.raw.cleanup()"""
+    start = time.perf_counter()
+    raw.load_words()
+    load_seconds = time.perf_counter() - start
+    if source is None:
+        source = sorted(w for w in raw.WORDS if w.islower())
+    # Build anything else loaded lazily, like the segmenter or index.
+    warmup = make_corpus(100, source, 0.5, random.Random(seed), weights)
+    start = time.perf_counter()
+    raw.cleanup(warmup, **kwargs)
+    warmup_seconds = time.perf_counter() - start
+    results = []
+    for size in sizes:
+        text = make_corpus(size, source, rate, random.Random(seed), weights)
+        results.append({
+            'size': size,
+            'raw': [isolated(bench_raw, text, warmup, num_processes=n,
+                             **kwargs) for n in num_processes],
+            'xml': [isolated(bench_xml, text, warmup, num_processes=n,
+                             **kwargs) for n in num_processes],
+        })
+    options = {k: v for k, v in kwargs.items() if k != 'cache'}
+    return {
+        'seed': seed,
+        'noise_rate': rate,
+        'noise_weights': weights or NOISE_WEIGHTS,
+        'options': options,
+        'dictionary_load_seconds': load_seconds,
+        'warmup_seconds': warmup_seconds,
+        'results': results,
+    }
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Caches for correction results, shareable between processes."""
+
+import collections
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Hashable, Iterator, Optional
+
+
+class CorrectionCache:
+    """Bounded LRU memo of correct_misspelling() results."""
+
+    def __init__(self, maxsize: int = 2**16) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: 'collections.OrderedDict[Hashable, Any]' = \
+            collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None."""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache value for key, evicting the least recently used entry."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self) -> Dict[str, int]:
+        """Return the hit and miss counters along with the size."""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        size=len(self._data), maxsize=self.maxsize)
+
+
+class DiskCache:
+    """Bounded memo of correct_misspelling() results kept in SQLite, so that
+    later runs can reuse them.
+
+    Give a namespace, such as the dictionary fingerprint, to keep results
+    from different dictionaries apart. Several processes can use the same
+    file at once, but within a run share one DiskCache through a
+    CacheManager rather than opening it in every worker.
+
+    Values are kept as JSON, and lists come back as tuples, like the
+    results of correct_misspelling(). When keys are used is only written
+    out with the next put, every FLUSH_EVERY hits, or on closing."""
+
+    # Check the size after this many puts
+    EVICT_EVERY = 1024
+    # Write out when keys were used after this many hits without a put
+    FLUSH_EVERY = 1024
+
+    def __init__(self, filename: str, maxsize: int = 2**20,
+                 namespace: str = '') -> None:
+        self.filename = filename
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        # When each key got since the last flush was used
+        self._used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(filename, timeout=60,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS corrections '
+                         '(key TEXT PRIMARY KEY, value BLOB, used REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS corrections_used '
+                         'ON corrections (used)')
+
+    def _key(self, key: Hashable) -> str:
+        return self.namespace + repr(key)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the statements inside as one transaction."""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None."""
+        skey = self._key(key)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT value FROM corrections WHERE key = ?',
+                (skey,)).fetchone()
+            try:
+                value = json.loads(row[0]) if row is not None else None
+            except ValueError:
+                # Pickled by an earlier version, so put it again
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._used[skey] = time.time()
+            if len(self._used) >= self.FLUSH_EVERY:
+                with self._transaction():
+                    self._flush()
+        return tuple(value) if isinstance(value, list) else value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache value for key, evicting the least recently used entries
+        every so often."""
+        with self._lock, self._transaction() as db:
+            self._flush()
+            db.execute(
+                'INSERT OR REPLACE INTO corrections VALUES (?, ?, ?)',
+                (self._key(key), json.dumps(value), time.time()))
+            self._puts += 1
+            if not self._puts % self.EVICT_EVERY:
+                self._evict()
+
+    def _flush(self) -> None:
+        """Write out when the keys got since the last flush were used."""
+        if self._used:
+            self._db.executemany(
+                'UPDATE corrections SET used = ? WHERE key = ?',
+                [(used, key) for key, used in self._used.items()])
+            self._used.clear()
+
+    def _evict(self) -> None:
+        size = self._db.execute('SELECT count(*) FROM corrections').fetchone()
+        excess = size[0] - self.maxsize
+        if excess > 0:
+            self._db.execute(
+                'DELETE FROM corrections WHERE key IN (SELECT key FROM '
+                'corrections ORDER BY used LIMIT ?)', (excess,))
+
+    def clear(self) -> None:
+        """Forget everything, in every namespace."""
+        with self._lock:
+            self._used.clear()
+            self._db.execute('DELETE FROM corrections')
+            self._db.execute('VACUUM')
+
+    def close(self) -> None:
+        """Evict down to maxsize and close the database."""
+        with self._lock:
+            with self._transaction():
+                self._flush()
+                self._evict()
+            self._db.close()
+
+    def info(self) -> Dict[str, int]:
+        """Return the hit and miss counters along with the size."""
+        with self._lock:
+            size = self._db.execute(
+                'SELECT count(*) FROM corrections').fetchone()[0]
+            return dict(hits=self.hits, misses=self.misses,
+                        size=size, maxsize=self.maxsize)
+
+
+class CacheManager(BaseManager):
+    """Serve caches from a separate process so that pool workers share them.
+
+    >>> with CacheManager() as manager:
+    ...     cache = manager.CorrectionCache(1000)
+    """
+
+
+CacheManager.register('CorrectionCache', CorrectionCache)
+CacheManager.register('DiskCache', DiskCache)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Learn which characters OCR confuses, to try the likeliest fixes first.
+
+A model is trained on (OCR, ground truth) pairs of lines. Each pair is
+aligned character by character and every substitution, deletion and
+insertion the correction needs is counted, along with how often each OCR
+character was seen. One-error candidates are then ranked by how likely
+their edit is given the characters in the word.
+"""
+
+import collections
+import hashlib
+import json
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Alignment operations, named after what the correction does to the OCR
+MATCH = 'match'
+SUBSTITUTION = 'substitution'
+DELETION = 'deletion'
+INSERTION = 'insertion'
+
+Edit = Tuple[str, str, str]  # operation, OCR character, true character
+
+# Lines longer than this aren't aligned, to bound the quadratic cost
+MAX_LINE_LENGTH = 1000
+
+
+def align(ocr: str, truth: str) -> List[Edit]:
+    """Return the fewest edits turning ocr into truth, in order."""
+    rows, cols = len(ocr) + 1, len(truth) + 1
+    cost = [[0] * cols for _ in range(rows)]
+    for i in range(rows):
+        cost[i][0] = i
+    for j in range(cols):
+        cost[0][j] = j
+    for i in range(1, rows):
+        for j in range(1, cols):
+            cost[i][j] = min(
+                cost[i-1][j-1] + (ocr[i-1] != truth[j-1]),
+                cost[i-1][j] + 1,
+                cost[i][j-1] + 1)
+
+    edits: List[Edit] = []
+    i, j = len(ocr), len(truth)
+    while i or j:
+        if i and j and cost[i][j] == cost[i-1][j-1] + (ocr[i-1] != truth[j-1]):
+            operation = MATCH if ocr[i-1] == truth[j-1] else SUBSTITUTION
+            edits.append((operation, ocr[i-1], truth[j-1]))
+            i, j = i - 1, j - 1
+        elif i and cost[i][j] == cost[i-1][j] + 1:
+            edits.append((DELETION, ocr[i-1], ''))
+            i -= 1
+        else:
+            edits.append((INSERTION, '', truth[j-1]))
+            j -= 1
+    return edits[::-1]
+
+
+class ConfusionModel:
+    """Counts of the edits needed to correct OCR output."""
+
+    def __init__(self, counts: Optional[Dict] = None,
+                 min_count: int = 2) -> None:
+        counts = counts or {}
+        self.min_count = min_count
+        self.seen: 'collections.Counter[str]' = collections.Counter(
+            counts.get('seen', {}))
+        self.substitution: Dict[str, 'collections.Counter[str]'] = {
+            ocr: collections.Counter(truths)
+            for ocr, truths in counts.get(SUBSTITUTION, {}).items()}
+        self.deletion: 'collections.Counter[str]' = collections.Counter(
+            counts.get(DELETION, {}))
+        self.insertion: 'collections.Counter[str]' = collections.Counter(
+            counts.get(INSERTION, {}))
+        self._fingerprint: Optional[str] = None
+        self._scores: Optional[Tuple] = None
+
+    def train(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """Count the edits correcting each (OCR, truth) pair of lines."""
+        for ocr, truth in pairs:
+            if max(len(ocr), len(truth)) > MAX_LINE_LENGTH:
+                continue
+            self.seen.update(ocr)
+            for operation, wrong, right in align(ocr, truth):
+                if operation == SUBSTITUTION:
+                    self.substitution.setdefault(
+                        wrong, collections.Counter())[right] += 1
+                elif operation == DELETION:
+                    self.deletion[wrong] += 1
+                elif operation == INSERTION:
+                    self.insertion[right] += 1
+        self._fingerprint = None
+        self._scores = None
+
+    def as_dict(self) -> Dict:
+        """Return the counts as plain dicts."""
+        return {
+            'seen': dict(self.seen),
+            SUBSTITUTION: {ocr: dict(truths)
+                           for ocr, truths in self.substitution.items()},
+            DELETION: dict(self.deletion),
+            INSERTION: dict(self.insertion),
+        }
+
+    def save(self, filename: str) -> None:
+        """Write the model to filename as JSON."""
+        with open(filename, 'w', encoding='utf-8') as fout:
+            json.dump(self.as_dict(), fout, indent=1, sort_keys=True)
+
+    @classmethod
+    def load(cls, filename: str, min_count: int = 2) -> 'ConfusionModel':
+        """Return the model saved in filename."""
+        with open(filename, encoding='utf-8') as fin:
+            return cls(json.load(fin), min_count)
+
+    @property
+    def fingerprint(self) -> str:
+        """Return a digest of the counts which identifies the model."""
+        if self._fingerprint is None:
+            data = json.dumps([self.as_dict(), self.min_count],
+                              sort_keys=True).encode('utf-8')
+            self._fingerprint = hashlib.sha256(data).hexdigest()[:16]
+        return self._fingerprint
+
+    def __repr__(self) -> str:
+        return f'ConfusionModel({self.fingerprint})'
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, ConfusionModel) and
+                self.fingerprint == other.fingerprint)
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    def __getstate__(self):
+        return {'counts': self.as_dict(), 'min_count': self.min_count}
+
+    def __setstate__(self, state):
+        self.__init__(state['counts'], state['min_count'])
+
+    def scores(self) -> Tuple[Dict[str, List[Tuple[float, str]]],
+                              Dict[str, float], List[Tuple[float, str]]]:
+        """Return the probabilities of each substitution and deletion given
+        the OCR character, and of each insertion at any one place."""
+        if self._scores is None:
+            total = max(1, sum(self.seen.values()))
+            substitution = {
+                ocr: sorted(((count / max(1, self.seen[ocr]), right)
+                             for right, count in truths.items()
+                             if count >= self.min_count),
+                            key=lambda score: -score[0])
+                for ocr, truths in self.substitution.items()}
+            deletion = {ocr: count / max(1, self.seen[ocr])
+                        for ocr, count in self.deletion.items()
+                        if count >= self.min_count}
+            insertion = sorted(((count / total, right)
+                                for right, count in self.insertion.items()
+                                if count >= self.min_count),
+                               key=lambda score: -score[0])
+            self._scores = (substitution, deletion, insertion)
+        return self._scores
+
+    def likely(self, word: str, space: bool = True,
+               substitution: bool = True, insertion: bool = True,
+               deletion: bool = True) -> List[str]:
+        """Return the one-error variations on word which the model has seen
+        fixes like, most likely first. A missing space counts as an
+        insertion of ' '."""
+        substitutions, deletions, insertions = self.scores()
+        scored: List[Tuple[float, str]] = []
+        for i, letter in enumerate(word):
+            if substitution:
+                for score, right in substitutions.get(letter, ()):
+                    scored.append((score, word[:i] + right + word[i+1:]))
+            if deletion and letter in deletions:
+                scored.append((deletions[letter], word[:i] + word[i+1:]))
+        for score, right in insertions:
+            if right == ' ':
+                if space:
+                    scored.extend((score, word[:i] + ' ' + word[i:])
+                                  for i in range(1, len(word)))
+            elif insertion:
+                scored.extend((score, word[:i] + right + word[i:])
+                              for i in range(len(word) + 1))
+        scored.sort(key=lambda score: -score[0])
+        return [candidate for _score, candidate in scored]
+
+
+def read_pairs(lines: Iterable[str]) -> Iterable[Tuple[str, str]]:
+    """Yield (OCR, truth) pairs from tab separated lines."""
+    for line in lines:
+        line = line.rstrip('\n')
+        if '\t' in line:
+            ocr, truth = line.split('\t', 1)
+            yield ocr, truth
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load the dictionary of valid words, from text or a compiled file.
+
+A compiled dictionary is a hash table of offsets into a blob of words, so it
+can be mmap'd and queried without building a Python set. Capitalized copies
+of lowercase words are answered from the lowercase entry instead of being
+stored twice.
+"""
+
+import atexit
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import warnings
+import zlib
+
+from typing import (
+    Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union)
+
+DEFAULT_WORDS = '/usr/share/dict/words'
+DEFAULT_COMPILED = os.path.join(
+    os.path.expanduser('~'), '.cache', 'text-cleanup', 'words.dict')
+
+MAGIC = b'TCDICT02'
+# magic, number of valid words, number of entries, table size, fingerprint,
+# and the size and mtime in nanoseconds of the word list it was compiled from
+HEADER = struct.Struct('<8sIIIIQq')
+# Still readable, but without the size and mtime
+MAGIC_V1 = b'TCDICT01'
+HEADER_V1 = struct.Struct('<8sIIII')
+SLOT = struct.Struct('<I')
+ENTRY = struct.Struct('<BH')  # flags, length in bytes
+
+# Entry flags
+VALID = 1         # The entry itself is a valid word
+CAPITALIZED = 2   # The entry capitalized is a valid word
+
+
+def get_valid_words(filename=None) -> Set[str]:
+    """Return set of valid words, read from filename if present."""
+    with open(filename or DEFAULT_WORDS) as fin:
+        words = fin.read().splitlines()
+    # Remove one-letter words that aren't 'a', 'A' or 'I'.
+    valid = set(w for w in words if len(w) > 1 or w in 'aAI')
+    # Allow any word to be capitalized, since it might start a sentence.
+    valid.update(w.capitalize() for w in words if w[0].islower())
+    return valid
+
+
+def _uncapitalize(word: str) -> str:
+    return word[:1].lower() + word[1:]
+
+
+def _slot(word: bytes, table_size: int) -> int:
+    return zlib.crc32(word) & (table_size - 1)
+
+
+def compile_words(source: Optional[str] = None,
+                  output: Optional[str] = None) -> str:
+    """Compile the word list in source to output and return its path."""
+    source = source or DEFAULT_WORDS
+    output = output or DEFAULT_COMPILED
+    with open(source, 'rb') as fin:
+        content = fin.read()
+        stat = os.fstat(fin.fileno())
+    words = content.decode('utf-8').splitlines()
+
+    entries: Dict[str, int] = {}
+    for word in words:
+        if len(word) > 1 or word in 'aAI':
+            entries[word] = entries.get(word, 0) | VALID
+        if word[0].islower():
+            capitalized = word.capitalize()
+            if _uncapitalize(capitalized) == word:
+                entries[word] = entries.get(word, 0) | CAPITALIZED
+            else:
+                entries[capitalized] = entries.get(capitalized, 0) | VALID
+
+    table_size = 1
+    while table_size < 2 * len(entries):
+        table_size *= 2
+    table = [0] * table_size
+    blob = bytearray()
+    for word, flags in sorted(entries.items()):
+        encoded = word.encode('utf-8')
+        slot = _slot(encoded, table_size)
+        while table[slot]:
+            slot = (slot + 1) & (table_size - 1)
+        table[slot] = len(blob) + 1  # Zero marks an empty slot
+        blob += ENTRY.pack(flags, len(encoded)) + encoded
+
+    valid = len(get_valid_words(source))
+    fingerprint = zlib.crc32(content)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    tmpname = output + '.tmp'
+    with open(tmpname, 'wb') as fout:
+        fout.write(HEADER.pack(MAGIC, valid, len(entries), table_size,
+                               fingerprint, stat.st_size, stat.st_mtime_ns))
+        fout.write(struct.pack(f'<{table_size}I', *table))
+        fout.write(blob)
+    os.replace(tmpname, output)
+    return output
+
+
+class CompiledWords:
+    """Read-only set of valid words backed by a compiled dictionary buffer.
+
+    source_stat is the (size, mtime in nanoseconds) of the word list it was
+    compiled from, or None if it was compiled before they were recorded."""
+
+    def __init__(self, buf) -> None:
+        magic = bytes(buf[:len(MAGIC)])
+        if magic == MAGIC:
+            header = HEADER
+            _magic, self._len, self._entries, self._table_size, \
+                self.fingerprint, size, mtime = HEADER.unpack_from(buf)
+            self.source_stat: Optional[Tuple[int, int]] = (size, mtime)
+        elif magic == MAGIC_V1:
+            header = HEADER_V1
+            _magic, self._len, self._entries, self._table_size, \
+                self.fingerprint = HEADER_V1.unpack_from(buf)
+            self.source_stat = None
+        else:
+            raise ValueError("Not a compiled text-cleanup dictionary.")
+        self._buf = buf
+        self._blob = header.size + SLOT.size * self._table_size
+        if sys.byteorder == 'little':
+            # Read the table in place, rather than unpacking each slot
+            self._slots = memoryview(buf)[header.size:self._blob].cast('I')
+        else:
+            self._slots = struct.unpack_from(f'<{self._table_size}I', buf,
+                                             header.size)
+        self._max_length: Optional[int] = None
+        self.filename: Optional[str] = None
+
+    @classmethod
+    def open(cls, filename: str) -> 'CompiledWords':
+        """Return the compiled dictionary in filename, mmap'd read-only."""
+        with open(filename, 'rb') as fin:
+            words = cls(mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ))
+        words.filename = filename
+        return words
+
+    def _flags(self, encoded: Iterable[bytes]) -> List[int]:
+        """Return the flags of the entry for each of encoded, or 0."""
+        # This is where most of the time goes, so everything is local and
+        # the entries are read byte by byte rather than unpacked.
+        buf = self._buf
+        slots = self._slots
+        blob = self._blob - 1
+        mask = self._table_size - 1
+        crc32 = zlib.crc32
+        flags = []
+        append = flags.append
+        for word in encoded:
+            length = len(word)
+            slot = crc32(word) & mask
+            while True:
+                offset = slots[slot]
+                if not offset:
+                    append(0)
+                    break
+                start = blob + offset
+                if buf[start + 1] | buf[start + 2] << 8 == length and \
+                        buf[start + 3:start + 3 + length] == word:
+                    append(buf[start])
+                    break
+                slot = (slot + 1) & mask
+        return flags
+
+    def __contains__(self, word) -> bool:
+        if not isinstance(word, str) or not word:
+            return False
+        if self._flags((word.encode('utf-8'),))[0] & VALID:
+            return True
+        return (word[0].isupper() and bool(self._flags(
+            (_uncapitalize(word).encode('utf-8'),))[0] & CAPITALIZED))
+
+    def known(self, words: Iterable[str]) -> Set[str]:
+        """Return the set of words which are valid, looking them all up in
+        one go."""
+        words = [word for word in words if isinstance(word, str) and word]
+        flags = self._flags(word.encode('utf-8') for word in words)
+        valid = {word for word, flag in zip(words, flags) if flag & VALID}
+        capitalized = [word for word, flag in zip(words, flags)
+                       if not flag & VALID and word[0].isupper()]
+        flags = self._flags(_uncapitalize(word).encode('utf-8')
+                            for word in capitalized)
+        valid.update(word for word, flag in zip(capitalized, flags)
+                     if flag & CAPITALIZED)
+        return valid
+
+    def max_length(self) -> int:
+        """Return the length of the longest word, in bytes, which is at
+        least its length in characters."""
+        if self._max_length is None:
+            buf = self._buf
+            longest = 0
+            start = self._blob
+            for _ in range(self._entries):
+                length = buf[start + 1] | buf[start + 2] << 8
+                longest = max(longest, length)
+                start += ENTRY.size + length
+            self._max_length = longest
+        return self._max_length
+
+    def _entries_iter(self) -> Iterator[Tuple[int, str]]:
+        """Yield each entry with its flags, in sorted order."""
+        start = self._blob
+        for _ in range(self._entries):
+            flags, length = ENTRY.unpack_from(self._buf, start)
+            start += ENTRY.size
+            yield flags, bytes(self._buf[start:start + length]).decode('utf-8')
+            start += length
+
+    def __iter__(self) -> Iterator[str]:
+        for flags, word in self._entries_iter():
+            if flags & VALID:
+                yield word
+            if flags & CAPITALIZED:
+                capitalized = word.capitalize()
+                flags, = self._flags((capitalized.encode('utf-8'),))
+                if not flags & VALID:
+                    yield capitalized
+
+    def __len__(self) -> int:
+        return self._len
+
+
+def load(filename: Optional[str] = None) -> Union[Set[str], CompiledWords]:
+    """Return the valid words in filename, which may be compiled.
+
+    Without a filename, use the compiled dictionary named by
+    $TEXT_CLEANUP_DICT or DEFAULT_COMPILED if there is one, otherwise read
+    DEFAULT_WORDS. A DEFAULT_COMPILED which wasn't compiled from
+    DEFAULT_WORDS with the size and mtime it has now is still used, with a
+    warning, since it may have been compiled from another word list on
+    purpose."""
+    if filename is None:
+        filename = os.environ.get('TEXT_CLEANUP_DICT')
+    if filename is None and os.path.exists(DEFAULT_COMPILED):
+        words = CompiledWords.open(DEFAULT_COMPILED)
+        try:
+            stat = os.stat(DEFAULT_WORDS)
+        except OSError:
+            return words
+        if words.source_stat != (stat.st_size, stat.st_mtime_ns):
+            warnings.warn(
+                f"{DEFAULT_COMPILED} may not have been compiled from "
+                f"{DEFAULT_WORDS} as it is now. Run text-cleanup compile-dict "
+                "to update it.", stacklevel=2)
+        return words
+    if filename is not None:
+        with open(filename, 'rb') as fin:
+            if fin.read(len(MAGIC)) in (MAGIC, MAGIC_V1):
+                return CompiledWords.open(filename)
+    return get_valid_words(filename)
+
+
+class Words:
+    """Set-like view of the valid words which loads them on first use."""
+
+    def __init__(self, filename: Optional[str] = None) -> None:
+        self.filename = filename
+        self._words: Optional[Union[Set[str], CompiledWords]] = None
+        self._compiled: Optional[str] = None
+
+    def load(self) -> Union[Set[str], CompiledWords]:
+        """Return the underlying words, loading them if necessary."""
+        if self._words is None:
+            self._words = load(self.filename)
+        return self._words
+
+    def __contains__(self, word) -> bool:
+        words = self._words
+        if words is None:
+            words = self.load()
+        return word in words
+
+    def known(self, words: Iterable[str]) -> Set[str]:
+        """Return the set of words which are valid, all in one go."""
+        loaded = self.load()
+        if isinstance(loaded, set):
+            return loaded.intersection(words)
+        return loaded.known(words)
+
+    def max_length(self) -> int:
+        """Return the length of the longest word, or more for a compiled
+        dictionary of words with accented letters."""
+        words = self.load()
+        if isinstance(words, CompiledWords):
+            return words.max_length()
+        return max(map(len, words), default=0)
+
+    def use(self, filename: str) -> None:
+        """Switch to the words in filename, loading them on first use."""
+        self.filename = filename
+        self._words = None
+
+    def source(self) -> str:
+        """Return the filename the words are loaded from."""
+        words = self.load()
+        if isinstance(words, CompiledWords) and words.filename is not None:
+            return words.filename
+        return (self.filename or os.environ.get('TEXT_CLEANUP_DICT') or
+                DEFAULT_WORDS)
+
+    def compiled(self) -> str:
+        """Return the filename of a compiled copy of the words.
+
+        Text word lists are compiled to a temporary file the first time,
+        removed on exit. Worker processes which use() it all mmap the same
+        pages rather than each building a set of their own."""
+        words = self.load()
+        if isinstance(words, CompiledWords) and words.filename is not None:
+            return words.filename
+        if self._compiled is None:
+            handle, filename = tempfile.mkstemp(
+                prefix='text-cleanup-', suffix='.dict')
+            os.close(handle)
+            atexit.register(os.remove, filename)
+            self._compiled = compile_words(self.source(), filename)
+        return self._compiled
+
+    def fingerprint(self) -> int:
+        """Return the crc32 of the word list, which identifies its version.
+        Compiled dictionaries share the fingerprint of their source."""
+        words = self.load()
+        if isinstance(words, CompiledWords):
+            return words.fingerprint
+        with open(self.source(), 'rb') as fin:
+            return zlib.crc32(fin.read())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return len(self.load())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Lists of the edits cleanup makes, to keep instead of whole documents.
+
+An edit is (start, end, original, replacement, kind): the characters of
+the input from start to end, which were original, become replacement.
+kind says how the correction was made, as text_cleanup.stats.classify()
+does. Edit lists are written one JSON object per line.
+"""
+
+import json
+
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+Edit = Tuple[int, int, str, str, str]
+
+FIELDS = ('start', 'end', 'original', 'replacement', 'kind')
+
+
+def shift(edits: Iterable[Edit], offset: int) -> Iterator[Edit]:
+    """Yield edits with offset added to their start and end."""
+    for start, end, original, replacement, kind in edits:
+        yield start + offset, end + offset, original, replacement, kind
+
+
+def write_edits(edits: Iterable[Edit], fout: TextIO) -> None:
+    """Write edits to fout as JSON lines."""
+    for edit in edits:
+        fout.write(json.dumps(dict(zip(FIELDS, edit)), ensure_ascii=False))
+        fout.write('\n')
+
+
+def read_edits(fin: Iterable[str]) -> Iterator[Edit]:
+    """Yield the edits in JSON lines from fin."""
+    for line in fin:
+        if line.strip():
+            record = json.loads(line)
+            yield tuple(record[field] for field in FIELDS)  # type: ignore
+
+
+def apply_edits(given: str, edits: Iterable[Edit]) -> str:
+    """Return given with edits made. Raise ValueError if they are out of
+    order or don't match given."""
+    pieces: List[str] = []
+    position = 0
+    for start, end, original, replacement, _kind in edits:
+        if start < position:
+            raise ValueError(f"Edit at {start} overlaps the one before")
+        if given[start:end] != original:
+            raise ValueError(f"Expected {original!r} at {start}, found "
+                             f"{given[start:end]!r}")
+        pieces.append(given[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(given[position:])
+    return ''.join(pieces)
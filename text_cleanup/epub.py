@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Cleanup EPUB books, one content document at a time."""
+
+import copy
+import io
+import multiprocessing
+import posixpath
+import struct
+import urllib.parse
+import zipfile
+
+from typing import Dict, Iterator, List
+
+from lxml import etree  # type: ignore
+
+from text_cleanup import raw, stats, XML
+
+CONTAINER = 'META-INF/container.xml'
+MIMETYPE = 'mimetype'
+NAMESPACES = {
+    'c': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+}
+CONTENT_TYPES = ('application/xhtml+xml', 'text/html')
+_DATA_DESCRIPTOR = 0x08
+
+
+def content_documents(zin: zipfile.ZipFile) -> Iterator[str]:
+    """Yield the names of the content documents in the spine of an EPUB."""
+    container = etree.fromstring(zin.read(CONTAINER))
+    rootfile = container.find('.//c:rootfile', NAMESPACES).get('full-path')
+    package = etree.fromstring(zin.read(rootfile))
+    manifest = {item.get('id'): item for item in
+                package.iterfind('opf:manifest/opf:item', NAMESPACES)}
+    base = posixpath.dirname(rootfile)
+    for itemref in package.iterfind('opf:spine/opf:itemref', NAMESPACES):
+        item = manifest.get(itemref.get('idref'))
+        if item is not None and item.get('media-type') in CONTENT_TYPES:
+            href = urllib.parse.unquote(item.get('href'))
+            yield posixpath.normpath(posixpath.join(base, href))
+
+
+def copy_compressed(zin: zipfile.ZipFile, zout: zipfile.ZipFile,
+                    info: zipfile.ZipInfo) -> None:
+    """Copy a member of zin to zout without decompressing it.
+
+    zipfile has no public API for this, so write the entry the same way
+    ZipFile.open(..., 'w') does."""
+    zin.fp.seek(info.header_offset)
+    header = zin.fp.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    zin.fp.seek(info.header_offset + zipfile.sizeFileHeader +
+                name_length + extra_length)
+    data = zin.fp.read(info.compress_size)
+
+    copied = copy.copy(info)
+    # The sizes are known up front, so there's no trailing data descriptor.
+    copied.flag_bits &= ~_DATA_DESCRIPTOR
+    # pylint: disable=protected-access
+    if zout._seekable:
+        zout.fp.seek(zout.start_dir)
+    copied.header_offset = zout.fp.tell()
+    zout._writecheck(copied)
+    zout._didModify = True
+    zout.fp.write(copied.FileHeader())
+    zout.fp.write(data)
+    zout.start_dir = zout.fp.tell()
+    zout.filelist.append(copied)
+    zout.NameToInfo[copied.filename] = copied
+
+
+def clean_document(xml: str, selector=':root', stream=False, patch=False,
+                   **kwargs) -> str:
+    """Return a content document with the selected elements cleaned up.
+    patch is as for text_cleanup.XML.clean_element(), and can't be used with
+    stream. kwargs are passed to text_cleanup.raw.cleanup()"""
+    if stream:
+        output = io.StringIO()
+        XML.clean_stream(io.StringIO(xml), output, selector, **kwargs)
+        return output.getvalue()
+    return XML.clean_element(xml, selector, patch=patch, **kwargs)
+
+
+def clean_epub(source, destination, selector=':root',
+               progress_iterator=None, num_processes=1, stream=False,
+               **kwargs) -> None:
+    """Write the EPUB source to destination with the selected elements of
+    each content document cleaned up. Other files are copied unchanged.
+    kwargs are passed to text_cleanup.raw.cleanup()"""
+    if progress_iterator is None:
+        progress_iterator = lambda x: x  # noqa: E731
+
+    with zipfile.ZipFile(source) as zin, \
+            zipfile.ZipFile(destination, 'w') as zout:
+        names = list(dict.fromkeys(content_documents(zin)))
+        documents = [zin.read(name).decode('utf-8') for name in names]
+
+        if num_processes > 1:
+            record = stats.ACTIVE
+            # Workers share one mmap'd copy of the dictionary
+            words = raw.WORDS.compiled()
+            with multiprocessing.Pool(num_processes,
+                                      initializer=raw.load_words,
+                                      initargs=(words,)) as pool:
+                if record is None:
+                    futures = [
+                        pool.apply_async(clean_document,
+                                         (document, selector, stream), kwargs)
+                        for document in documents]
+                else:
+                    futures = [
+                        pool.apply_async(stats.collecting,
+                                         (clean_document,
+                                          (document, selector, stream),
+                                          kwargs, record.timing))
+                        for document in documents]
+                fixed: List[str] = []
+                for future in progress_iterator(futures):
+                    result = future.get()
+                    if record is not None:
+                        result, collected = result
+                        record.merge(collected)
+                    fixed.append(result)
+        else:
+            fixed = [clean_document(document, selector, stream, **kwargs)
+                     for document in progress_iterator(documents)]
+        write_documents(zin, zout, dict(zip(names, fixed)))
+
+
+def write_documents(zin: zipfile.ZipFile, zout: zipfile.ZipFile,
+                    cleaned: Dict[str, str]) -> None:
+    """Write the EPUB zin to zout with the content documents in cleaned
+    replaced. Other files are copied unchanged."""
+    # The mimetype must come first, uncompressed.
+    mimetype = b'application/epub+zip'
+    if MIMETYPE in zin.NameToInfo:
+        mimetype = zin.read(MIMETYPE)
+    zout.writestr(MIMETYPE, mimetype, compress_type=zipfile.ZIP_STORED)
+    for info in zin.infolist():
+        if info.filename == MIMETYPE:
+            continue
+        if info.filename in cleaned:
+            zout.writestr(info, cleaned[info.filename].encode('utf-8'),
+                          compress_type=zipfile.ZIP_DEFLATED)
+        else:
+            copy_compressed(zin, zout, info)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bounded edit distance from a word to every dictionary word at once.
+
+When the candidate search finds nothing within its few errors, searching
+deeper is hopeless: the candidates multiply with every error. Instead the
+dictionary is kept as one array of character codes for each word length,
+and the edit distance to every word of a nearby length is computed a row
+of the dynamic programming table at a time with numpy. Words which can no
+longer come within the bound are dropped as it goes, so the cost is
+roughly linear in the number of words of those lengths.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np  # type: ignore
+
+# Costs are integers, in half edits, so that preferred substitutions can be
+# cheaper. Edits which aren't allowed cost more than any bound.
+HALF = 1
+EDIT = 2 * HALF
+FORBIDDEN = 2**12
+COST = np.int16
+
+
+class DistanceIndex:
+    """Dictionary words grouped by length as arrays of character indices."""
+
+    def __init__(self, words: Iterable[str],
+                 preferred: Dict[str, str]) -> None:
+        by_length: Dict[int, List[str]] = {}
+        for word in words:
+            by_length.setdefault(len(word), []).append(word)
+        self.words = {length: sorted(group)
+                      for length, group in by_length.items()}
+        # Decode each group all at once as UTF-32 code points
+        codes = {length: np.frombuffer(
+                     ''.join(group).encode('utf-32-le'),
+                     dtype=np.uint32).reshape(len(group), length)
+                 for length, group in self.words.items()}
+        self.alphabet = np.unique(np.concatenate(
+            [array.ravel() for array in codes.values()] or
+            [np.zeros(0, dtype=np.uint32)]))
+        dtype = np.min_scalar_type(len(self.alphabet))
+        # Each column is a word, so every step works on long rows
+        self.arrays = {length: np.ascontiguousarray(
+                           np.searchsorted(self.alphabet, array).astype(
+                               dtype).T)
+                       for length, array in codes.items()}
+        self.preferred = preferred
+
+    def _substitution_costs(self, letter: str,
+                            substitution: bool) -> np.ndarray:
+        """Return the cost of replacing letter with each of the alphabet."""
+        costs = np.full(len(self.alphabet), EDIT if substitution else
+                        FORBIDDEN, dtype=COST)
+        if substitution:
+            for other in self.preferred.get(letter, ''):
+                index = self._index(other)
+                if index is not None:
+                    costs[index] = HALF
+        index = self._index(letter)
+        if index is not None:
+            costs[index] = 0
+        return costs
+
+    def _index(self, letter: str) -> Optional[int]:
+        """Return the index of letter in the alphabet, or None."""
+        code = ord(letter)
+        index = int(np.searchsorted(self.alphabet, code))
+        if index < len(self.alphabet) and self.alphabet[index] == code:
+            return index
+        return None
+
+    def distances(self, given: str, length: int, bound: int,
+                  substitution: bool = True, insertion: bool = True,
+                  deletion: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the indices into self.words[length] of the words at most
+        bound (in half edits) from given, and their distances."""
+        array = self.arrays.get(length)
+        if array is None:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=COST)
+        insert = EDIT if insertion else FORBIDDEN
+        delete = EDIT if deletion else FORBIDDEN
+        steps = np.minimum(np.arange(length + 1) * insert,
+                           FORBIDDEN).astype(COST)[:, None]
+        # Whatever the rest of the words, the difference in the lengths
+        # left still has to be made up with insertions or deletions
+        left = len(given) - length + np.arange(length + 1)
+        keep = np.arange(array.shape[1])
+        table = np.repeat(steps, array.shape[1], axis=1)
+        for i, letter in enumerate(given, 1):
+            costs = self._substitution_costs(letter, substitution)
+            row = np.empty_like(table)
+            row[0] = min(i * delete, FORBIDDEN)
+            np.minimum(table[:-1] + costs[array], table[1:] + delete,
+                       out=row[1:])
+            if insertion:
+                # Insertions run along the row: the cheapest way to reach
+                # each column is from some earlier one plus its insertions
+                row -= steps
+                np.minimum.accumulate(row, axis=0, out=row)
+                row += steps
+            np.minimum(row, FORBIDDEN, out=row)
+            table = row
+            remaining = left - i
+            extra = np.where(remaining < 0, -remaining * insert,
+                             remaining * delete)
+            close = (table + np.minimum(extra, FORBIDDEN).astype(COST)[:, None]
+                     ).min(axis=0) <= bound
+            if not close.all():
+                keep, array, table = keep[close], array[:, close], \
+                    table[:, close]
+                if not len(keep):
+                    break
+        distances = table[-1]
+        within = distances <= bound
+        return keep[within], distances[within]
+
+    def nearest(self, given: str, max_distance: float,
+                substitution: bool = True, insertion: bool = True,
+                deletion: bool = True) -> Optional[str]:
+        """Return the word closest to given, at most max_distance edits
+        away, or None. Substitutions within a preferred group count as half
+        an edit. Ties go to the word closest in length, then the first."""
+        bound = int(max_distance * EDIT)
+        found = []
+        reach = bound // EDIT
+        for length in range(max(1, len(given) - (reach if deletion else 0)),
+                            len(given) + (reach if insertion else 0) + 1):
+            indices, distances = self.distances(
+                given, length, bound, substitution, insertion, deletion)
+            if len(indices):
+                best = int(np.argmin(distances))
+                found.append((int(distances[best]), abs(length - len(given)),
+                              self.words[length][indices[best]]))
+        if not found:
+            return None
+        return min(found)[2]
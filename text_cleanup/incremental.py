@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Re-clean edited XML, skipping text which was cleaned last time.
+
+A sidecar file keeps a fingerprint of each selected text node as it was
+written out. Nodes which still match one next time, because nobody has
+touched them since, aren't cleaned again. Fingerprints are of the text
+itself rather than where it is, so moving or inserting elements doesn't
+matter.
+"""
+
+import hashlib
+import json
+import os
+
+from typing import Any, Dict, Set
+
+from text_cleanup import raw, stats, XML
+
+
+def fingerprint(text: str) -> str:
+    """Return a short digest of text."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def options_key(selector: str, kwargs: Dict[str, Any]) -> str:
+    """Return a key which changes along with the options or dictionary."""
+    options = {k: v for k, v in kwargs.items() if k != 'cache'}
+    options['selector'] = selector
+    options['dictionary'] = raw.WORDS.fingerprint()
+    # Models and such are identified by their repr()
+    return fingerprint(json.dumps(options, sort_keys=True, default=repr))
+
+
+def load_sidecar(filename: str, key: str) -> Set[str]:
+    """Return the fingerprints in filename if they were made with the same
+    options key, otherwise an empty set."""
+    try:
+        with open(filename, encoding='utf-8') as fin:
+            state = json.load(fin)
+    except FileNotFoundError:
+        return set()
+    if state.get('key') != key:
+        return set()
+    return set(state['texts'])
+
+
+def save_sidecar(filename: str, key: str, texts: Set[str]) -> None:
+    """Write the fingerprints of texts to filename atomically."""
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'w', encoding='utf-8') as fout:
+        json.dump({'key': key, 'texts': sorted(texts)}, fout, indent=0)
+    os.replace(tmpname, filename)
+
+
+def clean_element(xml: str, sidecar: str, selector=':root',
+                  progress_iterator=None, num_processes=1, patch=False,
+                  **kwargs) -> str:
+    """Return xml with the selected elements cleaned up, like
+    text_cleanup.XML.clean_element(), except for text nodes unchanged since
+    the last run with the same sidecar file. patch is as for that, and
+    kwargs are passed to text_cleanup.raw.cleanup()"""
+    key = options_key(selector, kwargs)
+    known = load_sidecar(sidecar, key)
+
+    with stats.timer('parse'):
+        soup, spans = XML.parse_element(xml, patch)
+    with stats.timer('select'):
+        nodes = XML.select_strings(soup, selector, **kwargs)
+    # The vocabulary is of the whole document, not just the changed text
+    vocabulary_min_count = kwargs.pop('vocabulary_min_count', None)
+    if vocabulary_min_count is not None:
+        kwargs['vocabulary'] = raw.document_vocabulary(
+            map(str, nodes), vocabulary_min_count)
+
+    unique = dict.fromkeys(map(str, nodes))
+    texts = [text for text in unique if fingerprint(text) not in known]
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('nodes', len(nodes))
+        stats.ACTIVE.count('nodes.unique', len(unique))
+        stats.ACTIVE.count('nodes.unchanged', len(unique) - len(texts))
+
+    fixed = XML.clean_texts(texts, progress_iterator, num_processes, **kwargs)
+
+    with stats.timer('serialize'):
+        cleaned = {fingerprint(fixed.get(text, text)) for text in unique}
+        output = XML.write_element(xml, soup, nodes, fixed, spans)
+    save_sidecar(sidecar, key, cleaned)
+    return output
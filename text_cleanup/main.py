@@ -2,15 +2,394 @@
 # -*- coding: utf-8 -*-
 """Entry point for text-cleanup cli."""
 
+import io
+import json
+import os
 import sys
 import argparse
+import contextlib
 import progressbar
 
-from text_cleanup import raw, XML
+from text_cleanup import (
+    batch, benchmark, cache, confusion, dictionary, edits, epub, incremental,
+    parse, raw, server, stats, workqueue, XML)
+
+
+def add_cleanup_arguments(parser):
+    """Add the arguments which control corrections to parser."""
+    parser.add_argument('--disallow_substitution', action='store_false',
+                        help='Allow the correction to substitute letters.')
+    parser.add_argument('--disallow_deletion', action='store_false',
+                        help='Allow the correction to delete letters.')
+    parser.add_argument('--disallow_insertion', action='store_false',
+                        help='Allow the correction to insert letters.')
+    parser.add_argument('--disallow_segmentation', action='store_true',
+                        help="Don't split words run together into several.")
+    parser.add_argument('--avoid_capitalized_words', action='store_true',
+                        help=("Ignore words starting with a capital letter"
+                              "unless we're *really* sure."))
+    parser.add_argument('--engine', choices=('search', 'index'),
+                        default='search',
+                        help=("How to find corrections: try every candidate "
+                              "in turn or look them up in a deletion index."))
+    parser.add_argument('--confusion_model', metavar='FILE',
+                        help=("Try the corrections most likely according to "
+                              "this model from train-confusion first."))
+    parser.add_argument('--max_candidates', metavar='N', type=int,
+                        help=("Leave a word alone after trying N candidate "
+                              "corrections."))
+    parser.add_argument('--max_seconds', metavar='S', type=float,
+                        help="Leave a word alone after S seconds searching.")
+    parser.add_argument('--max_search_length', metavar='N', type=int,
+                        help="Don't search for corrections of words longer "
+                             "than N.")
+    parser.add_argument('--fallback_distance', metavar='D', type=float,
+                        help=("If nothing is found within two errors, take "
+                              "the closest word at most D edits away, "
+                              "counting preferred substitutions as half."))
+    parser.add_argument('--vocabulary_min_count', metavar='N', type=int,
+                        help=("Accept unknown words which appear at least N "
+                              "times in a document, nearly always spelled "
+                              "the same way, such as names. Streamed text "
+                              "is read whole first to count them. The "
+                              "words are listed in the --stats report."))
+    parser.add_argument('--cache_size', metavar='N', type=int,
+                        help=("Remember up to N corrections for repeated "
+                              "tokens, or 1048576 with --cache. Without "
+                              "either there is no cache. With -n, one cache "
+                              "is shared through a manager process, which "
+                              "costs a round trip for each unknown token."))
+    parser.add_argument('--cache', metavar='FILE',
+                        help=("Keep corrections in this SQLite file so that "
+                              "later runs can reuse them."))
+    parser.add_argument('--clear-cache', action='store_true',
+                        help="Empty the --cache file before starting.")
+
+
+def cleanup_options(args):
+    """Return the kwargs for text_cleanup.raw.cleanup() given by args."""
+    options = dict(
+        insertion=not args.disallow_insertion,
+        deletion=not args.disallow_deletion,
+        substitution=not args.disallow_substitution,
+        avoid_capitalized_words=args.avoid_capitalized_words,
+        engine=args.engine,
+        segment=not args.disallow_segmentation,
+    )
+    for option in ('max_candidates', 'max_seconds', 'max_search_length',
+                   'fallback_distance', 'vocabulary_min_count'):
+        if getattr(args, option) is not None:
+            options[option] = getattr(args, option)
+    if args.confusion_model:
+        options['confusion'] = confusion.ConfusionModel.load(
+            args.confusion_model)
+    return options
+
+
+def make_cache(args, stack):
+    """Return the correction cache described by args, or None. It is shared
+    between processes if args.num_processes > 1."""
+    if args.cache_size == 0 or (args.cache_size is None and
+                                args.cache is None):
+        return None
+    if args.num_processes > 1:
+        # Share one cache between all of the pool workers
+        factory = stack.enter_context(cache.CacheManager())
+    else:
+        factory = cache
+    if args.cache is None:
+        return factory.CorrectionCache(args.cache_size)
+    # Corrections depend on the dictionary, so don't mix them up
+    namespace = '{:08x}:'.format(raw.WORDS.fingerprint())
+    disk_cache = factory.DiskCache(args.cache, args.cache_size or 2**20,
+                                   namespace)
+    stack.callback(disk_cache.close)
+    if args.clear_cache:
+        disk_cache.clear()
+    return disk_cache
+
+
+def run_batch(argv):
+    """Entry point for text-cleanup batch."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup batch",
+        description=("Clean every text, XML and EPUB file in a directory, "
+                     "skipping files unchanged since the last run."))
+    parser.add_argument('source', help="The directory to clean up.")
+    parser.add_argument('destination',
+                        help="Write cleaned copies under this directory.")
+    parser.add_argument(
+        '--selector', '-s', default=':root',
+        help="Only clean XML elements mathching this CSS selector.")
+    parser.add_argument('--num_processes', '-n', metavar='N',
+                        help="Utilize N processes.", type=int, default=1)
+    parser.add_argument('--stream', action='store_true',
+                        help="Clean each file a chunk at a time.")
+    parser.add_argument('--force', action='store_true',
+                        help="Clean every file, even if unchanged.")
+    add_cleanup_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.clear_cache and args.cache is None:
+        parser.error("--clear-cache needs --cache")
+    if args.vocabulary_min_count is not None and args.stream:
+        parser.error("--vocabulary_min_count can't be used with --stream")
+    options = cleanup_options(args)
+
+    with contextlib.ExitStack() as stack:
+        correction_cache = make_cache(args, stack)
+        if correction_cache is not None:
+            options['cache'] = correction_cache
+        result = batch.clean_tree(
+            args.source, args.destination, args.selector,
+            progress_iterator=progressbar.progressbar,
+            num_processes=args.num_processes, stream=args.stream,
+            force=args.force, **options)
+    print("Cleaned {cleaned} files, skipped {skipped} unchanged.".format(
+        **result), file=sys.stderr)
+
+
+def run_enqueue(argv):
+    """Entry point for text-cleanup enqueue."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup enqueue",
+        description=("Split a file, or every text, XML and EPUB file in a "
+                     "directory, into tasks in a queue for workers to "
+                     "clean. See text-cleanup worker."))
+    parser.add_argument('queue', help="The queue file, created if need be.")
+    parser.add_argument('source', help="The file or directory to clean up.")
+    parser.add_argument('destination',
+                        help=("Write the cleaned copy to this file, or "
+                              "copies under this directory."))
+    parser.add_argument(
+        '--selector', '-s', default=':root',
+        help="Only clean XML elements mathching this CSS selector.")
+    parser.add_argument('--shard_size', metavar='N', type=int, default=2**20,
+                        help=("Split plain text into tasks of about N "
+                              "characters."))
+    add_cleanup_arguments(parser)
+    args = parser.parse_args(argv)
+    options = cleanup_options(args)
+    # Workers load the model themselves, as options are stored as JSON
+    options.pop('confusion', None)
+
+    if os.path.isdir(args.source):
+        names = list(batch.find_files(args.source, args.destination))
+        jobs = [(os.path.join(args.source, name),
+                 os.path.join(args.destination, name)) for name in names]
+    else:
+        jobs = [(args.source, args.destination)]
+    queue = workqueue.WorkQueue(args.queue)
+    try:
+        tasks = sum(queue.enqueue(source, destination, args.selector,
+                                  args.shard_size, args.confusion_model,
+                                  **options)
+                    for source, destination in jobs)
+    finally:
+        queue.close()
+    print(f"Queued {tasks} tasks for {len(jobs)} files.", file=sys.stderr)
+
+
+def run_worker(argv):
+    """Entry point for text-cleanup worker."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup worker",
+        description=("Clean up tasks from a queue made by text-cleanup "
+                     "enqueue. Run as many as you like, on any machine "
+                     "which can see the queue and the files."))
+    parser.add_argument('queue', help="The queue file.")
+    parser.add_argument('--wait', action='store_true',
+                        help=("Keep going until every task is finished, "
+                              "rather than stopping when none are ready."))
+    parser.add_argument('--poll_seconds', metavar='S', type=float, default=1,
+                        help="Check for tasks every S seconds with --wait.")
+    parser.add_argument('--lease_seconds', metavar='S', type=float,
+                        default=60,
+                        help=("Give a task to another worker if this one "
+                              "stops renewing its lease for S seconds."))
+    parser.add_argument('--max_attempts', metavar='N', type=int, default=3,
+                        help="Give up on a task after N tries.")
+    parser.add_argument('--cache_size', metavar='N', type=int,
+                        help=("Remember up to N corrections for repeated "
+                              "tokens, or 1048576 with --cache. Without "
+                              "either there is no cache. With -n, one cache "
+                              "is shared through a manager process, which "
+                              "costs a round trip for each unknown token."))
+    parser.add_argument('--cache', metavar='FILE',
+                        help=("Keep corrections in this SQLite file so that "
+                              "later runs can reuse them."))
+    parser.set_defaults(num_processes=1, clear_cache=False)
+    args = parser.parse_args(argv)
+
+    options = {}
+    with contextlib.ExitStack() as stack:
+        correction_cache = make_cache(args, stack)
+        if correction_cache is not None:
+            options['cache'] = correction_cache
+        result = workqueue.work(
+            args.queue, wait=args.wait, poll_seconds=args.poll_seconds,
+            lease_seconds=args.lease_seconds, max_attempts=args.max_attempts,
+            **options)
+    print("Finished {done} tasks, {failed} failed.".format(**result),
+          file=sys.stderr)
+
+
+def run_server(argv):
+    """Entry point for text-cleanup serve."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup serve",
+        description=("Clean up text sent to a Unix socket, one JSON request "
+                     "per line, keeping the dictionary loaded."))
+    parser.add_argument('socket', help="Listen on this path.")
+    parser.add_argument('--num_processes', '-n', metavar='N',
+                        help="Utilize N processes.", type=int, default=1)
+    parser.add_argument('--batch_delay', metavar='S', type=float,
+                        default=0.005,
+                        help="Wait up to S seconds to batch requests.")
+    parser.add_argument('--batch_size', metavar='N', type=int, default=2**16,
+                        help="Send requests on once N characters are waiting.")
+    parser.add_argument('--cache_size', metavar='N', type=int, default=2**16,
+                        help=("Remember up to N corrections in each worker. "
+                              "0 disables the cache."))
+    parser.add_argument('--max_in_flight', metavar='N', type=int,
+                        default=256,
+                        help=("Stop reading from a client while N of its "
+                              "requests are unanswered."))
+    parser.add_argument('--confusion_model', metavar='FILE',
+                        help=("Order correction candidates for every "
+                              "request by this model from train-confusion."))
+    args = parser.parse_args(argv)
+    server.serve(args.socket, num_processes=args.num_processes,
+                 batch_delay=args.batch_delay, batch_size=args.batch_size,
+                 cache_size=args.cache_size, max_in_flight=args.max_in_flight,
+                 confusion_model=args.confusion_model)
+
+
+def train_confusion(argv):
+    """Entry point for text-cleanup train-confusion."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup train-confusion",
+        description=("Learn which corrections OCR needs most from lines of "
+                     "OCR output and the true text, separated by a tab."))
+    parser.add_argument(
+        'pairs', nargs='+', type=argparse.FileType(encoding='utf-8'),
+        help="Files of OCR<TAB>truth lines.")
+    parser.add_argument('--output', required=True,
+                        help="Write the model to this filename.")
+    parser.add_argument('--update', action='store_true',
+                        help="Add to the counts in an existing --output.")
+    args = parser.parse_args(argv)
+    model = confusion.ConfusionModel()
+    if args.update:
+        model = confusion.ConfusionModel.load(args.output)
+    for fin in args.pairs:
+        model.train(confusion.read_pairs(fin))
+    model.save(args.output)
+
+
+def run_apply_edits(argv):
+    """Entry point for text-cleanup apply-edits."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup apply-edits",
+        description="Make the corrections listed by --edits to a file.")
+    parser.add_argument(
+        'input', type=argparse.FileType(encoding='utf-8'),
+        help="The file the edits were listed for.")
+    parser.add_argument(
+        'edits', type=argparse.FileType(encoding='utf-8'),
+        help="The edits, as JSON lines.")
+    parser.add_argument(
+        '--output', type=argparse.FileType(mode='w', encoding='utf-8'),
+        help="Write results to this filename.", default=sys.stdout)
+    args = parser.parse_args(argv)
+    try:
+        output = edits.apply_edits(args.input.read(),
+                                   edits.read_edits(args.edits))
+    except ValueError as error:
+        parser.error(str(error))
+    args.output.write(output)
+
+
+def compile_dict(argv):
+    """Entry point for text-cleanup compile-dict."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup compile-dict",
+        description="Compile a word list for fast loading.")
+    parser.add_argument(
+        'words', nargs='?', default=dictionary.DEFAULT_WORDS,
+        help="The word list to compile, one word per line.")
+    parser.add_argument(
+        '--output', default=dictionary.DEFAULT_COMPILED,
+        help=("Write the compiled dictionary to this filename. It is used "
+              "automatically from the default location or "
+              "$TEXT_CLEANUP_DICT."))
+    args = parser.parse_args(argv)
+    print(dictionary.compile_words(args.words, args.output))
+
+
+def noise_weights(text):
+    """Parse the value of --noise_weights."""
+    try:
+        return benchmark.parse_weights(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
+
+def run_benchmark(argv):
+    """Entry point for text-cleanup benchmark."""
+    parser = argparse.ArgumentParser(
+        "text-cleanup benchmark",
+        description="Measure cleanup speed on text with synthetic errors.")
+    parser.add_argument(
+        '--source', type=argparse.FileType(encoding='utf-8'),
+        help=("Draw words from this text instead of the dictionary."))
+    parser.add_argument('--sizes', metavar='N', type=int, nargs='+',
+                        default=[1000], help="Corpus sizes in words.")
+    parser.add_argument('--num_processes', '-n', metavar='N', type=int,
+                        nargs='+', default=[1],
+                        help="Process counts to try for raw and XML cleanup.")
+    parser.add_argument('--noise', type=float, default=0.1,
+                        help="Fraction of words with an error.")
+    parser.add_argument(
+        '--noise_weights', metavar='KIND=W,...', type=noise_weights,
+        help=("How often each kind of error is chosen, by default {}. Kinds "
+              "left out aren't used.").format(','.join(
+                  f'{kind}={weight}'
+                  for kind, weight in benchmark.NOISE_WEIGHTS.items())))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=('search', 'index'),
+                        default='search')
+    parser.add_argument(
+        '--output', type=argparse.FileType(mode='w', encoding='utf-8'),
+        help="Write the JSON report to this filename.", default=sys.stdout)
+    args = parser.parse_args(argv)
+    source = None
+    if args.source:
+        source = parse.TOKEN_RE.findall(args.source.read())
+    report = benchmark.run(args.sizes, args.num_processes, args.noise,
+                           args.seed, source, args.noise_weights,
+                           engine=args.engine)
+    json.dump(report, args.output, indent=2)
+    args.output.write('\n')
+
+
+COMMANDS = {
+    'apply-edits': run_apply_edits,
+    'batch': run_batch,
+    'benchmark': run_benchmark,
+    'compile-dict': compile_dict,
+    'enqueue': run_enqueue,
+    'serve': run_server,
+    'train-confusion': train_confusion,
+    'worker': run_worker,
+}
 
 
 def main(argv=None):
     """Entry point for text-cleanup cli."""
+    argv = argv or sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
     parser = argparse.ArgumentParser("Clean up text.")
     parser.add_argument(
         'input', nargs='?', type=argparse.FileType(encoding='utf-8'),
@@ -22,54 +401,144 @@ def main(argv=None):
         '--selector', '-s',
         help="Only clean elements mathching this CSS selector. Implies --xml.")
     parser.add_argument('--xml', action='store_true', help="Assume XML input.")
+    parser.add_argument(
+        '--epub', action='store_true',
+        help=("Clean the content documents of an EPUB book. Implied by an "
+              "input filename ending in .epub."))
     parser.add_argument('--num_processes', '-n', metavar='N',
                         help="Utilize N processes.", type=int, default=1)
-    parser.add_argument('--disallow_substitution', action='store_false',
-                        help='Allow the correction to substitute letters.')
-    parser.add_argument('--disallow_deletion', action='store_false',
-                        help='Allow the correction to delete letters.')
-    parser.add_argument('--disallow_insertion', action='store_false',
-                        help='Allow the correction to insert letters.')
-    parser.add_argument('--avoid_capitalized_words', action='store_true',
-                        help=("Ignore words starting with a capital letter"
-                              "unless we're *really* sure."))
+    parser.add_argument('--stream', action='store_true',
+                        help=("Clean the input a chunk at a time, writing "
+                              "results as they are ready. XML input must be "
+                              "well-formed."))
+    parser.add_argument(
+        '--incremental', metavar='FILE',
+        help=("Only clean XML text which changed since the last run with "
+              "the same FILE, which remembers what was cleaned. Implies "
+              "--xml."))
+    parser.add_argument(
+        '--patch', action='store_true',
+        help=("Write XML by patching the corrections into a copy of the "
+              "input, leaving all other markup exactly as it was, instead of "
+              "writing out the parsed document."))
+    parser.add_argument(
+        '--edits', action='store_true',
+        help=("Write the corrections as JSON lines, with character offsets "
+              "into the input, instead of the cleaned up text. See "
+              "apply-edits."))
+    add_cleanup_arguments(parser)
+    parser.add_argument(
+        '--stats', metavar='FILE',
+        type=argparse.FileType(mode='w', encoding='utf-8'),
+        help=("Write a JSON report of how many tokens were valid, fixed by "
+              "each kind of edit or left alone, and candidates tried."))
+    parser.add_argument('--profile', action='store_true',
+                        help=("Time each stage too. The report goes to "
+                              "stderr unless --stats is given."))
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
         '--reformat-only', action='store_true',
         help="Prettify XML input without changing any of the text.")
 
-    args = parser.parse_args(argv or sys.argv[1:])
+    args = parser.parse_args(argv)
+    if args.clear_cache and args.cache is None:
+        parser.error("--clear-cache needs --cache")
 
     # Fix dependencies between arguments (e.g. x implies y)
-    if args.selector or args.reformat_only:
+    if args.selector or args.reformat_only or args.incremental:
         args.xml = True
     if args.selector is None:
         args.selector = ':root'
+    if args.input.name.endswith('.epub'):
+        args.epub = True
+    if args.incremental and (args.stream or args.epub):
+        parser.error("--incremental can't be used with --stream or --epub")
+    if args.patch and (args.stream or args.reformat_only):
+        parser.error("--patch can't be used with --stream or --reformat-only")
+    if args.vocabulary_min_count is not None and args.stream and \
+            (args.xml or args.epub):
+        parser.error("--vocabulary_min_count can't be used with XML or EPUB "
+                     "--stream")
+    if args.edits and (args.epub or args.incremental or args.reformat_only or
+                       (args.xml and args.stream)):
+        parser.error("--edits can't be used with --epub, --incremental, "
+                     "--reformat-only or XML --stream")
+
+    options = cleanup_options(args)
 
-    if args.xml:
-        xml = args.input.read()
-        if args.reformat_only:
-            output = XML.reformat(xml)
+    with contextlib.ExitStack() as stack:
+        collected = None
+        if args.stats or args.profile:
+            collected = stack.enter_context(stats.collect(args.profile))
+            stack.enter_context(stats.timer('total'))
+        if not args.reformat_only:
+            correction_cache = make_cache(args, stack)
+            if correction_cache is not None:
+                options['cache'] = correction_cache
+
+        def make_bar(items):
+            return progressbar.progressbar(items)
+
+        if args.epub:
+            source = args.input.buffer
+            if not source.seekable():
+                source = io.BytesIO(source.read())
+            epub.clean_epub(
+                source, args.output.buffer, args.selector,
+                progress_iterator=make_bar, num_processes=args.num_processes,
+                stream=args.stream, patch=args.patch, **options)
+            output = ''
+        elif args.edits and args.xml:
+            edits.write_edits(XML.find_edits(
+                args.input.read(), args.selector, progress_iterator=make_bar,
+                num_processes=args.num_processes, **options), args.output)
+            output = ''
+        elif args.edits:
+            edits.write_edits(raw.find_edits_stream(
+                args.input, num_processes=args.num_processes, **options),
+                args.output)
+            output = ''
+        elif args.xml and args.stream and not args.reformat_only:
+            XML.clean_stream(args.input, args.output, args.selector, **options)
+            output = ''
+        elif args.xml:
+            xml = args.input.read()
+            if args.reformat_only:
+                output = XML.reformat(xml)
+            elif args.incremental:
+                output = incremental.clean_element(
+                    xml, args.incremental, args.selector,
+                    progress_iterator=make_bar,
+                    num_processes=args.num_processes, patch=args.patch,
+                    **options)
+            else:
+                output = XML.clean_element(
+                    xml, args.selector, progress_iterator=make_bar,
+                    num_processes=args.num_processes, patch=args.patch,
+                    **options)
+        elif args.num_processes > 1:
+            raw.cleanup_parallel(args.input, args.output, args.num_processes,
+                                 **options)
+            output = ''
+        elif args.stream:
+            raw.cleanup_stream(args.input, args.output, **options)
+            output = ''
         else:
-            def make_bar(items):
-                return progressbar.progressbar(items)
-            output = XML.clean_element(
-                xml, args.selector, progress_iterator=make_bar,
-                num_processes=args.num_processes,
-                insertion=not args.disallow_insertion,
-                deletion=not args.disallow_deletion,
-                substitution=not args.disallow_substitution,
-                avoid_capitalized_words=args.avoid_capitalized_words,
-            )
-    else:
-        text = args.input.read()
-        output = raw.cleanup(
-            text,
-            insertion=not args.disallow_insertion,
-            deletion=not args.disallow_deletion,
-            substitution=not args.disallow_substitution,
-            avoid_capitalized_words=args.avoid_capitalized_words,
-        )
+            text = args.input.read()
+            with stats.timer('correct'):
+                output = raw.cleanup(text, **options)
+
+        if collected is not None and 'cache' in options:
+            # Before the cache is closed
+            info = options['cache'].info()
+
+    if collected is not None:
+        report = collected.as_dict()
+        if 'cache' in options:
+            report['cache'] = info
+        report_file = args.stats or sys.stderr
+        json.dump(report, report_file, indent=2)
+        report_file.write('\n')
 
     args.output.write(output)
 
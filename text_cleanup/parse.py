@@ -7,4 +7,10 @@ WORD_PATTERN = r"(?:[\w'-]+)"
 NUMBER_PATTERN = r"(?:(?:\d+(?:[.,])?)*\d+)"
 
 TOKEN_RE = re.compile('|'.join((WORD_PATTERN, NUMBER_PATTERN)))
+# Splits text into [between, token, between, token, ..., between]
+TOKEN_SPLIT_RE = re.compile('({})'.format(TOKEN_RE.pattern))
 NUMBER_RE = re.compile(NUMBER_PATTERN)
+
+# The longest prefix ending in whitespace that can't be part of a "- "
+# dehyphenation, so it can be cleaned independently of what follows.
+SPLIT_RE = re.compile(r'.*(?<!-)\s', re.DOTALL)
@@ -2,13 +2,29 @@
 # -*- coding: utf-8 -*-
 """Functions for cleaning up text, typically from bad OCR scans."""
 
+import bisect
+import collections
+import functools
 import itertools
+import multiprocessing
+import multiprocessing.pool
+import re
 import string
+import time
 
-from typing import Tuple, List, Dict, Set, Iterable, TypeVar
+from typing import (
+    Any, Deque, Tuple, List, Dict, Iterable, Iterator, Optional, Set,
+    TextIO, TypeVar)
 
+from text_cleanup import dictionary
+from text_cleanup import edits
+from text_cleanup import fallback
 from text_cleanup import parse
-from text_cleanup import utils
+from text_cleanup import segment as segmentation
+from text_cleanup import stats
+from text_cleanup import symspell
+from text_cleanup import vocabulary as promotion
+from text_cleanup.dictionary import get_valid_words  # noqa: F401
 
 A = TypeVar('A')  # pylint: disable=invalid-name
 B = TypeVar('B')  # pylint: disable=invalid-name
@@ -39,18 +55,17 @@ def build_index(groups: Iterable[str]) -> Dict[str, str]:
 PREFERRED_ERRORS = build_index(ERROR_GROUPS)
 
 
-def get_valid_words(filename=None) -> Set[str]:
-    """Return set of valid words, read from filename if present."""
-    with open(filename or '/usr/share/dict/words') as fin:
-        words = fin.read().splitlines()
-    # Remove one-letter words that aren't 'a', 'A' or 'I'.
-    valid = set(w for w in words if len(w) > 1 or w in 'aAI')
-    # Allow any word to be capitalized, since it might start a sentence.
-    valid.update(w.capitalize() for w in words if w[0].islower())
-    return valid
+WORDS = dictionary.Words()
 
 
-WORDS = get_valid_words()
+def load_words(filename: Optional[str] = None) -> None:
+    """Load WORDS now rather than on first use, e.g. in a pool initializer.
+
+    Pass WORDS.compiled() from the parent so that every worker shares one
+    mmap'd copy of the dictionary."""
+    if filename is not None:
+        WORDS.use(filename)
+    WORDS.load()
 
 
 def spellcheck(wordstr: str) -> bool:
@@ -67,6 +82,26 @@ def spellcheck(wordstr: str) -> bool:
     return hyphenated[0] != wordstr and all(map(spellcheck, hyphenated))
 
 
+# Candidates which spellcheck() might pass even though they aren't in WORDS
+SPECIAL_RE = re.compile(r'[\s\d-]')
+
+
+def first_valid(candidates: List[str]) -> Optional[str]:
+    """Return the first of candidates which passes spellcheck(), or None.
+
+    Plain words are looked up in WORDS all at once, leaving only those with
+    spaces, hyphens or digits to spellcheck() one by one."""
+    good = WORDS.known(candidates)
+    for word in filter(SPECIAL_RE.search, candidates):
+        if spellcheck(word):
+            good.add(word)
+    if '' in candidates:
+        good.add('')
+    if not good:
+        return None
+    return next(word for word in candidates if word in good)
+
+
 def one_space(word: str) -> Iterable[str]:
     """Yield words made by inserting a single space into word."""
     for i in range(1, len(word)):
@@ -92,14 +127,20 @@ def one_insertion(word: str) -> Iterable[str]:
         yield word + newchar
 
 
-def one_substitution(word: str) -> Iterable[str]:
-    """Yield words made by substituting a single letter in word."""
-    # Check for any preferred errors before trying brute force substitution
+def one_preferred_substitution(word: str) -> Iterable[str]:
+    """Yield words made by substituting a single letter in word with another
+    from the same group of ERROR_GROUPS."""
     for i, letter in enumerate(word):
         for newchar in PREFERRED_ERRORS.get(letter, ''):
             if newchar != letter:
                 yield word[:i] + newchar + word[i+1:]
 
+
+def one_substitution(word: str) -> Iterable[str]:
+    """Yield words made by substituting a single letter in word."""
+    # Check for any preferred errors before trying brute force substitution
+    yield from one_preferred_substitution(word)
+
     # No luck... time to brute force
     alphabet = string.ascii_lowercase
     for i, letter in enumerate(word):
@@ -109,35 +150,191 @@ def one_substitution(word: str) -> Iterable[str]:
                 yield word[:i] + newchar + word[i+1:]
 
 
-def one_error(word: str,
-              space: bool = True,
-              substitution: bool = True,
-              insertion: bool = True,
-              deletion: bool = True) -> Iterable[str]:
-    """Yield one-error variations on word."""
+def error_batches(word: str,
+                  space: bool = True,
+                  substitution: bool = True,
+                  insertion: bool = True,
+                  deletion: bool = True,
+                  confusion=None) -> Iterator[List[str]]:
+    """Yield lists of the one-error variations on word, a kind at a time, in
+    the same order as one_error().
+
+    With a text_cleanup.confusion.ConfusionModel, the variations it has seen
+    fixes like come first, most likely first, and aren't repeated later."""
+    record = stats.ACTIVE
+    modelled: Set[str] = set()
+
+    def batch(kind, candidates):
+        candidates = [candidate for candidate in candidates
+                      if candidate not in modelled]
+        if record is not None:
+            record.count('generated.' + kind, len(candidates))
+        return candidates
 
     # Rewrapping text can leave unnecesarry hyphenations like 'mini-mize'
     unhyphenated = word.replace('-', '')
     if unhyphenated != word:
-        yield unhyphenated
+        yield [unhyphenated]
+
+    if confusion is not None:
+        likely = batch('model', confusion.likely(
+            word, space, substitution, insertion, deletion))
+        yield likely
+        modelled.update(likely)
 
     # Missing spaces seems most common, so check all possible splits first
     if space:
-        yield from one_space(word)
+        yield batch('space', one_space(word))
     if substitution:
-        yield from one_substitution(word)
+        # The preferred substitutions are few, and usually enough
+        preferred = list(one_preferred_substitution(word))
+        yield batch('substitution', preferred)
+        yield batch('substitution', itertools.islice(
+            one_substitution(word), len(preferred), None))
     if deletion:
-        yield from one_deletion(word)
+        yield batch('deletion', one_deletion(word))
     if insertion:
-        yield from one_insertion(word)
+        yield batch('insertion', one_insertion(word))
+
+
+def one_error(word: str,
+              space: bool = True,
+              substitution: bool = True,
+              insertion: bool = True,
+              deletion: bool = True,
+              confusion=None) -> Iterable[str]:
+    """Yield one-error variations on word."""
+    return itertools.chain.from_iterable(error_batches(
+        word, space, substitution, insertion, deletion, confusion))
+
+
+def candidate_batches(given: str, errors: int = 2,
+                      split: Optional[str] = None,
+                      **kwargs) -> Iterator[List[str]]:
+    """Yield lists of the variations on given with up to errors errors,
+    fewest first. kwargs are passed to error_batches()
+
+    split, such as given cut into several words, is a batch of its own
+    after the variations with one error."""
+    level = [given]
+    yield level
+    if split is not None and errors < 1:
+        yield [split]
+    for depth in range(errors):
+        last = depth == errors - 1
+        # The same variation can come from several words, but only needs
+        # to be varied again once
+        following: Dict[str, None] = {}
+        for word in level:
+            for batch in error_batches(word, **kwargs):
+                yield batch
+                if not last:
+                    following.update(dict.fromkeys(batch))
+        if depth == 0 and split is not None:
+            yield [split]
+        level = list(following)
+
+
+@functools.lru_cache(maxsize=None)
+def deletion_index() -> symspell.DeletionIndex:
+    """Return the deletion index of WORDS, building it on first use."""
+    return symspell.DeletionIndex(WORDS)
+
+
+@functools.lru_cache(maxsize=None)
+def distance_index() -> fallback.DistanceIndex:
+    """Return WORDS as arrays for fallback_correction(), building them on
+    first use."""
+    return fallback.DistanceIndex(WORDS, PREFERRED_ERRORS)
+
+
+@functools.lru_cache(maxsize=None)
+def segmenter() -> segmentation.Segmenter:
+    """Return the segmenter for WORDS, building it on first use."""
+    return segmentation.Segmenter(WORDS, WORDS,
+                                  max_length=WORDS.max_length())
+
+
+def index_search(given: str,
+                 errors: int = 2,
+                 space: bool = True,
+                 **kwargs) -> Optional[str]:
+    """Return a correction of given found with the deletion index, or None.
+
+    Prefers the same corrections as the brute force search: fewer errors
+    first, then unhyphenation, then missing spaces, then the
+    substitutions, deletions and insertions in the order one_error tries
+    them. kwargs toggle substitution, insertion and deletion."""
+    index = deletion_index()
+    memo: Dict[Tuple[str, int], Optional[str]] = {}
+
+    def nearest(word: str, cost: int) -> Optional[str]:
+        """Return the best valid word at most cost letter edits away."""
+        found = []
+        for candidate in index.candidates(word, cost):
+            key = symspell.edit_key(word, candidate, cost, PREFERRED_ERRORS,
+                                    **kwargs)
+            if key is not None:
+                found.append((key, candidate))
+        if found:
+            return min(found)[1]
+        # Hyphenated words are valid when every part is, so fix one part.
+        parts = word.split('-')
+        if len(parts) > 1:
+            for i, part in enumerate(parts):
+                others = parts[:i] + parts[i+1:]
+                if part and all(map(spellcheck, others)):
+                    fixed = nearest(part, cost)
+                    if fixed is not None:
+                        return '-'.join(parts[:i] + [fixed] + parts[i+1:])
+        return None
+
+    def within(word: str, cost: int) -> Optional[str]:
+        """Return the preferred correction using at most cost errors."""
+        if (word, cost) not in memo:
+            memo[word, cost] = next(
+                (found for found in (exactly(word, c) for c in range(cost + 1))
+                 if found is not None), None)
+        return memo[word, cost]
+
+    def exactly(word: str, cost: int) -> Optional[str]:
+        """Return the preferred correction using cost errors."""
+        if cost == 0:
+            return word if spellcheck(word) else None
+        unhyphenated = word.replace('-', '')
+        if unhyphenated != word:
+            found = within(unhyphenated, cost - 1)
+            if found is not None:
+                return found
+        if space:
+            for i in range(1, len(word)):
+                for left_cost in range(cost):
+                    left = within(word[:i], left_cost)
+                    right = left and within(word[i:], cost - 1 - left_cost)
+                    # spellcheck() passes any part ending in a hyphen, but
+                    # not once it is split from the rest of the word
+                    if right and spellcheck(f'{left} {right}'):
+                        return f'{left} {right}'
+        return nearest(word, cost)
+
+    return within(given, errors)
 
 
 def correct_misspelling(given: str,
                         errors=2,
                         space=True,
                         avoid_capitalized_words=False,
+                        engine='search',
+                        segment=True,
+                        cache=None,
                         **kwargs) -> Tuple[bool, str]:
-    """Return (bool, guess), True when guess is a known good word."""
+    """Return (bool, guess), True when guess is a known good word.
+
+    engine is 'search' to try every one_error() candidate in turn or
+    'index' to look corrections up with deletion_index(). With segment,
+    words run together without spaces are split up first. Searches are
+    memoized in cache, e.g. a text_cleanup.cache.CorrectionCache, unless
+    they ran out of max_seconds."""
     first_letter = given[0]
     rest = given[1:]
 
@@ -153,25 +350,395 @@ def correct_misspelling(given: str,
     if spellcheck(given):
         return True, given
 
+    if cache is None:
+        return search_correction(given, errors, space, engine, segment,
+                                 **kwargs)
+    key = (given, errors, space, engine, segment,
+           tuple(sorted(kwargs.items())))
+    result = cache.get(key)
+    if result is None:
+        start = time.perf_counter()
+        result = search_correction(given, errors, space, engine, segment,
+                                   **kwargs)
+        # With more time, or less load, the search might find something
+        max_seconds = kwargs.get('max_seconds')
+        if result[0] or max_seconds is None or \
+                time.perf_counter() - start <= max_seconds:
+            cache.put(key, result)
+    return result
+
+
+def search_correction(given: str,
+                      errors=2,
+                      space=True,
+                      engine='search',
+                      segment=True,
+                      max_candidates: Optional[int] = None,
+                      max_seconds: Optional[float] = None,
+                      max_search_length: Optional[int] = None,
+                      fallback_distance: Optional[float] = None,
+                      **kwargs) -> Tuple[bool, str]:
+    """Return (bool, guess) for a word which isn't valid as it is.
+
+    If nothing is found within errors, and fallback_distance is given, try
+    fallback_correction() with it.
+
+    The search for each word can be bounded so that long garbage tokens
+    can't stall the rest of the text: give up after trying max_candidates
+    candidates or after max_seconds, and don't search words longer than
+    max_search_length at all. Words left alone this way count as
+    'budget_exceeded' in text_cleanup.stats."""
+    # Splitting into two words is left to the search, which prefers it
+    # anyway but also knows when it needs a correction as well. Long words
+    # can often be cut into short ones, e.g. 'disapoint' into 'dis a point',
+    # so corrections with a single error come first.
+    split = None
+    if segment and space:
+        split = segmenter().segment(given)
+        if split is not None and split.count(' ') < 2:
+            split = None
+
+    if max_search_length is not None and len(given) > max_search_length:
+        if split is not None:
+            return segmented(split)
+        return budget_exceeded(given, 'length')
+
+    if engine == 'index':
+        # The index finds the closest corrections, so there's nothing to order
+        kwargs.pop('confusion', None)
+        found = index_search(given, min(errors, 1), space=space, **kwargs)
+        if found is None and split is not None:
+            return segmented(split)
+        if found is None and errors > 1:
+            found = index_search(given, errors, space=space, **kwargs)
+        if found is not None:
+            return True, found
+        if fallback_distance is not None:
+            return fallback_correction(given, fallback_distance, **kwargs)
+        return False, given
+
     # Lazily generate all possible corrections, retuning the first good one.
-    def func(words):
-        for word in words:
-            yield from one_error(word, space=space, **kwargs)
-    result_iter = utils.iterate(func, iter([given]), errors)
-    candidates: Iterable[str] = itertools.chain.from_iterable(result_iter)
-    for word in candidates:
-        if spellcheck(word):
-            return True, word
+    # Each batch is checked in one go, which is much quicker than checking
+    # each candidate in turn.
+    deadline = None
+    if max_seconds is not None:
+        deadline = time.perf_counter() + max_seconds
+    found = None
+    tried = 0
+    for batch in candidate_batches(given, errors, split, space=space,
+                                   **kwargs):
+        if max_candidates is not None:
+            batch = batch[:max_candidates - tried]
+        tried += len(batch)
+        found = first_valid(batch)
+        if found is not None or tried == max_candidates:
+            break
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('candidates', tried)
+    if found is not None and found == split:
+        return segmented(split)
+    if found is not None:
+        return True, found
+    if deadline is not None and time.perf_counter() > deadline:
+        return budget_exceeded(given, 'seconds')
+    if max_candidates is not None and tried == max_candidates:
+        return budget_exceeded(given, 'candidates')
+    if fallback_distance is not None:
+        return fallback_correction(given, fallback_distance, **kwargs)
     return False, given
 
 
+def fallback_correction(given: str, max_distance: float,
+                        substitution: bool = True, insertion: bool = True,
+                        deletion: bool = True,
+                        **_kwargs) -> Tuple[bool, str]:
+    """Return (True, the closest valid word) if there is one at most
+    max_distance edits from given, otherwise (False, given).
+
+    Substitutions within PREFERRED_ERRORS count as half an edit. So that
+    short garbage isn't turned into some arbitrary word, no more than a
+    third of the letters may be edited."""
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('fallback')
+    found = distance_index().nearest(
+        given, min(max_distance, len(given) / 3), substitution=substitution,
+        insertion=insertion, deletion=deletion)
+    if found is None:
+        return False, given
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('fallback.found')
+    return True, found
+
+
+def segmented(split: str) -> Tuple[bool, str]:
+    """Return split as a correction, counting it as 'segmented'."""
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('segmented')
+    return True, split
+
+
+def budget_exceeded(given: str, budget: str) -> Tuple[bool, str]:
+    """Return given unchanged, counting that the budget ran out."""
+    if stats.ACTIVE is not None:
+        stats.ACTIVE.count('budget_exceeded')
+        stats.ACTIVE.count('budget_exceeded.' + budget)
+    return False, given
+
+
+def correct_tokens(tokens: List[str], vocabulary: Iterable[str] = (),
+                   vocabulary_min_count: Optional[int] = None,
+                   **kwargs) -> Dict[str, str]:
+    """Return the correction of each of tokens which needs one. kwargs are
+    passed to correct_misspelling().
+
+    Tokens in vocabulary are accepted as they are. With
+    vocabulary_min_count, so are those promote_tokens() finds in tokens."""
+    # Most tokens are common words, so rather than correct every one, check
+    # the distinct tokens all at once and correct each unknown one once.
+    unique = set(tokens)
+    if vocabulary_min_count is not None:
+        vocabulary = itertools.chain(
+            vocabulary, promote_tokens(tokens, vocabulary_min_count))
+    accepted = unique.intersection(vocabulary)
+    valid = WORDS.known(unique)
+    # Valid words starting with 'I' or 'A' may still need splitting
+    results = {token: correct_misspelling(token, **kwargs)
+               for token in unique - accepted
+               if token not in valid or token[0] in 'IA'}
+
+    if stats.ACTIVE is not None:
+        for token, number in collections.Counter(tokens).items():
+            result = results.get(token, (True, token))
+            record_correction(token, result, number)
+
+    return {token: guess for token, (_good, guess) in results.items()
+            if guess != token}
+
+
+def promote_tokens(tokens: Iterable[str], min_count: int) -> List[str]:
+    """Return the unknown tokens which appear at least min_count times and
+    are nearly always spelled the same way, as
+    text_cleanup.vocabulary.promote() decides, in order. They are counted
+    in stats.ACTIVE as 'vocabulary.' and the token."""
+    def suspect(token: str) -> bool:
+        # Misreadings like 'tbe' are common too, even without 'the' nearby
+        return spellcheck(token) or first_valid(
+            list(one_preferred_substitution(token))) is not None
+
+    counts = collections.Counter(tokens)
+    promoted = promotion.promote(counts, suspect, min_count)
+    if stats.ACTIVE is not None:
+        for token, number in promoted.items():
+            stats.ACTIVE.count('vocabulary.' + token, number)
+    return sorted(promoted)
+
+
+def document_vocabulary(texts: Iterable[str], min_count: int) -> List[str]:
+    """Return promote_tokens() of the tokens in all of texts together, to
+    pass to cleanup() as its vocabulary."""
+    return promote_tokens((token for text in texts
+                           for token in parse.TOKEN_RE.findall(
+                               text.replace('- ', '-'))), min_count)
+
+
 def cleanup(given: str, **kwargs) -> str:
     """Return a corrected version of given text."""
     # Re-wrapped text can rejoin lines broken at hyphens, but then you have
     # extra spaces in there, e.g. "mini- mize"
     given = given.replace('- ', '-')
 
-    def silent_fix(wordmatch):
-        return correct_misspelling(wordmatch.group(), **kwargs)[1]
-
-    return parse.TOKEN_RE.sub(silent_fix, given)
+    pieces = parse.TOKEN_SPLIT_RE.split(given)
+    tokens = pieces[1::2]
+    fixed = correct_tokens(tokens, **kwargs)
+    if not fixed:
+        return given
+    pieces[1::2] = map(fixed.get, tokens, tokens)
+    return ''.join(pieces)
+
+
+def find_edits(given: str, **kwargs) -> List[edits.Edit]:
+    """Return the edits cleanup(given) makes, in order, with offsets into
+    given. kwargs are passed to cleanup()."""
+    # Where "- " is rejoined the space is removed, so offsets in the rejoined
+    # text are after fewer characters of given.
+    removed = [match.start() + 1 for match in re.finditer('- ', given)]
+    shifted = [space - number for number, space in enumerate(removed)]
+
+    def original(offset):
+        return offset + bisect.bisect_right(shifted, offset)
+
+    pieces = parse.TOKEN_SPLIT_RE.split(given.replace('- ', '-'))
+    tokens = pieces[1::2]
+    fixed = correct_tokens(tokens, **kwargs)
+
+    found: List[edits.Edit] = []
+    offset = 0
+    for i, piece in enumerate(pieces):
+        if i % 2 and piece in fixed:
+            start = original(offset)
+            end = original(offset + len(piece) - 1) + 1
+            if given[end - 1:end + 1] == '- ':
+                # The token ends with a rejoined hyphen, e.g. "a- ."
+                end += 1
+            kinds = set(stats.classify(piece, fixed[piece],
+                                       PREFERRED_ERRORS).split('+'))
+            if '- ' in given[start:end]:
+                kinds.add('unhyphenation')
+            found.append((start, end, given[start:end], fixed[piece],
+                          '+'.join(sorted(kinds))))
+        offset += len(piece)
+
+    # Rejoined hyphens which aren't part of a correction
+    covered = {space for start, end, *_rest in found
+               for space in removed[bisect.bisect_left(removed, start):
+                                    bisect.bisect_left(removed, end)]}
+    found.extend((space - 1, space + 1, '- ', '-', 'unhyphenation')
+                 for space in removed if space not in covered)
+    found.sort()
+    return found
+
+
+def record_correction(given: str, result: Tuple[bool, str],
+                      number: int = 1) -> None:
+    """Count the outcome of correct_misspelling(given), seen number times,
+    in stats.ACTIVE."""
+    record = stats.ACTIVE
+    if record is None:
+        return
+    record.count('tokens', number)
+    good, guess = result
+    if not good:
+        record.count('tokens.uncorrectable', number)
+    elif guess == given:
+        record.count('tokens.valid', number)
+    else:
+        record.count('tokens.fixed', number)
+        kind = stats.classify(given, guess, PREFERRED_ERRORS)
+        record.count('fixed.' + kind, number)
+
+
+def cleanup_batch(texts: Iterable[str], **kwargs) -> List[str]:
+    """Return corrected versions of each of texts."""
+    return [cleanup(text, **kwargs) for text in texts]
+
+
+def find_edits_batch(texts: Iterable[str], **kwargs) -> List[List[edits.Edit]]:
+    """Return the edits which correct each of texts."""
+    return [find_edits(text, **kwargs) for text in texts]
+
+
+def split_chunks(fin: TextIO, chunk_size: int = 2**16) -> Iterator[str]:
+    """Yield consecutive pieces of the text in fin which can be cleaned
+    independently, each at least chunk_size long except the last."""
+    pending = ''
+    while True:
+        data = fin.read(chunk_size)
+        if not data:
+            break
+        pending += data
+        match = parse.SPLIT_RE.match(pending)
+        if match and match.end() >= chunk_size:
+            yield pending[:match.end()]
+            pending = pending[match.end():]
+    if pending:
+        yield pending
+
+
+def shared_vocabulary(chunks: Iterable[str],
+                      kwargs: Dict[str, Any]) -> Iterable[str]:
+    """Return chunks, but if kwargs has a vocabulary_min_count, replace it
+    with the document_vocabulary() of all of the chunks together, so that
+    every chunk is cleaned the same as the whole text would be. The chunks
+    are then all read first."""
+    min_count = kwargs.pop('vocabulary_min_count', None)
+    if min_count is None:
+        return chunks
+    chunks = list(chunks)
+    kwargs['vocabulary'] = list(itertools.chain(
+        kwargs.get('vocabulary', ()),
+        document_vocabulary(chunks, min_count)))
+    return chunks
+
+
+def cleanup_stream(fin: TextIO, fout: TextIO, chunk_size: int = 2**16,
+                   **kwargs) -> None:
+    """Write a corrected version of the text in fin to fout, a chunk at a
+    time. kwargs are passed to cleanup(), except that a
+    vocabulary_min_count is counted over the whole text."""
+    for chunk in shared_vocabulary(split_chunks(fin, chunk_size), kwargs):
+        fout.write(cleanup(chunk, **kwargs))
+
+
+def map_chunks(function, chunks: Iterable[str], num_processes: int = 1,
+               chunks_per_process: int = 4,
+               **kwargs) -> Iterator[Tuple[str, A]]:
+    """Yield each of chunks and function(chunk, **kwargs), in order. If
+    num_processes > 1, they are run in a pool of worker processes."""
+    if num_processes <= 1:
+        for chunk in chunks:
+            yield chunk, function(chunk, **kwargs)
+        return
+
+    record = stats.ACTIVE
+    # Workers share one mmap'd copy of the dictionary
+    words = WORDS.compiled()
+    with multiprocessing.Pool(num_processes, initializer=load_words,
+                              initargs=(words,)) as pool:
+        pending: Deque[Tuple[str, multiprocessing.pool.AsyncResult]] = \
+            collections.deque()
+
+        def next_result():
+            chunk, future = pending.popleft()
+            result = future.get()
+            if record is not None:
+                result, collected = result
+                record.merge(collected)
+            return chunk, result
+
+        for chunk in chunks:
+            if record is None:
+                future = pool.apply_async(function, (chunk,), kwargs)
+            else:
+                # Workers collect their own statistics to send back
+                future = pool.apply_async(
+                    stats.collecting,
+                    (function, (chunk,), kwargs, record.timing))
+            pending.append((chunk, future))
+            # Only read ahead a few chunks, so memory doesn't grow with the
+            # size of the input
+            if len(pending) >= num_processes * chunks_per_process:
+                yield next_result()
+        while pending:
+            yield next_result()
+
+
+def cleanup_parallel(fin: TextIO, fout: TextIO, num_processes: int,
+                     chunk_size: int = 2**16, chunks_per_process: int = 4,
+                     **kwargs) -> None:
+    """Write a corrected version of the text in fin to fout, like
+    cleanup_stream(), but cleaning the chunks in a pool of num_processes
+    worker processes. The output is the same. kwargs are passed to
+    cleanup(), except that a vocabulary_min_count is counted over the whole
+    text."""
+    chunks = shared_vocabulary(split_chunks(fin, chunk_size), kwargs)
+    for _chunk, result in map_chunks(cleanup, chunks, num_processes,
+                                     chunks_per_process, **kwargs):
+        fout.write(result)
+
+
+def find_edits_stream(fin: TextIO, chunk_size: int = 2**16,
+                      num_processes: int = 1, chunks_per_process: int = 4,
+                      **kwargs) -> Iterator[edits.Edit]:
+    """Yield the edits cleanup() makes to the text in fin, in order, with
+    offsets from its start. It is read a chunk at a time, and the chunks
+    are cleaned in a pool if num_processes > 1. kwargs are passed to
+    cleanup(), except that a vocabulary_min_count is counted over the whole
+    text."""
+    offset = 0
+    chunks = shared_vocabulary(split_chunks(fin, chunk_size), kwargs)
+    for chunk, found in map_chunks(find_edits, chunks, num_processes,
+                                   chunks_per_process, **kwargs):
+        yield from edits.shift(found, offset)
+        offset += len(chunk)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Split run-together words into valid words by dynamic programming."""
+
+from typing import Container, Iterable, List, Optional, Tuple
+
+
+class Segmenter:
+    """Find the best way to split text into words from a dictionary.
+
+    The search from each position only goes as far as the longest word, so
+    it takes O(n * longest word) dictionary probes. Nothing else is kept,
+    so that pool workers don't each build an index of their own."""
+
+    def __init__(self, words: Iterable[str],
+                 valid: Optional[Container[str]] = None,
+                 min_mean_length: float = 3,
+                 max_length: Optional[int] = None) -> None:
+        self.min_mean_length = min_mean_length
+        if valid is None:
+            words = valid = set(words)
+        self.valid = valid
+        if max_length is None:
+            max_length = max(map(len, words), default=0)
+        self.max_length = max_length
+
+    def is_word(self, piece: str) -> bool:
+        """Return True if piece can stand on its own in a split."""
+        return (len(piece) > 1 or piece in 'aAI') and piece in self.valid
+
+    def split(self, text: str) -> Optional[List[str]]:
+        """Return text split into the fewest words, or None if it can't be.
+
+        Ties go to the split with the longest words."""
+        # best[j] is (pieces, -sum of squared lengths, start) for text[:j]
+        best: List[Optional[Tuple[int, int, int]]] = [None] * (len(text) + 1)
+        best[0] = (0, 0, 0)
+        for i in range(len(text)):
+            if best[i] is None:
+                continue
+            pieces, score, _start = best[i]  # type: ignore
+            for j in range(i + 1, min(len(text), i + self.max_length) + 1):
+                if self.is_word(text[i:j]):
+                    candidate = (pieces + 1, score - (j - i)**2, i)
+                    if best[j] is None or candidate < best[j]:  # type: ignore
+                        best[j] = candidate
+        if best[-1] is None:
+            return None
+        words = []
+        end = len(text)
+        while end:
+            start = best[end][2]  # type: ignore
+            words.append(text[start:end])
+            end = start
+        return words[::-1]
+
+    def segment(self, text: str) -> Optional[str]:
+        """Return text with spaces between its words, or None.
+
+        Hyphenated parts are split separately and keep their hyphens. Splits
+        into lots of short words are more likely to be OCR noise than words
+        run together, so those give None too."""
+        parts = []
+        count = 0
+        for part in text.split('-'):
+            words = self.split(part) if part else ['']
+            if words is None:
+                return None
+            count += len(words)
+            parts.append(' '.join(words))
+        if len(text) - text.count('-') < self.min_mean_length * count:
+            return None
+        return '-'.join(parts)
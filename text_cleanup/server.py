@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Serve cleanup requests over a Unix socket, keeping the dictionary and a
+pool of workers warm between them.
+
+Each request is a line of JSON like
+
+    {"id": 1, "text": "Some tixt", "xml": false, "selector": ":root",
+     "options": {"engine": "index"}}
+
+and each response is a line of JSON with the same id and either "result"
+or "error". Responses are written as soon as they're ready, so clients can
+send many requests without waiting and get them back in any order, though
+a client with too many requests in flight isn't read from until some are
+answered. Small requests with the same options arriving together are
+cleaned as one batch. A confusion model can't be sent in the options, but
+the server can be started with one to use for every request.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import socket
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from text_cleanup import cache, confusion, raw, XML
+
+# The cleanup() kwargs which clients may set
+OPTIONS = frozenset([
+    'avoid_capitalized_words', 'deletion', 'engine', 'errors',
+    'fallback_distance', 'insertion', 'max_candidates', 'max_search_length',
+    'max_seconds', 'segment', 'space', 'substitution',
+    'vocabulary_min_count',
+])
+# Longest request line accepted
+LIMIT = 2**28
+
+Request = Tuple[bool, str, str]  # xml, selector, text
+
+_CACHE: Optional[cache.CorrectionCache] = None
+_CONFUSION: Optional[confusion.ConfusionModel] = None
+
+
+class ServerError(Exception):
+    """The server couldn't clean up a request."""
+
+
+def init_worker(words: str, cache_size: int,
+                confusion_model: Optional[str] = None) -> None:
+    """Load the compiled dictionary in words and any confusion model, and
+    make a correction cache for this worker."""
+    global _CACHE, _CONFUSION  # pylint: disable=global-statement
+    raw.load_words(words)
+    if cache_size:
+        _CACHE = cache.CorrectionCache(cache_size)
+    if confusion_model is not None:
+        _CONFUSION = confusion.ConfusionModel.load(confusion_model)
+
+
+def describe(error: Exception) -> str:
+    """Return error as it is reported to clients."""
+    return f'{type(error).__name__}: {error}'
+
+
+def clean_batch(requests: List[Request],
+                options: Dict[str, Any]) -> List[Tuple[Optional[str],
+                                                       Optional[str]]]:
+    """Return (result, None) for each request, with its text cleaned up, or
+    (None, error) if it couldn't be. One bad request doesn't affect the
+    others batched with it."""
+    kwargs = dict(options)
+    if _CACHE is not None:
+        kwargs['cache'] = _CACHE
+    if _CONFUSION is not None:
+        kwargs['confusion'] = _CONFUSION
+    results: List[Tuple[Optional[str], Optional[str]]] = []
+    for xml, selector, text in requests:
+        try:
+            results.append((XML.clean_element(text, selector, **kwargs)
+                            if xml else raw.cleanup(text, **kwargs), None))
+        except Exception as error:  # pylint: disable=broad-except
+            # Not every exception can be pickled back to the server
+            results.append((None, describe(error)))
+    return results
+
+
+class Server:
+    """Clean up requests from clients of a Unix socket in a process pool.
+
+    Requests are held for up to batch_delay seconds, or until batch_size
+    characters of them arrive, so that they can be sent to the pool
+    together. Each client can have up to max_in_flight requests waiting
+    for responses. Every request is cleaned with the confusion model saved
+    in confusion_model, if given."""
+
+    def __init__(self, path: str, num_processes: int = 1,
+                 batch_delay: float = 0.005, batch_size: int = 2**16,
+                 cache_size: int = 2**16, max_in_flight: int = 256,
+                 confusion_model: Optional[str] = None) -> None:
+        self.path = path
+        self.num_processes = num_processes
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.max_in_flight = max_in_flight
+        self.confusion_model = confusion_model
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Requests waiting to be sent to the pool, by options
+        self._pending: Dict[str, List[Tuple[Request, asyncio.Future]]] = {}
+        self._pending_size: Dict[str, int] = {}
+
+    async def start(self) -> None:
+        """Start the pool and listen for clients."""
+        # Forking once the event loop and executor threads are running can
+        # deadlock the workers, so start them from a clean process instead.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.num_processes, initializer=init_worker,
+            initargs=(raw.WORDS.compiled(), self.cache_size,
+                      self.confusion_model),
+            mp_context=multiprocessing.get_context('forkserver'))
+        self._server = await asyncio.start_unix_server(
+            self.handle, self.path, limit=LIMIT)
+
+    async def serve_forever(self) -> None:
+        """Start if need be, then serve clients until cancelled."""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()  # type: ignore
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """Stop listening and shut the pool down."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Answer each request from a client as soon as it's ready."""
+        lock = asyncio.Lock()
+        # Stop reading while the client has too many requests in flight
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        tasks: Set[asyncio.Future] = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            await in_flight.acquire()
+            task = asyncio.ensure_future(self.respond(line, writer, lock))
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _task: in_flight.release())
+            tasks.add(task)
+        await asyncio.gather(*tasks)
+        writer.close()
+
+    async def respond(self, line: bytes, writer: asyncio.StreamWriter,
+                      lock: asyncio.Lock) -> None:
+        """Write the response to one request line."""
+        response: Dict[str, Any] = {}
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            response['result'] = await self.clean(
+                request['text'], request.get('xml', False),
+                request.get('selector', ':root'), request.get('options', {}))
+        except ServerError as error:
+            response['error'] = str(error)
+        except Exception as error:  # pylint: disable=broad-except
+            response['error'] = describe(error)
+        async with lock:
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    def clean(self, text: str, xml: bool = False, selector: str = ':root',
+              options: Optional[Dict[str, Any]] = None) -> asyncio.Future:
+        """Return a future of text cleaned up, batched with others."""
+        options = options or {}
+        if not isinstance(text, str):
+            raise TypeError("text must be a string")
+        unknown = set(options) - OPTIONS
+        if unknown:
+            raise ValueError("Unknown options: " + ', '.join(sorted(unknown)))
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        key = json.dumps(options, sort_keys=True)
+        pending = self._pending.setdefault(key, [])
+        pending.append(((bool(xml), selector, text), future))
+        self._pending_size[key] = self._pending_size.get(key, 0) + len(text)
+        if self._pending_size[key] >= self.batch_size:
+            self._flush(key, options)
+        elif len(pending) == 1:
+            loop.call_later(self.batch_delay, self._flush, key, options)
+        return future
+
+    def _flush(self, key: str, options: Dict[str, Any]) -> None:
+        """Send the requests waiting with options to the pool."""
+        batch = self._pending.pop(key, None)
+        self._pending_size.pop(key, None)
+        if not batch:
+            return
+        requests = [request for request, _future in batch]
+        futures = [future for _request, future in batch]
+
+        def failed(error):
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+
+        def done(work):
+            if work.exception() is not None:
+                failed(work.exception())
+                return
+            for future, (result, error) in zip(futures, work.result()):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(ServerError(error))
+                else:
+                    future.set_result(result)
+
+        try:
+            work = asyncio.get_event_loop().run_in_executor(
+                self._executor, clean_batch, requests, options)
+        except Exception as error:  # pylint: disable=broad-except
+            failed(error)
+            return
+        work.add_done_callback(done)
+
+
+def serve(path: str, **kwargs) -> None:
+    """Serve cleanup requests on the Unix socket at path until interrupted.
+    kwargs are passed to Server()"""
+    try:
+        asyncio.run(Server(path, **kwargs).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+def request(path: str, text: str, xml: bool = False, selector=':root',
+            **options) -> str:
+    """Return text cleaned up by the server listening on path. options are
+    passed to text_cleanup.raw.cleanup()"""
+    message = dict(id=0, text=text, xml=xml, selector=selector,
+                   options=options)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as fin:
+            response = json.loads(fin.readline())
+    if 'error' in response:
+        raise ServerError(response['error'])
+    return response['result']
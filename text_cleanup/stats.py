@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Optional counters and stage timers for cleanup runs.
+
+Instrumented code checks ACTIVE, which is None unless collect() is running,
+so there's next to no cost when statistics are off.
+"""
+
+import collections
+import contextlib
+import time
+
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from text_cleanup import symspell
+
+ACTIVE: Optional['Stats'] = None
+
+EDIT_NAMES = {
+    symspell.PREFERRED_SUBSTITUTION: 'substitution',
+    symspell.SUBSTITUTION: 'substitution',
+    symspell.DELETION: 'deletion',
+    symspell.INSERTION: 'insertion',
+}
+
+
+class Stats:
+    """Counters, plus seconds spent in each stage if timing is on."""
+
+    def __init__(self, timing: bool = False) -> None:
+        self.timing = timing
+        self.counts: 'collections.Counter[str]' = collections.Counter()
+        self.seconds: 'collections.Counter[str]' = collections.Counter()
+
+    def count(self, name: str, number: int = 1) -> None:
+        """Add number to the counter called name."""
+        self.counts[name] += number
+
+    def merge(self, other: Dict[str, Dict[str, Any]]) -> None:
+        """Add in the counters from another Stats.as_dict()."""
+        self.counts.update(other['counts'])
+        self.seconds.update(other.get('seconds', {}))
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Return the counters, and timings if on, as plain dicts."""
+        result: Dict[str, Dict[str, Any]] = {
+            'counts': dict(sorted(self.counts.items()))}
+        if self.timing:
+            result['seconds'] = dict(sorted(self.seconds.items()))
+        return result
+
+
+@contextlib.contextmanager
+def collect(timing: bool = False) -> Iterator[Stats]:
+    """Collect statistics from everything run in this process meanwhile."""
+    global ACTIVE  # pylint: disable=global-statement
+    previous = ACTIVE
+    ACTIVE = Stats(timing)
+    try:
+        yield ACTIVE
+    finally:
+        ACTIVE = previous
+
+
+@contextlib.contextmanager
+def timer(name: str) -> Iterator[None]:
+    """Add the time spent inside to the stage called name, if timing."""
+    if ACTIVE is None or not ACTIVE.timing:
+        yield
+        return
+    stats = ACTIVE
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.seconds[name] += time.perf_counter() - start
+
+
+def counted(name: str, items: Iterable[Any]) -> Iterator[Any]:
+    """Yield from items, counting them under name if collecting."""
+    stats = ACTIVE
+    if stats is None:
+        yield from items
+        return
+    for item in items:
+        stats.counts[name] += 1
+        yield item
+
+
+def collecting(func: Callable, args=(), kwargs=None,
+               timing: bool = False) -> Any:
+    """Return (func(*args, **kwargs), Stats.as_dict()) from collecting
+    while it runs. Use this to collect from pool workers."""
+    with collect(timing) as stats:
+        result = func(*args, **(kwargs or {}))
+    return result, stats.as_dict()
+
+
+def classify(given: str, guess: str, preferred: Dict[str, str]) -> str:
+    """Return the kinds of edit which turn given into guess, e.g. 'space' or
+    'deletion+substitution'."""
+    kinds = set()
+    if ' ' in guess and ' ' not in given:
+        kinds.add('space')
+        guess = guess.replace(' ', '')
+    if '-' in given and '-' not in guess:
+        kinds.add('unhyphenation')
+        given = given.replace('-', '')
+    if given != guess:
+        key = symspell.edit_key(given, guess, len(given) + len(guess),
+                                preferred)
+        if key is None:
+            kinds.add('other')
+        else:
+            kinds.update(EDIT_NAMES[edit[0]] for edit in key[1])
+    return '+'.join(sorted(kinds)) or 'none'
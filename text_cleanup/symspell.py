@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Deletion-neighbourhood index for fast dictionary lookups (SymSpell)."""
+
+import string
+
+from typing import Dict, List, Iterable, Iterator, Optional, Set, Tuple
+
+# An edit key orders corrections the same way the brute force search in
+# text_cleanup.raw.one_error generates them: (number of edits, sorted
+# per-edit keys). Lower keys are preferred.
+EditKey = Tuple[int, Tuple[Tuple[int, ...], ...]]
+
+PREFERRED_SUBSTITUTION, SUBSTITUTION, DELETION, INSERTION = range(4)
+
+
+def deletions(word: str, distance: int) -> Set[str]:
+    """Return every string made by deleting up to distance letters of word."""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i+1:] for w in frontier for i in range(len(w))}
+        result.update(frontier)
+    return result
+
+
+def edit_key(given: str, word: str, max_edits: int,
+             preferred: Dict[str, str],
+             substitution: bool = True,
+             insertion: bool = True,
+             deletion: bool = True) -> Optional[EditKey]:
+    """Return the EditKey turning given into word, or None if it takes more
+    than max_edits of the allowed edits."""
+    if abs(len(given) - len(word)) > max_edits:
+        return None
+    # Only the middle part differs, so keep the table tiny.
+    start = 0
+    while start < min(len(given), len(word)) and given[start] == word[start]:
+        start += 1
+    end = 0
+    while (end < min(len(given), len(word)) - start and
+           given[-1 - end] == word[-1 - end]):
+        end += 1
+    old = given[start:len(given) - end]
+    new = word[start:len(word) - end]
+    alphabet = string.ascii_lowercase
+
+    def substitute(i, j):
+        letter, newchar = old[i], new[j]
+        if letter == newchar:
+            return ()
+        group = preferred.get(letter, '')
+        if substitution and newchar in group:
+            return ((PREFERRED_SUBSTITUTION, start + i, group.index(newchar)),)
+        if substitution and newchar in alphabet:
+            return ((SUBSTITUTION, start + i, alphabet.index(newchar)),)
+        return None
+
+    def add(cell, key):
+        if cell is None or key is None:
+            return None
+        return cell[0] + len(key), tuple(sorted(cell[1] + key))
+
+    # table[i][j] is the best (edits, keys) turning old[:i] into new[:j]
+    table: List[List[Optional[EditKey]]] = [
+        [None] * (len(new) + 1) for _ in range(len(old) + 1)]
+    table[0][0] = (0, ())
+    for i in range(len(old) + 1):
+        for j in range(len(new) + 1):
+            options = []
+            if i and deletion:
+                options.append(add(table[i-1][j],
+                                   ((DELETION, start + i - 1),)))
+            if j and insertion and new[j-1] in alphabet:
+                options.append(add(table[i][j-1], (
+                    (INSERTION, start + i, alphabet.index(new[j-1])),)))
+            if i and j:
+                options.append(add(table[i-1][j-1], substitute(i-1, j-1)))
+            options = [o for o in options if o is not None]
+            if options:
+                table[i][j] = min(options)
+    result = table[-1][-1]
+    if result is None or result[0] > max_edits:
+        return None
+    return result
+
+
+class DeletionIndex:
+    """Map the deletion neighbourhoods of dictionary words back to the words.
+
+    Two words within N edits of each other always share a string reachable by
+    deleting at most N letters from each, so looking up the deletions of a
+    misspelling finds every candidate with a handful of hash probes. Keys are
+    lowercased and truncated to prefix_length letters to keep the index small;
+    use edit_key() to check the candidates.
+    """
+
+    def __init__(self, words: Iterable[str], max_distance: int = 2,
+                 prefix_length: int = 7) -> None:
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._words: Dict[str, List[str]] = {}
+        for word in words:
+            self._words.setdefault(self._key(word), []).append(word)
+        self._deletions: Dict[str, List[str]] = {}
+        for key in self._words:
+            for deleted in deletions(key, max_distance):
+                self._deletions.setdefault(deleted, []).append(key)
+
+    def _key(self, word: str) -> str:
+        return word.lower()[:self.prefix_length]
+
+    def candidates(self, word: str, distance: int) -> Iterator[str]:
+        """Yield words which may be within distance edits of word."""
+        distance = min(distance, self.max_distance)
+        seen: Set[str] = set()
+        for deleted in deletions(self._key(word), distance):
+            for key in self._deletions.get(deleted, ()):
+                if key not in seen:
+                    seen.add(key)
+                    for candidate in self._words[key]:
+                        if abs(len(candidate) - len(word)) <= distance:
+                            yield candidate
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Words a document uses which aren't in the dictionary, like names.
+
+A character's name can appear thousands of times in a novel, and every
+time it would be searched for a correction, and sometimes "corrected" to a
+common word. Unknown tokens which appear often, and nearly always spelled
+the same way, are promoted to a vocabulary for that document instead, and
+accepted as they are. An OCR error like 'tbe' is frequent too, but not
+consistent: 'the' is far more common and only an edit away.
+"""
+
+from typing import Callable, Dict, Mapping
+
+from text_cleanup import symspell
+
+
+def similar(token: str, other: str) -> bool:
+    """Return True if other is a different spelling of token at most one
+    edit away, ignoring case."""
+    token, other = token.lower(), other.lower()
+    return (token != other and
+            symspell.edit_key(token, other, 1, {}) is not None)
+
+
+def promote(counts: Mapping[str, int], rejected: Callable[[str], bool],
+            min_count: int = 3, min_share: float = 0.8,
+            min_length: int = 3) -> Dict[str, int]:
+    """Return the tokens to accept as they are, with their counts.
+
+    counts are of every token in the document. A token is promoted if it
+    isn't rejected, e.g. for being valid already, has a letter and
+    min_length characters, appears at least min_count times, and makes up
+    at least min_share of the appearances of it and the similar() tokens."""
+    candidates = [token for token, number in counts.items()
+                  if number >= min_count and len(token) >= min_length and
+                  any(map(str.isalpha, token)) and not rejected(token)]
+    if not candidates:
+        return {}
+    index = symspell.DeletionIndex(counts, max_distance=1)
+    promoted = {}
+    for token in candidates:
+        variants = sum(counts[other] for other in index.candidates(token, 1)
+                       if similar(token, other))
+        if counts[token] >= min_share * (counts[token] + variants):
+            promoted[token] = counts[token]
+    return promoted
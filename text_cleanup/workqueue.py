@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Share cleanup jobs between workers on any number of machines.
+
+The queue is a SQLite file, e.g. on shared storage. enqueue() splits each
+file into tasks: shards of plain text, whole XML documents or the content
+documents of an EPUB, and one last task to put the file back together once
+the rest are done. Workers claim a task at a time, holding a lease which
+they renew while they work. If a worker dies, its lease runs out and the
+task is claimed again, up to max_attempts times. Inputs and results are
+kept in the queue, so workers only need to see the files to write them
+out, and any confusion model to load, and the machines' clocks should
+roughly agree. The options of each job are kept as JSON.
+"""
+
+import contextlib
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import zipfile
+
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from text_cleanup import batch, confusion, epub, raw, XML
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT, '
+    'source TEXT, destination TEXT, selector TEXT, options TEXT)',
+    'CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, job INTEGER, '
+    'action TEXT, part INTEGER, name TEXT, input TEXT, output TEXT, '
+    'state TEXT, worker TEXT, lease REAL, attempts INTEGER, error TEXT)',
+    'CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id)',
+    'CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job, action, state)',
+)
+
+# Task actions
+CLEAN = 'clean'
+ASSEMBLE = 'assemble'
+
+# Task states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Task(NamedTuple):
+    """A claimed task, with what's needed to run it."""
+    id: int
+    action: str
+    job: int
+    kind: str
+    name: Optional[str]
+    text: Optional[str]
+    source: str
+    destination: str
+    selector: str
+    options: Dict[str, Any]
+
+
+def worker_name() -> str:
+    """Return a name for this process which is unique across machines."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def split_file(source: str, kind: str,
+               shard_size: int = 2**20) -> Iterator[Tuple[Optional[str], str]]:
+    """Yield (name, text) for each task cleaning source, which is kind as
+    for text_cleanup.batch.file_kind()."""
+    if kind == 'epub':
+        with zipfile.ZipFile(source) as zin:
+            for name in dict.fromkeys(epub.content_documents(zin)):
+                yield name, zin.read(name).decode('utf-8')
+    elif kind == 'xml':
+        with open(source, encoding='utf-8') as fin:
+            yield None, fin.read()
+    else:
+        with open(source, encoding='utf-8') as fin:
+            for shard in raw.split_chunks(fin, shard_size):
+                yield None, shard
+
+
+class WorkQueue:
+    """Durable queue of cleanup tasks in a SQLite file.
+
+    Several processes can use the same file at once. Leases are renewed from
+    another thread, so the connection is shared under a lock."""
+
+    def __init__(self, filename: str, lease_seconds: float = 60,
+                 max_attempts: int = 3) -> None:
+        self.filename = filename
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        # Not WAL, which doesn't work over network filesystems
+        self._db = sqlite3.connect(filename, timeout=60,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the statements inside as one transaction."""
+        with self._lock:
+            # Take the write lock up front, so that two workers can't both
+            # see the same task as free before either claims it.
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def enqueue(self, source: str, destination: str, selector=':root',
+                shard_size: int = 2**20,
+                confusion_model: Optional[str] = None, **kwargs) -> int:
+        """Add a job to write a cleaned up copy of source to destination, and
+        return the number of tasks it was split into. source is cleaned
+        according to its kind, as by text_cleanup.batch.clean_file(). kwargs
+        are passed to text_cleanup.raw.cleanup(), and must be JSON, so a
+        confusion model is given as confusion_model, the name of its file.
+        A vocabulary_min_count for plain text is counted over the whole
+        file now, rather than in each shard."""
+        kind = batch.file_kind(source) or 'raw'
+        parts = list(split_file(source, kind, shard_size))
+        if kind == 'raw':
+            raw.shared_vocabulary((text for _name, text in parts), kwargs)
+        if confusion_model is not None:
+            kwargs['confusion_model'] = os.path.abspath(confusion_model)
+        with self._transaction() as db:
+            job = db.execute(
+                'INSERT INTO jobs (kind, source, destination, selector, '
+                'options) VALUES (?, ?, ?, ?, ?)',
+                (kind, os.path.abspath(source),
+                 os.path.abspath(destination), selector,
+                 json.dumps(kwargs))).lastrowid
+            db.executemany(
+                'INSERT INTO tasks (job, action, part, name, input, '
+                'state, attempts) VALUES (?, ?, ?, ?, ?, ?, 0)',
+                [(job, CLEAN, part, name, text, PENDING)
+                 for part, (name, text) in enumerate(parts)] +
+                [(job, ASSEMBLE, len(parts), None, None, PENDING)])
+        return len(parts) + 1
+
+    def claim(self, worker: str) -> Optional[Task]:
+        """Lease the next task which is ready to worker and return it, or
+        None if there isn't one now."""
+        now = time.time()
+        with self._transaction() as db:
+            self._expire(now)
+            # A job is assembled only once all of its parts are clean
+            row = db.execute(
+                'SELECT t.id, t.action, t.job, j.kind, t.name, t.input, '
+                'j.source, j.destination, j.selector, j.options '
+                'FROM tasks t JOIN jobs j ON t.job = j.id '
+                'WHERE (t.state = ? OR (t.state = ? AND t.lease < ?)) '
+                'AND (t.action = ? OR NOT EXISTS (SELECT 1 FROM tasks o '
+                'WHERE o.job = t.job AND o.action = ? AND o.state != ?)) '
+                'ORDER BY t.id LIMIT 1',
+                (PENDING, RUNNING, now, CLEAN, CLEAN, DONE)).fetchone()
+            if row is not None:
+                db.execute(
+                    'UPDATE tasks SET state = ?, worker = ?, lease = ?, '
+                    'attempts = attempts + 1 WHERE id = ?',
+                    (RUNNING, worker, now + self.lease_seconds, row[0]))
+        if row is None:
+            return None
+        return Task(*row[:-1], options=json.loads(row[-1]))
+
+    def _expire(self, now: float) -> None:
+        """Fail the tasks whose leases ran out on their last attempt."""
+        expired = self._db.execute(
+            'SELECT id FROM tasks WHERE state = ? AND lease < ? AND '
+            'attempts >= ?', (RUNNING, now, self.max_attempts)).fetchall()
+        for (task,) in expired:
+            self._fail(task, "Lease expired")
+
+    def _fail(self, task: int, error: str) -> None:
+        """Mark task failed, along with the assembly of its job."""
+        self._db.execute(
+            'UPDATE tasks SET state = ?, error = ? WHERE id = ?',
+            (FAILED, error, task))
+        self._db.execute(
+            'UPDATE tasks SET state = ?, error = ? WHERE action = ? AND '
+            'state = ? AND job = (SELECT job FROM tasks WHERE id = ?)',
+            (FAILED, f"Task {task} failed", ASSEMBLE, PENDING, task))
+
+    def renew(self, task: Task, worker: str) -> bool:
+        """Extend worker's lease on task. Return False if it was lost."""
+        with self._lock:
+            cursor = self._db.execute(
+                'UPDATE tasks SET lease = ? WHERE id = ? AND state = ? AND '
+                'worker = ?',
+                (time.time() + self.lease_seconds, task.id, RUNNING, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, task: Task, worker: str,
+                 output: Optional[str] = None) -> bool:
+        """Record that worker did task, with its output. Once a job is
+        assembled, the texts kept for it are dropped. Return False if
+        worker's lease on task was lost, and nothing was recorded."""
+        with self._transaction() as db:
+            cursor = db.execute(
+                'UPDATE tasks SET state = ?, output = ?, input = NULL '
+                'WHERE id = ? AND state = ? AND worker = ?',
+                (DONE, output, task.id, RUNNING, worker))
+            if cursor.rowcount != 1:
+                return False
+            if task.action == ASSEMBLE:
+                db.execute(
+                    'UPDATE tasks SET output = NULL WHERE job = ?',
+                    (task.job,))
+        return True
+
+    def fail(self, task: Task, worker: str, error: str) -> bool:
+        """Record that task failed for worker with error. It is tried again
+        unless it has used up its attempts. Return False if worker's lease
+        on task was lost, and nothing was recorded."""
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT attempts FROM tasks WHERE id = ? AND state = ? AND '
+                'worker = ?', (task.id, RUNNING, worker)).fetchone()
+            if row is None:
+                return False
+            if row[0] >= self.max_attempts:
+                self._fail(task.id, error)
+            else:
+                db.execute(
+                    'UPDATE tasks SET state = ?, error = ? WHERE id = ?',
+                    (PENDING, error, task.id))
+        return True
+
+    def outputs(self, job: int) -> List[Tuple[Optional[str], str]]:
+        """Return (name, output) for each cleaned part of job, in order."""
+        with self._lock:
+            return self._db.execute(
+                'SELECT name, output FROM tasks WHERE job = ? AND action = ? '
+                'ORDER BY part', (job, CLEAN)).fetchall()
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of tasks in each state."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT state, count(*) FROM tasks GROUP BY state').fetchall()
+        return dict(rows)
+
+    def unfinished(self) -> int:
+        """Return the number of tasks still pending or running."""
+        counts = self.counts()
+        return counts.get(PENDING, 0) + counts.get(RUNNING, 0)
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+
+@functools.lru_cache(maxsize=None)
+def load_confusion(filename: str) -> confusion.ConfusionModel:
+    """Return the confusion model saved in filename, loading it only once."""
+    return confusion.ConfusionModel.load(filename)
+
+
+def clean_task(task: Task, **kwargs) -> str:
+    """Return the cleaned up text of a CLEAN task. kwargs are added to the
+    options of its job."""
+    options = dict(task.options, **kwargs)
+    if 'confusion_model' in options:
+        options['confusion'] = load_confusion(options.pop('confusion_model'))
+    if task.kind == 'epub':
+        return epub.clean_document(task.text, task.selector, **options)
+    if task.kind == 'xml':
+        return XML.clean_element(task.text, task.selector, **options)
+    return raw.cleanup(task.text, **options)
+
+
+def assemble(queue: WorkQueue, task: Task) -> None:
+    """Write the cleaned parts of the job of an ASSEMBLE task to its
+    destination."""
+    outputs = queue.outputs(task.job)
+    os.makedirs(os.path.dirname(task.destination), exist_ok=True)
+    # Another worker may be writing it too, if this one's lease ran out
+    tmpname = f'{task.destination}.{worker_name()}.tmp'
+    if task.kind == 'epub':
+        with zipfile.ZipFile(task.source) as zin, \
+                zipfile.ZipFile(tmpname, 'w') as zout:
+            epub.write_documents(zin, zout, dict(outputs))
+    else:
+        with open(tmpname, 'w', encoding='utf-8') as fout:
+            fout.writelines(output for _name, output in outputs)
+    os.replace(tmpname, task.destination)
+
+
+class _Heartbeat(threading.Thread):
+    """Renew the lease on a task until stopped."""
+
+    def __init__(self, queue: WorkQueue, task: Task, worker: str) -> None:
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.task = task
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(self.task, self.worker):
+                break
+
+
+def work(filename: str, worker: Optional[str] = None, wait: bool = False,
+         poll_seconds: float = 1, lease_seconds: float = 60,
+         max_attempts: int = 3, **kwargs) -> Dict[str, int]:
+    """Run tasks from the queue in filename until there are none ready, or
+    with wait, until every task is finished. Return how many tasks this
+    worker finished and failed. kwargs, such as a correction cache, are
+    added to the options of each job."""
+    worker = worker or worker_name()
+    queue = WorkQueue(filename, lease_seconds, max_attempts)
+    result = dict(done=0, failed=0)
+    try:
+        while True:
+            task = queue.claim(worker)
+            if task is None:
+                if not wait or not queue.unfinished():
+                    break
+                time.sleep(poll_seconds)
+                continue
+            heartbeat = _Heartbeat(queue, task, worker)
+            heartbeat.start()
+            try:
+                if task.action == ASSEMBLE:
+                    assemble(queue, task)
+                    output = None
+                else:
+                    output = clean_task(task, **kwargs)
+            except Exception:  # pylint: disable=broad-except
+                if queue.fail(task, worker, traceback.format_exc()):
+                    result['failed'] += 1
+                continue
+            finally:
+                heartbeat.stopped.set()
+                heartbeat.join()
+            if queue.complete(task, worker, output):
+                result['done'] += 1
+    finally:
+        queue.close()
+    return result